@@ -0,0 +1,399 @@
+import bisect
+import hashlib
+import string
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Weighted costs (stricter): substitutions/deletions penalized more than insertions.
+# They are 1.2 / 1.0 / 1.2 scaled by 5 to integers, so ties between alignments are
+# exact instead of depending on floating-point rounding.
+_COST_SUB, _COST_INS, _COST_DEL = 6, 5, 6
+_COST_SCALE = 5.0
+
+
+def normalize_text_for_compare(text: str) -> list:
+    """Lowercased, punctuation-free word tokens"""
+    text = text.lower()
+    text = text.translate(str.maketrans('', '', string.punctuation))
+    return [t for t in text.split() if t]
+
+
+def wer_alignment(ref_tokens, hyp_tokens):
+    """Weighted WER with substitution, insertion and deletion lists (reference implementation)"""
+    # Compute WER dynamic programming table and backtrack to get operations
+    n, m = len(ref_tokens), len(hyp_tokens)
+    dp = [[0] * (m + 1) for _ in range(n + 1)]
+    op = [[None] * (m + 1) for _ in range(n + 1)]
+    cost_sub, cost_ins, cost_del = _COST_SUB, _COST_INS, _COST_DEL
+    for i in range(1, n + 1):
+        dp[i][0] = i * cost_del
+        op[i][0] = 'D'
+    for j in range(1, m + 1):
+        dp[0][j] = j * cost_ins
+        op[0][j] = 'I'
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            if ref_tokens[i - 1] == hyp_tokens[j - 1]:
+                dp[i][j] = dp[i - 1][j - 1]
+                op[i][j] = 'E'  # equal
+            else:
+                # substitution, insertion, deletion
+                choices = (
+                    (dp[i - 1][j - 1] + cost_sub, 'S'),
+                    (dp[i][j - 1] + cost_ins, 'I'),
+                    (dp[i - 1][j] + cost_del, 'D'),
+                )
+                dp[i][j], op[i][j] = min(choices, key=lambda x: x[0])
+    # Backtrack
+    i, j = n, m
+    edits = []  # list of tuples (op, ref_token or None, hyp_token or None)
+    while i > 0 or j > 0:
+        cur_op = op[i][j]
+        if cur_op == 'E':
+            edits.append(('E', ref_tokens[i - 1], hyp_tokens[j - 1]))
+            i -= 1
+            j -= 1
+        elif cur_op == 'S':
+            edits.append(('S', ref_tokens[i - 1], hyp_tokens[j - 1]))
+            i -= 1
+            j -= 1
+        elif cur_op == 'I':
+            edits.append(('I', None, hyp_tokens[j - 1]))
+            j -= 1
+        elif cur_op == 'D':
+            edits.append(('D', ref_tokens[i - 1], None))
+            i -= 1
+        else:
+            break
+    edits.reverse()
+    subs = [(r, h) for t, r, h in edits if t == 'S']
+    ins = [h for t, r, h in edits if t == 'I']
+    dels = [r for t, r, h in edits if t == 'D']
+    wer = dp[n][m] / _COST_SCALE / max(1, float(n))
+    return wer, subs, ins, dels
+
+
+_OP_E, _OP_S, _OP_I, _OP_D = 0, 1, 2, 3
+_OP_NAMES = ('E', 'S', 'I', 'D')
+_OP_COSTS = {'E': 0, 'S': _COST_SUB, 'I': _COST_INS, 'D': _COST_DEL}
+
+# Hypotheses whose table with the reference exceeds this many cells use anchored alignment
+ANCHORED_ALIGNMENT_CELLS = 1000000
+# Batched alignment splits a batch so that each op table stays under this many bytes
+MAX_BATCH_TABLE_BYTES = 64 * 1024 ** 2
+# Gaps between anchors larger than this many cells are aligned in linear space (Hirschberg)
+MAX_GAP_CELLS = 250000
+ANCHOR_NGRAM = 4
+
+
+def _dp_row(prev, i, equal, cols):
+    """Row i of the weighted edit-distance DP for a batch; returns (row, ops)
+
+    prev is row i - 1 with shape (batch, width) and equal marks the cells whose
+    reference and hypothesis tokens match (column 0 must be False).
+    """
+    big = (len(cols) + i + 2) * max(_COST_SUB, _COST_INS, _COST_DEL) * 2
+    diag = np.empty_like(prev)
+    diag[:, 1:] = prev[:, :-1]
+    diag[:, 0] = 0
+    sub = diag + _COST_SUB
+    up = prev + _COST_DEL
+    # Best of the moves that do not depend on this row; exact matches are forced to E
+    vertical = np.where(equal, diag, np.minimum(sub, up))
+    vertical[:, 0] = i * _COST_DEL
+    forced = equal.copy()
+    forced[:, 0] = True
+
+    # dp[j] = min(vertical[j], dp[j-1] + ins), restarting at forced cells: a segmented
+    # running minimum, with segments separated by large offsets
+    segment = np.cumsum(forced, axis=1)
+    shifted = vertical - cols * _COST_INS - segment * big
+    row = np.minimum.accumulate(shifted, axis=1) + cols * _COST_INS + segment * big
+
+    # Recover the op with the reference tie-break order: S, then I, then D
+    chain = np.empty_like(row)
+    chain[:, 1:] = row[:, :-1] + _COST_INS
+    chain[:, 0] = np.iinfo(np.int64).max // 2
+    op = np.where(sub == row, _OP_S, np.where(chain == row, _OP_I, _OP_D)).astype(np.int8)
+    op[equal] = _OP_E
+    op[:, 0] = _OP_D
+    return row, op
+
+
+def _first_row(batch, width):
+    cols = np.arange(width, dtype=np.int64)
+    return cols, np.broadcast_to(cols * _COST_INS, (batch, width)).copy()
+
+
+def _split_column(ref_ids, hyp_ids, mid):
+    """Column where the full-table traceback path leaves row mid towards row mid - 1
+
+    Runs the forward DP over every row and, from row mid on, carries for each cell the
+    column at which its traceback (same op tie-break as the full table) leaves row mid.
+    Splitting there keeps the halves on the same path the full table would trace.
+    """
+    padded = np.concatenate([[-2], hyp_ids])[None, :]
+    cols, row = _first_row(1, padded.shape[1])
+    cross = None
+    for i, ref_id in enumerate(ref_ids, 1):
+        row, op = _dp_row(row, i, padded == ref_id, cols)
+        if i < mid:
+            continue
+        op = op[0]
+        if i == mid:
+            source = cols
+        else:
+            # E and S come from the diagonal, D from above (column 0 is always D)
+            diagonal = np.concatenate([cross[:1], cross[:-1]])
+            source = np.where(op == _OP_D, cross, diagonal)
+        # I comes from the left: take the value of the nearest non-I cell to the left
+        origin = np.where(op != _OP_I, cols, 0)
+        np.maximum.accumulate(origin, out=origin)
+        cross = source[origin]
+    return int(cross[-1])
+
+
+def _backtrack(ops, ref_tokens, hyp_tokens, n, m):
+    """Edit list (op, ref token, hyp token) from an op table, in reading order"""
+    i, j = n, m
+    edits = []
+    while i > 0 or j > 0:
+        cur_op = ops[i, j]
+        if cur_op == _OP_E or cur_op == _OP_S:
+            edits.append((_OP_NAMES[cur_op], ref_tokens[i - 1], hyp_tokens[j - 1]))
+            i -= 1
+            j -= 1
+        elif cur_op == _OP_I:
+            edits.append(('I', None, hyp_tokens[j - 1]))
+            j -= 1
+        elif cur_op == _OP_D:
+            edits.append(('D', ref_tokens[i - 1], None))
+            i -= 1
+        else:
+            break
+    edits.reverse()
+    return edits
+
+
+def _full_edits(ref_ids, hyp_ids, ref_tokens, hyp_tokens):
+    """Edit list from the full op table (n x m int8) for one hypothesis"""
+    n, m = len(ref_ids), len(hyp_ids)
+    padded = np.concatenate([[-2], hyp_ids])[None, :]
+    cols, row = _first_row(1, m + 1)
+    ops = np.empty((n + 1, m + 1), dtype=np.int8)
+    ops[0] = _OP_I
+    for i, ref_id in enumerate(ref_ids, 1):
+        row, op = _dp_row(row, i, padded == ref_id, cols)
+        ops[i] = op[0]
+    return _backtrack(ops, ref_tokens, hyp_tokens, n, m)
+
+
+def _hirschberg_edits(ref_ids, hyp_ids, ref_tokens, hyp_tokens, max_cells):
+    """Edit list in linear space, identical to the full table's
+
+    The reference is split in half at the column where the full traceback crosses the
+    middle row. Both halves then lie on that path, and their own tables pick the same
+    ops along it (any other move costs at least as much in a sub-table as in the full one).
+    """
+    n, m = len(ref_ids), len(hyp_ids)
+    if n <= 1 or m == 0 or (n + 1) * (m + 1) <= max_cells:
+        return _full_edits(ref_ids, hyp_ids, ref_tokens, hyp_tokens)
+    mid = n // 2
+    split = _split_column(ref_ids, hyp_ids, mid)
+    return (
+        _hirschberg_edits(ref_ids[:mid], hyp_ids[:split], ref_tokens[:mid], hyp_tokens[:split], max_cells) +
+        _hirschberg_edits(ref_ids[mid:], hyp_ids[split:], ref_tokens[mid:], hyp_tokens[split:], max_cells)
+    )
+
+
+def _summarize(edits, n, cost=None):
+    """(wer, substitutions, insertions, deletions) from an edit list"""
+    if cost is None:
+        cost = sum(_OP_COSTS[t] for t, r, h in edits)
+    subs = [(r, h) for t, r, h in edits if t == 'S']
+    ins = [h for t, r, h in edits if t == 'I']
+    dels = [r for t, r, h in edits if t == 'D']
+    return float(cost) / _COST_SCALE / max(1, float(n)), subs, ins, dels
+
+
+def _ngram_positions(ids, ngram):
+    """Start position of every n-gram that occurs exactly once, keyed by the n-gram"""
+    positions = {}
+    repeated = set()
+    for start in range(len(ids) - ngram + 1):
+        key = tuple(ids[start:start + ngram])
+        if key in positions:
+            repeated.add(key)
+        else:
+            positions[key] = start
+    for key in repeated:
+        del positions[key]
+    return positions
+
+
+def find_anchors(ref_positions, hyp_ids, ngram):
+    """Non-overlapping (ref_start, hyp_start) pairs of n-grams unique in both texts, in order
+
+    Keeps the longest chain of matches that is increasing in both texts
+    (longest increasing subsequence, O(k log k)).
+    """
+    pairs = sorted(
+        (ref_positions[key], hyp_start)
+        for key, hyp_start in _ngram_positions(hyp_ids, ngram).items()
+        if key in ref_positions
+    )
+    if not pairs:
+        return []
+    # Patience sorting over hypothesis positions, with back-pointers to rebuild the chain
+    tails, tail_idx, parent = [], [], [-1] * len(pairs)
+    for idx, (_, hyp_start) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, hyp_start)
+        if pos > 0:
+            parent[idx] = tail_idx[pos - 1]
+        if pos == len(tails):
+            tails.append(hyp_start)
+            tail_idx.append(idx)
+        else:
+            tails[pos] = hyp_start
+            tail_idx[pos] = idx
+    chain = []
+    idx = tail_idx[-1]
+    while idx != -1:
+        chain.append(pairs[idx])
+        idx = parent[idx]
+    chain.reverse()
+
+    anchors = []
+    for ref_start, hyp_start in chain:
+        if not anchors or (ref_start >= anchors[-1][0] + ngram and hyp_start >= anchors[-1][1] + ngram):
+            anchors.append((ref_start, hyp_start))
+    return anchors
+
+
+class PreparedReference:
+    """A reference text tokenized once and interned to integer ids for repeated alignment"""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = normalize_text_for_compare(text)
+        self.vocab = {}
+        for token in self.tokens:
+            self.vocab.setdefault(token, len(self.vocab))
+        self.ids = np.array([self.vocab[token] for token in self.tokens], dtype=np.int32)
+        self._ngram_positions = None
+
+    def encode(self, tokens):
+        """Token ids against this reference's vocabulary; unknown words map to -1"""
+        return np.array([self.vocab.get(token, -1) for token in tokens], dtype=np.int32)
+
+    def align(self, hypothesis_text):
+        """(wer, substitutions, insertions, deletions) for one hypothesis"""
+        return self.align_many([hypothesis_text])[0]
+
+    def align_many(self, hypothesis_texts):
+        """Align a batch of hypotheses against this reference, as align() would one by one
+
+        Hypotheses too long for a full table use anchored alignment; the rest are sorted
+        by length and aligned in vectorized batches whose op tables fit MAX_BATCH_TABLE_BYTES.
+        """
+        hyp_tokens = [
+            text if isinstance(text, list) else normalize_text_for_compare(text)
+            for text in hypothesis_texts
+        ]
+        n = len(self.tokens)
+        results = [None] * len(hyp_tokens)
+        batched = []
+        for b, tokens in enumerate(hyp_tokens):
+            if (n + 1) * (len(tokens) + 1) > ANCHORED_ALIGNMENT_CELLS:
+                results[b] = self.align_anchored(tokens)
+            else:
+                batched.append(b)
+
+        # Similar lengths share a batch, so little of each table is padding
+        batched.sort(key=lambda b: len(hyp_tokens[b]))
+        start = 0
+        while start < len(batched):
+            end = start + 1
+            while (end < len(batched) and
+                   (n + 1) * (end + 1 - start) * (len(hyp_tokens[batched[end]]) + 1) <= MAX_BATCH_TABLE_BYTES):
+                end += 1
+            chunk = batched[start:end]
+            for b, result in zip(chunk, self._align_batch([hyp_tokens[b] for b in chunk])):
+                results[b] = result
+            start = end
+        return results
+
+    def _align_batch(self, hyp_tokens):
+        """One vectorized DP over a batch of tokenized hypotheses; the op table is (n + 1) x batch x width"""
+        n = len(self.tokens)
+        width = max(len(tokens) for tokens in hyp_tokens) + 1
+        batch = len(hyp_tokens)
+
+        # Pad hypotheses with -2 so padding never matches; cells left of each hypothesis' end
+        # do not depend on the padding, so one table serves every length
+        hyp_ids = np.full((batch, width), -2, dtype=np.int32)
+        for b, tokens in enumerate(hyp_tokens):
+            hyp_ids[b, 1:len(tokens) + 1] = self.encode(tokens)
+
+        cols, row = _first_row(batch, width)
+        ops = np.empty((n + 1, batch, width), dtype=np.int8)
+        ops[0] = _OP_I
+        for i in range(1, n + 1):
+            row, ops[i] = _dp_row(row, i, hyp_ids == self.ids[i - 1], cols)
+
+        results = []
+        for b, tokens in enumerate(hyp_tokens):
+            m = len(tokens)
+            edits = _backtrack(ops[:, b, :], self.tokens, tokens, n, m)
+            results.append(_summarize(edits, n, row[b, m]))
+        return results
+
+    def align_anchored(self, hypothesis, ngram=ANCHOR_NGRAM, max_gap_cells=MAX_GAP_CELLS):
+        """Align a long hypothesis in roughly linear memory
+
+        Unique n-grams shared by both texts become anchors; only the gaps between
+        anchors are aligned, with Hirschberg's linear-space split for large gaps.
+        When the anchors lie on the optimal path the cost matches the full DP.
+        """
+        hyp_tokens = hypothesis if isinstance(hypothesis, list) else normalize_text_for_compare(hypothesis)
+        hyp_ids = self.encode(hyp_tokens)
+        if self._ngram_positions is None or self._ngram_positions[0] != ngram:
+            self._ngram_positions = (ngram, _ngram_positions(self.ids, ngram))
+        anchors = find_anchors(self._ngram_positions[1], hyp_ids, ngram)
+
+        edits = []
+        ref_pos = hyp_pos = 0
+        for ref_start, hyp_start in anchors + [(len(self.ids), len(hyp_ids))]:
+            edits.extend(_hirschberg_edits(
+                self.ids[ref_pos:ref_start], hyp_ids[hyp_pos:hyp_start],
+                self.tokens[ref_pos:ref_start], hyp_tokens[hyp_pos:hyp_start], max_gap_cells
+            ))
+            if ref_start < len(self.ids):
+                edits.extend(
+                    ('E', self.tokens[ref_start + k], hyp_tokens[hyp_start + k]) for k in range(ngram)
+                )
+            ref_pos, hyp_pos = ref_start + ngram, hyp_start + ngram
+        return _summarize(edits, len(self.ids))
+
+
+_REFERENCE_CACHE_SIZE = 256
+_reference_cache = OrderedDict()
+_reference_cache_lock = threading.Lock()
+
+
+def prepare_reference(text):
+    """Cached PreparedReference for a reference text, keyed by the text's hash"""
+    key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    with _reference_cache_lock:
+        prepared = _reference_cache.get(key)
+        if prepared is not None:
+            _reference_cache.move_to_end(key)
+            return prepared
+    prepared = PreparedReference(text)
+    with _reference_cache_lock:
+        _reference_cache[key] = prepared
+        if len(_reference_cache) > _REFERENCE_CACHE_SIZE:
+            _reference_cache.popitem(last=False)
+    return prepared
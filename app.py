@@ -1,8 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from werkzeug.utils import secure_filename
 import os
+import math
 import tempfile
-from audio_analysis import analyze_audio, analyze_audio_with_text
+from audio_analysis import (
+    analyze_audio, analyze_audio_with_text, analyze_audio_by_speaker, prescreen_audio, MODEL_MANAGER,
+    _media_duration
+)
+from audio_probe import probe_audio, evaluate_admission
+from stage_runner import Deadline, StageTimeout, run_stage, is_server_process
+from response_format import (
+    message_table, negotiate_format, encode_body, compress_response as compress_for_client, msgpack
+)
+from profiling import (
+    PROFILING_CONFIG, profiled_request, stage as profile_stage, recent_profiles, get_profile, debug_authorized
+)
+from warmup import start_warmup, readiness
+from scheduler import SCHEDULER, SCHEDULER_CONFIG, estimate_request_cost, tenant_for, warn_on_untrusted_tenants
 
 app = Flask(__name__)
 
@@ -11,6 +25,75 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'm4a', 'flac', 'ogg'}
 
+def check_admission(audio_path):
+    """Probe the upload's headers and return (decision, error response or None)"""
+    probe = probe_audio(audio_path)
+    # Containers the header probe does not parse (e.g. m4a) get their duration from ffprobe
+    duration = _media_duration(audio_path) if probe is None else None
+    decision = evaluate_admission(probe, MODEL_MANAGER.device, duration)
+    print(f"Admission: {decision['action']} ({decision['reason']}), "
+          f"estimated cost {decision['estimated_cost_sec']}s")
+    if decision['action'] == 'reject':
+        return decision, (jsonify({
+            "error": "Audio too long",
+            "message": decision['reason'],
+            "details": decision
+        }), 413)
+    return decision, None
+
+def tenant_key():
+    """Tenant a request is scheduled under: the tenant header from a trusted proxy, else the client address"""
+    return tenant_for(request.headers, request.remote_addr)
+
+def check_rate_limit(tenant, cost):
+    """429 response when the tenant has used up its rate limit, else None"""
+    retry_after = SCHEDULER.check_rate(tenant, cost)
+    if retry_after <= 0:
+        return None
+    response = jsonify({
+        "error": "Rate limit exceeded",
+        "message": f"Tenant '{tenant}' has used its analysis budget; retry in {math.ceil(retry_after)}s",
+        "retry_after_sec": round(retry_after, 1)
+    })
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response, 429
+
+def timeout_response(timeout):
+    """504 for uploads that could not even be decoded before the deadline"""
+    return jsonify({
+        "error": "Analysis timed out",
+        "message": str(timeout),
+        "stage": timeout.stage
+    }), 504
+
+def report_response(result):
+    """Encode a report as JSON, compact JSON or MessagePack, per the Accept header"""
+    query_format = request.args.get('format')
+    if query_format == 'msgpack' and msgpack is None:
+        return jsonify({
+            "error": "Format not available",
+            "message": "MessagePack responses need the msgpack package on the server"
+        }), 406
+    fmt = negotiate_format(request.accept_mimetypes, query_format)
+    if fmt == 'json':
+        response = jsonify(result)
+    else:
+        body, mimetype = encode_body(result, fmt)
+        response = Response(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip or zstd large responses for clients that accept it"""
+    return compress_for_client(response, request.accept_encodings)
+
+def with_profile_header(response, profile):
+    """Tell the client which buffered profile belongs to its request"""
+    if profile is not None:
+        response.headers['X-Profile-Id'] = str(profile.id)
+    return response
+
 def allowed_file(filename):
     """Check if the uploaded file has an allowed extension"""
     return '.' in filename and \
@@ -47,6 +130,8 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "message": "Audio Analysis API is running",
+        "ready": readiness()["status"] == "ready",
+        "scheduler": SCHEDULER.stats(),
         "gpu_available": gpu_available,
         "platform": "Render",
         "dependencies": {
@@ -56,6 +141,18 @@ def health_check():
         }
     })
 
+@app.route('/ready', methods=['GET'])
+def ready_check():
+    """Readiness check: 200 only once the boot warm-up has finished"""
+    state = readiness()
+    if state["status"] != "ready":
+        return jsonify({
+            "error": "Not ready",
+            "message": f"Warm-up {state['status']}" + (f": {state['error']}" if state["error"] else ""),
+            "warmup": state
+        }), 503
+    return jsonify({"status": "ready", "warmup": state})
+
 @app.route('/speaking', methods=['POST'])
 def speaking_analysis():
     """
@@ -63,6 +160,7 @@ def speaking_analysis():
     
     Expected request:
     - audio file in multipart/form-data
+    - optional per_speaker field ("true") for per-speaker reports of multi-party recordings
     
     Returns:
     - JSON with fluency, grammar, and professionalism analysis
@@ -104,11 +202,49 @@ def speaking_analysis():
         audio_file.save(temp_path)
         
         try:
-            print("Starting audio analysis...")
-            # Analyze audio only (speaking assessment)
-            result = analyze_audio(temp_path)
-            print("Audio analysis completed successfully")
-            return jsonify(result)
+            with profiled_request('/speaking', request.headers) as profile:
+                # One deadline for the whole request; decoding stages run in killable workers
+                deadline = Deadline()
+                
+                # Reject over-long uploads from their headers, before decoding anything
+                with profile_stage("admission"):
+                    admission, error_response = check_admission(temp_path)
+                if error_response:
+                    return error_response
+                
+                # Per-tenant rate limit, then wait for a slot in weighted fair-queue order
+                tenant = tenant_key()
+                cost = estimate_request_cost('/speaking', admission, MODEL_MANAGER.device)
+                rate_limited = check_rate_limit(tenant, cost)
+                if rate_limited:
+                    return rate_limited
+                with profile_stage("queue"):
+                    SCHEDULER.acquire(tenant, cost, deadline.remaining())
+                try:
+                    # Reject silent, clipped, too-short or non-speech uploads before any model work
+                    with profile_stage("prescreen"):
+                        rejection = run_stage("prescreen", prescreen_audio, temp_path, deadline=deadline)
+                    if rejection:
+                        print(f"Audio rejected by pre-screen: {rejection['code']}")
+                        return jsonify(rejection), 422
+                    
+                    print("Starting audio analysis...")
+                    if request.form.get('per_speaker', '').lower() in ('1', 'true', 'yes'):
+                        # Multi-party recording: diarize and report each speaker separately
+                        result = analyze_audio_by_speaker(
+                            temp_path, long_file=admission['route'] == 'long', deadline=deadline
+                        )
+                    else:
+                        # Analyze audio only (speaking assessment)
+                        result = analyze_audio(temp_path, long_file=admission['route'] == 'long', deadline=deadline)
+                finally:
+                    SCHEDULER.release()
+                print("Audio analysis completed successfully")
+                return with_profile_header(report_response(result), profile)
+            
+        except StageTimeout as timeout:
+            print(f"Audio analysis timed out: {timeout}")
+            return timeout_response(timeout)
             
         except Exception as analysis_error:
             print(f"Audio analysis failed: {str(analysis_error)}")
@@ -182,9 +318,41 @@ def listening_analysis():
         audio_file.save(temp_path)
         
         try:
-            # Analyze audio with custom text (listening assessment)
-            result = analyze_audio_with_text(temp_path, custom_text)
-            return jsonify(result)
+            with profiled_request('/listening', request.headers) as profile:
+                # One deadline for the whole request; decoding stages run in killable workers
+                deadline = Deadline()
+                
+                # Reject over-long uploads from their headers, before decoding anything
+                with profile_stage("admission"):
+                    admission, error_response = check_admission(temp_path)
+                if error_response:
+                    return error_response
+                
+                # Per-tenant rate limit, then wait for a slot in weighted fair-queue order
+                tenant = tenant_key()
+                cost = estimate_request_cost('/listening', admission, MODEL_MANAGER.device)
+                rate_limited = check_rate_limit(tenant, cost)
+                if rate_limited:
+                    return rate_limited
+                with profile_stage("queue"):
+                    SCHEDULER.acquire(tenant, cost, deadline.remaining())
+                try:
+                    # Reject silent, clipped, too-short or non-speech uploads before any model work
+                    with profile_stage("prescreen"):
+                        rejection = run_stage("prescreen", prescreen_audio, temp_path, deadline=deadline)
+                    if rejection:
+                        return jsonify(rejection), 422
+                    
+                    # Analyze audio with custom text (listening assessment)
+                    result = analyze_audio_with_text(
+                        temp_path, custom_text, long_file=admission['route'] == 'long', deadline=deadline
+                    )
+                finally:
+                    SCHEDULER.release()
+                return with_profile_header(report_response(result), profile)
+            
+        except StageTimeout as timeout:
+            return timeout_response(timeout)
             
         finally:
             # Clean up temporary file
@@ -225,6 +393,11 @@ def analyze_text_only():
                 "message": "Please provide non-empty text"
             }), 400
         
+        # Text analysis runs in-process and skips the queue, but still counts against the rate limit
+        rate_limited = check_rate_limit(tenant_key(), estimate_request_cost('/analyze-text'))
+        if rate_limited:
+            return rate_limited
+        
         # Import the analysis functions
         from audio_analysis import analyze_grammar_advanced, analyze_professionalism, calculate_overall_score
         
@@ -251,7 +424,7 @@ def analyze_text_only():
             }
         }
         
-        return jsonify(result)
+        return report_response(result)
         
     except Exception as e:
         return jsonify({
@@ -259,6 +432,48 @@ def analyze_text_only():
             "message": str(e)
         }), 500
 
+@app.route('/messages', methods=['GET'])
+def messages():
+    """Message table for compact responses: a message's code is its index"""
+    table = message_table()
+    response = jsonify(table)
+    response.set_etag(table["version"])
+    return response.make_conditional(request)
+
+@app.route('/debug/profiles', methods=['GET'])
+@app.route('/debug/profiles/<int:profile_id>', methods=['GET'])
+def debug_profiles(profile_id=None):
+    """
+    Recently profiled requests
+    
+    Without an id, lists the buffered profiles. With an id, returns its stage
+    timings, or its sampled stacks in collapsed (flamegraph) format with
+    ?format=collapsed.
+    """
+    if not PROFILING_CONFIG["debug_token"]:
+        return jsonify({
+            "error": "Not found",
+            "message": "Profiling endpoints are disabled; set PROFILE_DEBUG_TOKEN to enable them"
+        }), 404
+    if not debug_authorized(request.headers):
+        return jsonify({
+            "error": "Forbidden",
+            "message": "A valid X-Debug-Token header is required"
+        }), 403
+    
+    if profile_id is None:
+        return jsonify({"profiles": recent_profiles()})
+    
+    profile = get_profile(profile_id)
+    if profile is None:
+        return jsonify({
+            "error": "Profile not found",
+            "message": f"Profile {profile_id} is not in the buffer of the last {PROFILING_CONFIG['buffer_size']} profiles"
+        }), 404
+    if request.args.get('format') == 'collapsed':
+        return Response(profile.collapsed() + "\n", mimetype='text/plain')
+    return jsonify(profile.summary())
+
 @app.route('/', methods=['GET'])
 def index():
     """API documentation endpoint"""
@@ -269,15 +484,21 @@ def index():
         "endpoints": {
             "GET /": "API documentation (this endpoint)",
             "GET /health": "Health check with dependency status",
+            "GET /ready": "Readiness check; 503 until the boot warm-up has loaded the models",
             "GET /test": "Simple test endpoint",
             "POST /speaking": "Speaking analysis - audio only (fluency, grammar, professionalism)",
             "POST /listening": "Listening analysis - audio + text (similarity, fluency, grammar)",
-            "POST /analyze-text": "Text analysis only (grammar and professionalism)"
+            "POST /analyze-text": "Text analysis only (grammar and professionalism)",
+            "GET /messages": "Message table for compact responses (codes are list indexes)",
+            "GET /debug/profiles": "Recently profiled requests; /debug/profiles/<id>?format=collapsed for flamegraph stacks"
         },
         "usage": {
-            "/speaking": "Upload audio file using multipart/form-data with 'audio' field for speaking assessment.",
+            "/speaking": "Upload audio file using multipart/form-data with 'audio' field for speaking assessment. Add 'per_speaker=true' to score each speaker of a multi-party recording separately.",
             "/listening": "Upload audio file using multipart/form-data with 'audio' field and 'text' field for listening assessment.",
-            "/analyze-text": "Send JSON with 'text' field for grammar and professionalism analysis only."
+            "/analyze-text": "Send JSON with 'text' field for grammar and professionalism analysis only.",
+            "compact": "Send 'Accept: application/vnd.audio-analysis.compact+json' (or '+msgpack') for reports with message codes from GET /messages; large responses are gzip/zstd compressed per Accept-Encoding.",
+            "profiling": f"Send '{PROFILING_CONFIG['header']}: true' and the X-Debug-Token with /speaking or /listening to profile that request; the response carries its X-Profile-Id.",
+            "tenants": f"Requests are rate-limited and fair-queued per client address, or per '{SCHEDULER_CONFIG['tenant_header']}' when set by a trusted proxy; 429 responses carry Retry-After."
         },
         "supported_audio_formats": list(ALLOWED_EXTENSIONS)
     })
@@ -297,6 +518,12 @@ def test_endpoint():
             "message": str(e)
         }), 500
 
+# Load the models and warm the pipeline in the background; /ready gates traffic until done.
+# start_warmup() does nothing in spawned worker processes, which re-import this module.
+start_warmup()
+if is_server_process():
+    warn_on_untrusted_tenants()
+
 if __name__ == '__main__':
     # Use port from environment variable (Render uses 10000)
     port = int(os.environ.get('PORT', 10000))
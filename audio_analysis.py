@@ -2,6 +2,7 @@ import whisper
 import numpy as np
 # import language_tool_python  # Removed - requires Java
 from pydub import AudioSegment
+from pydub.utils import mediainfo
 import os
 import time
 import json
@@ -9,7 +10,23 @@ import torch
 from textblob import TextBlob
 import re
 import string
-import gc
+import bisect
+import wave
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from model_manager import ModelManager, SharedBudget
+from shared_weights import SHARED_WEIGHTS_CONFIG, load_shared_model
+from audio_probe import probe_audio
+from diarization import diarize
+from features import SpectralFeatures
+from thresholds import energy_thresholds
+from alignment import prepare_reference
+from scoring_rules import get_scorer
+from profiling import stage as profile_stage
+from stage_runner import STAGE_CONFIG, Deadline, StageTimeout, configure_workers, is_server_process, run_stage
+
+GPU_MEMORY_FRACTION = float(os.environ.get("GPU_MEMORY_FRACTION", "0.8"))
 
 # GPU memory management for Hugging Face Spaces
 if torch.cuda.is_available():
@@ -18,109 +35,276 @@ if torch.cuda.is_available():
     print(f"GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.1f} GB")
     
     # Set memory fraction to avoid OOM errors
-    torch.cuda.set_per_process_memory_fraction(0.8)
+    torch.cuda.set_per_process_memory_fraction(GPU_MEMORY_FRACTION)
 else:
     print("CUDA is NOT available. Running on CPU.")
 
-def transcribe_audio(audio_path):
-    """Transcribe audio using whisper (optimized for HF Spaces)"""
+# Tiered transcription: the base model transcribes everything, and only segments it is
+# unsure about are re-transcribed by the upgrade model. Leave WHISPER_UPGRADE_MODEL empty
+# to disable tiering; the thresholds default to whisper's own fallback thresholds.
+TRANSCRIPTION_CONFIG = {
+    "base_model": os.environ.get("WHISPER_BASE_MODEL", "tiny"),
+    "upgrade_model": os.environ.get("WHISPER_UPGRADE_MODEL", ""),
+    "min_avg_logprob": float(os.environ.get("WHISPER_MIN_AVG_LOGPROB", "-1.0")),
+    "max_no_speech_prob": float(os.environ.get("WHISPER_MAX_NO_SPEECH_PROB", "0.6")),
+    # "stub" replaces whisper with a deterministic transcript for load testing
+    "backend": os.environ.get("TRANSCRIBER_BACKEND", "whisper"),
+    "stub_latency_sec": float(os.environ.get("STUB_TRANSCRIBER_LATENCY_MS", "200")) / 1000.0,
+    "stub_realtime_factor": float(os.environ.get("STUB_TRANSCRIBER_RTF", "0")),
+}
+
+# Resident models shared by all requests; GPU work is admitted up to the memory budget.
+# The base model is pinned; with a weights budget the upgrade model can be evicted.
+# With WHISPER_SHARED_WEIGHTS=1, CPU weights are memory-mapped from one file shared by all worker processes
+MODEL_MANAGER = ModelManager(
+    fp16=os.environ.get("WHISPER_FP16", "1") == "1",
+    memory_fraction=GPU_MEMORY_FRACTION,
+    admit_timeout=float(os.environ.get("GPU_ADMIT_TIMEOUT", "30")),
+    loader=load_shared_model if SHARED_WEIGHTS_CONFIG["enabled"] else None,
+    weights_budget=int(float(os.environ.get("WHISPER_WEIGHTS_BUDGET_MB", "0")) * 1024 ** 2) or None,
+    pinned={TRANSCRIPTION_CONFIG['base_model']},
+    max_instances=int(os.environ.get("WHISPER_MODEL_INSTANCES", "1")),
+)
+
+def _init_stage_worker(slot, budget):
+    """Stage worker initializer: join the shared device budget and load the pinned base model"""
+    MODEL_MANAGER.share_budget(budget, slot)
+    if TRANSCRIPTION_CONFIG['backend'] != "whisper":
+        return
     try:
-        # Use tiny model for faster inference and less memory usage
-        model = whisper.load_model("tiny")
-        
-        # Move model to GPU if available
-        if torch.cuda.is_available():
-            model = model.cuda()
-        
-        result = model.transcribe(audio_path)
-        
-        # Clean up GPU memory
-        if torch.cuda.is_available():
-            del model
-            torch.cuda.empty_cache()
-            gc.collect()
-        
+        MODEL_MANAGER.get_model(TRANSCRIPTION_CONFIG['base_model'])
+    except Exception as e:
+        # Decoding stages still work; transcription reports the error when it runs
+        print(f"Stage worker {slot} could not preload the base model: {e}")
+
+def load_models():
+    """Load the transcription models into this process, raising if one fails; returns the resident models"""
+    if TRANSCRIPTION_CONFIG['backend'] == "whisper":
+        for name in (TRANSCRIPTION_CONFIG['base_model'], TRANSCRIPTION_CONFIG['upgrade_model']):
+            if name:
+                MODEL_MANAGER.get_model(name)
+    return MODEL_MANAGER.resident()
+
+# Stage workers each keep their own resident models, so with stage isolation they admit
+# device work against one budget shared by all workers (instead of each assuming the
+# whole device), and a killed worker's share is released when it is replaced
+if STAGE_CONFIG["isolate"] and is_server_process():
+    STAGE_BUDGET = SharedBudget(STAGE_CONFIG["workers"])
+    configure_workers(_init_stage_worker, (STAGE_BUDGET,), on_worker_exit=STAGE_BUDGET.release_slot)
+
+# Words cycled through by the stub backend, about 2.5 per second of audio
+_STUB_PASSAGE = (
+    "Thank you for the question. In my last role I led a small team that rebuilt our "
+    "reporting pipeline. We planned the work in short iterations and I think the most "
+    "important thing was keeping everyone informed about progress and risks."
+).split()
+
+def _stub_transcribe(audio):
+    """Deterministic transcript whose length and latency follow the audio duration"""
+    if isinstance(audio, str):
+        duration = _media_duration(audio) or 0.0
+    else:
+        duration = len(audio) / float(whisper.audio.SAMPLE_RATE)
+    time.sleep(TRANSCRIPTION_CONFIG['stub_latency_sec'] + duration * TRANSCRIPTION_CONFIG['stub_realtime_factor'])
+    n_words = int(round(duration * 2.5))
+    return " ".join(_STUB_PASSAGE[i % len(_STUB_PASSAGE)] for i in range(n_words))
+
+def _select_upgrade_spans(segments, min_avg_logprob, max_no_speech_prob):
+    """Group consecutive low-confidence segments into [first, last] index spans"""
+    spans = []
+    for idx, seg in enumerate(segments):
+        unsure = (seg.get('avg_logprob', 0.0) < min_avg_logprob or
+                  seg.get('no_speech_prob', 0.0) > max_no_speech_prob)
+        if not unsure:
+            continue
+        if spans and spans[-1][1] == idx - 1:
+            spans[-1][1] = idx
+        else:
+            spans.append([idx, idx])
+    return spans
+
+def _transcribe_tiered(audio, device, fp16):
+    """Transcribe with the base model and re-run low-confidence spans on the upgrade model"""
+    if TRANSCRIPTION_CONFIG['backend'] == 'stub':
+        return _stub_transcribe(audio)
+    # Each decode checks out its own model instance; whisper models are not thread-safe
+    with MODEL_MANAGER.using(TRANSCRIPTION_CONFIG['base_model'], device) as model:
+        result = model.transcribe(audio, fp16=fp16)
+    upgrade_name = TRANSCRIPTION_CONFIG['upgrade_model']
+    segments = result.get('segments') or []
+    if not upgrade_name or not segments:
         return result['text']
+    
+    spans = _select_upgrade_spans(
+        segments,
+        TRANSCRIPTION_CONFIG['min_avg_logprob'],
+        TRANSCRIPTION_CONFIG['max_no_speech_prob'],
+    )
+    if not spans:
+        return result['text']
+    
+    print(f"Re-transcribing {len(spans)} low-confidence span(s) with '{upgrade_name}' model")
+    if isinstance(audio, str):
+        audio = whisper.load_audio(audio)
+    sample_rate = whisper.audio.SAMPLE_RATE
+    texts = [seg['text'] for seg in segments]
+    with MODEL_MANAGER.using(upgrade_name, device) as upgrade_model:
+        for first, last in spans:
+            clip = audio[int(segments[first]['start'] * sample_rate):int(segments[last]['end'] * sample_rate)]
+            if clip.size == 0:
+                continue
+            # Condition on the text before the span so wording stays consistent across the seam
+            prompt = "".join(texts[:first])[-200:] or None
+            upgraded = upgrade_model.transcribe(
+                clip, initial_prompt=prompt, language=result.get('language'), fp16=fp16
+            )
+            texts[first] = upgraded['text']
+            for idx in range(first + 1, last + 1):
+                texts[idx] = ""
+    return "".join(texts)
+
+# Long-file mode: recordings are cut at pauses into chunks no longer than whisper's 30s
+# window and transcribed in parallel by worker processes that each keep a model resident.
+# With overlap_sec, each chunk also starts that much before its cut (for hard cuts
+# through speech), and words repeated across the overlap are dropped when stitching.
+LONG_FILE_CONFIG = {
+    "chunk_sec": 30.0,
+    "min_chunk_sec": 10.0,
+    "overlap_sec": float(os.environ.get("LONG_FILE_OVERLAP_SEC", "0")),
+    "overlap_words_per_sec": 3.0,
+    "workers": int(os.environ.get("LONG_FILE_WORKERS", "0")) or (os.cpu_count() or 1),
+}
+_long_file_pool = None
+_long_file_pool_lock = threading.Lock()
+
+def _plan_chunks(samples, sample_rate, chunk_sec, min_chunk_sec):
+    """(start, end) sample ranges cut in the middle of pauses, each at most chunk_sec long"""
+    total = len(samples)
+    max_len = int(chunk_sec * sample_rate)
+    min_len = int(min_chunk_sec * sample_rate)
+    if total <= max_len:
+        return [(0, total)]
+    
+    # Same pause detection as the fluency analysis: runs of the quietest 15% of frames
+    energy, hop_length = _frame_energy(samples, sample_rate)
+    energy = _smooth_energy(energy)
+    cut_points = []
+    if energy.size > 0:
+        _, silence_threshold = energy_thresholds(energy, sample_rate / float(hop_length))
+        silence = energy <= silence_threshold
+        cut_points = [((start + end) // 2) * hop_length for start, end in _silence_runs(silence)]
+    
+    chunks = []
+    start = 0
+    while total - start > max_len:
+        limit = start + max_len
+        # Latest pause that still keeps the chunk under the limit; hard cut if there is none
+        idx = bisect.bisect_right(cut_points, limit) - 1
+        cut = cut_points[idx] if idx >= 0 and cut_points[idx] >= start + min_len else limit
+        chunks.append((start, cut))
+        start = cut
+    chunks.append((start, total))
+    return chunks
+
+def _stitch_transcripts(texts, max_overlap=0):
+    """Join chunk transcripts; with overlapping chunks, drop the words repeated at a boundary
+
+    max_overlap is the most words two neighbouring chunks can share (0: chunks do not
+    overlap, so nothing is dropped).
+    """
+    def norm(word):
+        return word.lower().strip(string.punctuation)
+    
+    words = []
+    for text in texts:
+        chunk_words = text.split()
+        overlap = 0
+        for k in range(min(max_overlap, len(words), len(chunk_words)), 0, -1):
+            if [norm(w) for w in words[-k:]] == [norm(w) for w in chunk_words[:k]]:
+                overlap = k
+                break
+        words.extend(chunk_words[overlap:])
+    # Match whisper's formatting, which starts the text with a space
+    return " " + " ".join(words) if words else ""
+
+def _init_long_file_worker(threads):
+    """Process pool initializer: split cores between workers and load the model once"""
+    torch.set_num_threads(threads)
+    MODEL_MANAGER.get_model(TRANSCRIPTION_CONFIG['base_model'], "cpu")
+
+def _transcribe_chunk(chunk):
+    return _transcribe_tiered(chunk, "cpu", False)
+
+def _get_long_file_pool():
+    global _long_file_pool
+    with _long_file_pool_lock:
+        if _long_file_pool is None:
+            workers = LONG_FILE_CONFIG['workers']
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            # spawn rather than fork: forking a process that has initialized torch can deadlock
+            _long_file_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_long_file_worker,
+                initargs=(threads,),
+            )
+        return _long_file_pool
+
+def transcribe_long_audio(audio):
+    """Transcribe a long recording (path or 16 kHz samples) as pause-aligned chunks in parallel"""
+    if isinstance(audio, str):
+        audio = whisper.load_audio(audio)
+    overlap_sec = LONG_FILE_CONFIG['overlap_sec']
+    overlap = int(overlap_sec * whisper.audio.SAMPLE_RATE)
+    # Leave room for the overlap so chunks still fit whisper's window
+    chunks = _plan_chunks(
+        audio, whisper.audio.SAMPLE_RATE,
+        LONG_FILE_CONFIG['chunk_sec'] - overlap_sec, LONG_FILE_CONFIG['min_chunk_sec']
+    )
+    print(f"Long-file mode: {len(chunks)} chunk(s) across {LONG_FILE_CONFIG['workers']} worker(s)")
+    clips = [audio[max(0, start - overlap):end] for start, end in chunks]
+    texts = _get_long_file_pool().map(_transcribe_chunk, clips)
+    return _stitch_transcripts(texts, int(np.ceil(overlap_sec * LONG_FILE_CONFIG['overlap_words_per_sec'])))
+
+def transcribe_audio(audio, long_file=False):
+    """Transcribe audio (a path or 16 kHz samples) using whisper (optimized for HF Spaces)"""
+    # The GPU path already parallelizes inside the model; chunking pays off on CPU cores
+    if long_file and MODEL_MANAGER.device == "cpu":
+        try:
+            return transcribe_long_audio(audio)
+        except Exception as e:
+            print(f"Long-file transcription failed, falling back to a single pass: {e}")
+    try:
+        # Models stay resident; out-of-memory on the GPU falls back to the CPU copy
+        return MODEL_MANAGER.run(lambda device, fp16: _transcribe_tiered(audio, device, fp16))
     except Exception as e:
         print(f"Transcription error: {e}")
         # Fallback to CPU if GPU fails
         try:
-            model = whisper.load_model("tiny")
-            result = model.transcribe(audio_path)
-            return result['text']
+            return _transcribe_tiered(audio, "cpu", False)
         except Exception as e2:
             print(f"CPU fallback also failed: {e2}")
             return ""
 
-def _normalize_text_for_compare(text: str) -> list:
-    text = text.lower()
-    text = text.translate(str.maketrans('', '', string.punctuation))
-    return [t for t in text.split() if t]
-
-def _wer_alignment(ref_tokens, hyp_tokens):
-    # Compute WER dynamic programming table and backtrack to get operations
-    n, m = len(ref_tokens), len(hyp_tokens)
-    dp = [[0.0] * (m + 1) for _ in range(n + 1)]
-    op = [[None] * (m + 1) for _ in range(n + 1)]
-    # Weighted costs (stricter): substitutions/deletions penalized more than insertions
-    cost_sub, cost_ins, cost_del = 1.2, 1.0, 1.2
-    for i in range(1, n + 1):
-        dp[i][0] = i * cost_del
-        op[i][0] = 'D'
-    for j in range(1, m + 1):
-        dp[0][j] = j * cost_ins
-        op[0][j] = 'I'
-    for i in range(1, n + 1):
-        for j in range(1, m + 1):
-            if ref_tokens[i - 1] == hyp_tokens[j - 1]:
-                dp[i][j] = dp[i - 1][j - 1]
-                op[i][j] = 'E'  # equal
-            else:
-                # substitution, insertion, deletion
-                choices = (
-                    (dp[i - 1][j - 1] + cost_sub, 'S'),
-                    (dp[i][j - 1] + cost_ins, 'I'),
-                    (dp[i - 1][j] + cost_del, 'D'),
-                )
-                dp[i][j], op[i][j] = min(choices, key=lambda x: x[0])
-    # Backtrack
-    i, j = n, m
-    edits = []  # list of tuples (op, ref_token or None, hyp_token or None)
-    while i > 0 or j > 0:
-        cur_op = op[i][j]
-        if cur_op == 'E':
-            edits.append(('E', ref_tokens[i - 1], hyp_tokens[j - 1]))
-            i -= 1
-            j -= 1
-        elif cur_op == 'S':
-            edits.append(('S', ref_tokens[i - 1], hyp_tokens[j - 1]))
-            i -= 1
-            j -= 1
-        elif cur_op == 'I':
-            edits.append(('I', None, hyp_tokens[j - 1]))
-            j -= 1
-        elif cur_op == 'D':
-            edits.append(('D', ref_tokens[i - 1], None))
-            i -= 1
-        else:
-            break
-    edits.reverse()
-    subs = [(r, h) for t, r, h in edits if t == 'S']
-    ins = [h for t, r, h in edits if t == 'I']
-    dels = [r for t, r, h in edits if t == 'D']
-    wer = dp[n][m] / max(1, float(n))
-    return wer, subs, ins, dels
-
 def compare_transcript_to_reference(reference_text: str, hypothesis_text: str):
-    ref = _normalize_text_for_compare(reference_text)
-    hyp = _normalize_text_for_compare(hypothesis_text)
-    wer, subs, ins, dels = _wer_alignment(ref, hyp)
+    # The prepared reference is tokenized once and cached across requests
+    wer, subs, ins, dels = prepare_reference(reference_text).align(hypothesis_text)
+    return _similarity_report(wer, subs, ins, dels)
+
+def compare_transcripts_to_reference(reference_text: str, hypothesis_texts):
+    """Similarity reports for many transcripts of the same reference, aligned in one batch"""
+    alignments = prepare_reference(reference_text).align_many(list(hypothesis_texts))
+    return [_similarity_report(*alignment) for alignment in alignments]
+
+def _similarity_report(wer, subs, ins, dels):
     # Count-based scoring so that 2 substitutions => 90 exactly when no other errors
-    substitution_penalty = 5.0 * len(subs)
-    insertion_penalty = 2.0 * len(ins)
-    deletion_penalty = 3.0 * len(dels)
-    raw_score = 100.0 - substitution_penalty - insertion_penalty - deletion_penalty
-    similarity_score = round(max(0.0, min(100.0, raw_score)), 1)
+    scorer = get_scorer("similarity")
+    counts = {"substitutions": len(subs), "insertions": len(ins), "deletions": len(dels)}
+    deductions = scorer.deductions(counts)
+    substitution_penalty = deductions["substitutions"]
+    insertion_penalty = deductions["insertions"]
+    deletion_penalty = deductions["deletions"]
+    similarity_score = scorer.score(counts)
     summary = []
     if wer == 0:
         summary.append("Perfect match with the provided script")
@@ -156,25 +340,193 @@ def compare_transcript_to_reference(reference_text: str, hypothesis_text: str):
     }
     return result
 
-def analyze_fluency_audio_only(audio_path):
+# numpy dtypes for pydub sample widths (8-bit audio is stored signed by pydub)
+_SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+def _audio_to_mono_float32(audio):
+    """Convert an AudioSegment to mono float32 samples with a single full-length allocation"""
+    dtype = _SAMPLE_DTYPES.get(audio.sample_width)
+    if dtype is None:
+        # Unusual sample width; go through pydub's array conversion
+        frames = np.array(audio.get_array_of_samples())
+    else:
+        # Zero-copy view over the raw frame buffer
+        frames = np.frombuffer(audio.raw_data, dtype=dtype)
+    channels = max(1, audio.channels)
+    frames = frames[:len(frames) - len(frames) % channels].reshape((-1, channels))
+    
+    # Average channels in place on the float32 output buffer
+    samples = frames[:, 0].astype(np.float32)
+    for ch in range(1, channels):
+        samples += frames[:, ch]
+    if channels > 1:
+        samples *= 1.0 / channels
+    return samples
+
+def _frame_energy(samples, frame_rate):
+    """RMS energy of 25ms frames with a 10ms hop; returns (energy, hop_length)"""
+    frame_length = int(0.025 * frame_rate)  # 25ms frames
+    hop_length = int(0.010 * frame_rate)    # 10ms hop
+    
+    energy = []
+    for i in range(0, max(0, len(samples) - frame_length), hop_length):
+        frame = samples[i:i + frame_length]
+        if frame.size == 0:
+            continue
+        energy.append(float(np.sqrt(np.mean(frame**2))))
+    return np.array(energy, dtype=np.float32), hop_length
+
+def _smooth_energy(energy):
+    """5-frame moving average to reduce spikes/noise"""
+    if energy.size >= 5:
+        kernel = np.ones(5, dtype=np.float32) / 5.0
+        energy = np.convolve(energy, kernel, mode='same')
+    return energy
+
+def _silence_runs(silence_segments):
+    """(start, end) frame indices of silent runs that end before the recording does"""
+    runs = []
+    in_pause = False
+    pause_start = 0
+    for i, is_silent in enumerate(silence_segments):
+        if is_silent and not in_pause:
+            in_pause = True
+            pause_start = i
+        elif not is_silent and in_pause:
+            runs.append((pause_start, i))
+            in_pause = False
+    return runs
+
+# Pre-screen thresholds for rejecting unusable uploads before any model work
+PRESCREEN_CONFIG = {
+    "window_sec": 4.0,          # seconds decoded per screening window
+    "min_duration_sec": 2.0,
+    "min_level_dbfs": -55.0,    # RMS level below this counts as silent
+    "max_clipped_ratio": 0.02,  # share of samples at full scale
+    "min_speech_ratio": 0.05,   # share of voiced frames
+    "min_energy_cv": 0.2,       # speech is modulated; steady tones/noise are not
+}
+
+def _media_duration(audio_path):
+    """Duration in seconds from container metadata, or None if it is unavailable"""
+    probe = probe_audio(audio_path)
+    if probe is not None:
+        return probe['duration_sec']
+    # Containers the header probe does not parse (e.g. m4a) go through ffprobe
+    try:
+        return float(mediainfo(audio_path)['duration'])
+    except Exception:
+        return None
+
+def _screen_window(audio):
+    """Signal-level and speech-presence metrics for a short decoded window"""
+    samples = _audio_to_mono_float32(audio)
+    full_scale = float(1 << (8 * audio.sample_width - 1))
+    frame_length = max(1, int(0.025 * audio.frame_rate))
+    n_frames = len(samples) // frame_length
+    if n_frames == 0:
+        return {"level_dbfs": -120.0, "clipped_ratio": 0.0, "speech_ratio": 0.0, "energy_cv": 0.0}
+    samples /= full_scale
+    
+    clipped_ratio = float(np.count_nonzero(np.abs(samples) >= 0.999)) / len(samples)
+    frames = samples[:n_frames * frame_length].reshape((n_frames, frame_length))
+    energy = np.sqrt(np.mean(frames ** 2, axis=1))
+    rms = float(np.sqrt(np.mean(energy ** 2)))
+    level_dbfs = 20.0 * np.log10(rms) if rms > 1e-6 else -120.0
+    
+    # Voiced frames (loud, periodic, low zero-crossing rate) count as speech
+    speech_ratio = SpectralFeatures(samples, audio.frame_rate).prosody()["voiced_ratio"]
+    mean_energy = float(np.mean(energy))
+    energy_cv = float(np.std(energy)) / mean_energy if mean_energy > 1e-8 else 0.0
+    return {
+        "level_dbfs": float(level_dbfs),
+        "clipped_ratio": clipped_ratio,
+        "speech_ratio": speech_ratio,
+        "energy_cv": energy_cv,
+    }
+
+def _read_window(audio_path, offset, window):
+    """Decode window seconds from offset; WAV files read only those frames from disk"""
+    if audio_path.lower().endswith(".wav"):
+        try:
+            with wave.open(audio_path, "rb") as f:
+                rate = f.getframerate()
+                start = min(int(offset * rate), f.getnframes())
+                f.setpos(start)
+                data = f.readframes(int(window * rate))
+                return AudioSegment(data=data, sample_width=f.getsampwidth(),
+                                    frame_rate=rate, channels=f.getnchannels())
+        except (wave.Error, EOFError):
+            # Float or compressed WAV: let pydub/ffmpeg decode it
+            pass
+    return AudioSegment.from_file(audio_path, start_second=offset, duration=window)
+
+def prescreen_audio(audio_path):
+    """Cheap checks on a few decoded seconds; returns a structured error dict or None if usable"""
+    window = PRESCREEN_CONFIG["window_sec"]
+    duration = _media_duration(audio_path)
+    
+    # Screen the start, plus the middle of longer files so a quiet lead-in is not fatal
+    offsets = [0.0]
+    if duration is not None and duration > 3 * window:
+        offsets.append(duration / 2.0)
+    windows = []
+    for offset in offsets:
+        clip = _read_window(audio_path, offset, window)
+        windows.append(_screen_window(clip))
+        if duration is None and len(clip) < window * 1000:
+            # The whole file fit in the first window
+            duration = len(clip) / 1000.0
+    
+    details = {
+        "duration_sec": duration,
+        "level_dbfs": max(w["level_dbfs"] for w in windows),
+        "clipped_ratio": max(w["clipped_ratio"] for w in windows),
+        "speech_ratio": max(w["speech_ratio"] for w in windows),
+        "energy_cv": max(w["energy_cv"] for w in windows),
+    }
+    
+    if duration is not None and duration < PRESCREEN_CONFIG["min_duration_sec"]:
+        code, message = "too_short", f"Recording is too short ({duration:.1f}s) to assess"
+    elif details["level_dbfs"] < PRESCREEN_CONFIG["min_level_dbfs"]:
+        code, message = "silent", "Recording is silent or too quiet to assess"
+    elif details["clipped_ratio"] > PRESCREEN_CONFIG["max_clipped_ratio"]:
+        code, message = "clipped", "Recording is heavily clipped - please lower the input volume"
+    elif (details["speech_ratio"] < PRESCREEN_CONFIG["min_speech_ratio"] or
+          details["energy_cv"] < PRESCREEN_CONFIG["min_energy_cv"]):
+        code, message = "no_speech", "No speech detected in the recording"
+    else:
+        return None
+    
+    return {
+        "error": "Audio rejected",
+        "code": code,
+        "message": message,
+        "details": details
+    }
+
+def analyze_fluency_audio_only(audio_path, prosody=None):
     """Analyze fluency using only audio characteristics - no transcription needed"""
     # Use pydub to get audio duration and samples
-    audio = AudioSegment.from_file(audio_path)
+    return analyze_fluency_segment(AudioSegment.from_file(audio_path), prosody=prosody)
+
+# Fluency metrics that come from SpectralFeatures.prosody()
+PROSODY_METRICS = frozenset({"voiced_ratio", "pitch_variation", "spectral_flux"})
+
+def analyze_fluency_segment(audio, prosody=None):
+    """Audio-only fluency metrics for an already decoded AudioSegment
+    
+    The pitch and spectral features are the costliest part, so by default they are only
+    computed when the active fluency rules read them; prosody=True always computes them.
+    """
     duration = len(audio) / 1000.0  # Convert to seconds
     
-    # Get audio samples
-    samples = np.array(audio.get_array_of_samples())
-    if audio.channels == 2:
-        samples = samples.reshape((-1, 2))
-        # Use average of both channels
-        samples = np.mean(samples, axis=1)
-    
-    # Convert to float and normalize safely
-    samples = samples.astype(np.float32)
-    max_abs = float(np.max(np.abs(samples))) if samples.size > 0 else 0.0
-    if max_abs > 0.0:
-        samples = samples / max_abs
-    else:
+    # Get mono float32 samples straight from the raw frame buffer
+    samples = _audio_to_mono_float32(audio)
+    
+    # Peak level, used to normalize energy instead of a normalized copy of the samples
+    max_abs = max(float(samples.max()), -float(samples.min())) if samples.size > 0 else 0.0
+    if max_abs <= 0.0:
         # Completely silent audio; return minimal metrics
         return {
             "duration_sec": duration,
@@ -189,16 +541,9 @@ def analyze_fluency_audio_only(audio_path):
         }
     
     # Calculate audio energy over time
-    frame_length = int(0.025 * audio.frame_rate)  # 25ms frames
-    hop_length = int(0.010 * audio.frame_rate)    # 10ms hop
-    
-    energy = []
-    for i in range(0, max(0, len(samples) - frame_length), hop_length):
-        frame = samples[i:i + frame_length]
-        if frame.size == 0:
-            continue
-        energy.append(float(np.sqrt(np.mean(frame**2))))
-    energy = np.array(energy, dtype=np.float32)
+    energy, hop_length = _frame_energy(samples, audio.frame_rate)
+    # RMS scales linearly, so normalizing the energy equals normalizing the samples
+    energy /= max_abs
     if energy.size == 0:
         # Not enough frames to analyze
         return {
@@ -213,14 +558,13 @@ def analyze_fluency_audio_only(audio_path):
             "speech_bursts": 0
         }
     # Smooth energy with a small moving average to reduce spikes/noise
-    if energy.size >= 5:
-        kernel = np.ones(5, dtype=np.float32) / 5.0
-        energy = np.convolve(energy, kernel, mode='same')
+    energy = _smooth_energy(energy)
     
     # Analyze speech activity
     # Find speech segments (high energy) vs silence (low energy)
-    # Dynamic threshold: blend percentile and mean-based
-    energy_threshold = max(np.percentile(energy, 30), float(np.mean(energy)) * 0.6)
+    # Dynamic thresholds: blend percentile and mean-based for speech, low percentile for
+    # pauses; all quantiles come from one partition (or a sliding window, if adaptive)
+    energy_threshold, silence_threshold = energy_thresholds(energy, audio.frame_rate / float(hop_length))
     speech_segments = energy > energy_threshold
     
     # Calculate speech activity ratio
@@ -269,27 +613,23 @@ def analyze_fluency_audio_only(audio_path):
         energy_variation_normalized = 0.0
     
     # Find pauses and hesitations
-    silence_threshold = np.percentile(energy, 15)
     silence_segments = energy < silence_threshold
     
-    # Count significant pauses
-    pause_count = 0
-    in_pause = False
-    pause_start = 0
-    
-    for i, is_silent in enumerate(silence_segments):
-        if is_silent and not in_pause:
-            in_pause = True
-            pause_start = i
-        elif not is_silent and in_pause:
-            pause_duration = (i - pause_start) * hop_length / float(audio.frame_rate)
-            if pause_duration > 0.3:  # Count pauses longer than 300ms
-                pause_count += 1
-            in_pause = False
+    # Count significant pauses (longer than 300ms)
+    pause_count = sum(
+        1 for start, end in _silence_runs(silence_segments)
+        if (end - start) * hop_length / float(audio.frame_rate) > 0.3
+    )
     
     # Calculate pause frequency
     pause_frequency = pause_count / (duration / 60.0) if duration > 0 else 0.0
     
+    # Pitch and spectral-change features for intonation, from one STFT pass
+    if prosody is None:
+        prosody = bool(get_scorer("fluency").metrics & PROSODY_METRICS)
+    prosody_metrics = (SpectralFeatures(samples, audio.frame_rate).prosody() if prosody
+                       else dict.fromkeys(PROSODY_METRICS))
+    
     # Estimate words per minute based on speech patterns
     # Average English speaker: ~150 WPM, but varies with speech rate
     estimated_wpm = int(max(0.0, speech_rate) * 150.0 * (1.0 + max(0.0, energy_variation_normalized) * 0.5))
@@ -303,7 +643,10 @@ def analyze_fluency_audio_only(audio_path):
         "pause_count": pause_count,
         "pause_frequency": pause_frequency,
         "estimated_wpm": estimated_wpm,
-        "speech_bursts": len(speech_bursts)
+        "speech_bursts": len(speech_bursts),
+        "voiced_ratio": prosody_metrics["voiced_ratio"],
+        "pitch_variation": prosody_metrics["pitch_variation"],
+        "spectral_flux": prosody_metrics["spectral_flux"]
     }
 
 def analyze_fluency_advanced_audio(fluency_stats):
@@ -317,143 +660,9 @@ def analyze_fluency_advanced_audio(fluency_stats):
     estimated_wpm = fluency_stats['estimated_wpm']
     speech_bursts = fluency_stats['speech_bursts']
     
-    # Fluency scoring based on audio characteristics - Balanced scoring
-    fluency_score = 0
-    fluency_analysis = []
-    
-    # Speech Activity Analysis (25 points) - Reward good audio more
-    if speech_activity_ratio >= 0.7:
-        fluency_score += 25
-        fluency_analysis.append("Excellent speech activity - good use of speaking time")
-    elif speech_activity_ratio >= 0.55:
-        fluency_score += 22
-        fluency_analysis.append("Good speech activity - reasonable speaking time")
-    elif speech_activity_ratio >= 0.4:
-        fluency_score += 17
-        fluency_analysis.append("Moderate speech activity - some silence")
-    elif speech_activity_ratio >= 0.25:
-        fluency_score += 12
-        fluency_analysis.append("Low speech activity - too much silence")
-    else:
-        fluency_score += 6
-        fluency_analysis.append("Very low speech activity - mostly silence")
-    
-    # Speech Rate Analysis (25 points) - Slightly wider optimal, boost good
-    if 0.62 <= speech_rate <= 0.95:
-        fluency_score += 25
-        fluency_analysis.append("Excellent speech rate - natural and engaging pace")
-    elif 0.5 <= speech_rate < 0.62 or 0.95 < speech_rate <= 1.1:
-        fluency_score += 22
-        fluency_analysis.append("Good speech rate - clear and understandable")
-    elif 0.38 <= speech_rate < 0.5 or 1.1 < speech_rate <= 1.3:
-        fluency_score += 16
-        fluency_analysis.append("Moderate speech rate - could be improved")
-    elif 0.25 <= speech_rate < 0.38 or 1.3 < speech_rate <= 1.5:
-        fluency_score += 10
-        fluency_analysis.append("Below average speech rate - needs improvement")
-    else:
-        fluency_score += 5
-        fluency_analysis.append("Poor speech rate - significantly needs improvement")
-    
-    # Rhythm and Flow Analysis (25 points) - Boost mid bands
-    if rhythm_consistency >= 0.7:
-        fluency_score += 25
-        fluency_analysis.append("Excellent rhythm consistency - smooth flow")
-    elif rhythm_consistency >= 0.55:
-        fluency_score += 22
-        fluency_analysis.append("Good rhythm consistency - generally smooth")
-    elif rhythm_consistency >= 0.4:
-        fluency_score += 16
-        fluency_analysis.append("Moderate rhythm - some irregularity")
-    elif rhythm_consistency >= 0.25:
-        fluency_score += 10
-        fluency_analysis.append("Irregular rhythm - needs improvement")
-    else:
-        fluency_score += 5
-        fluency_analysis.append("Very irregular rhythm - significant improvement needed")
-    
-    # Pause Analysis (25 points) - Mid bands worth a bit more
-    if pause_frequency <= 3:
-        fluency_score += 25
-        fluency_analysis.append("Excellent pause control - minimal hesitation")
-    elif pause_frequency <= 6:
-        fluency_score += 21
-        fluency_analysis.append("Good pause control - reasonable pauses")
-    elif pause_frequency <= 9:
-        fluency_score += 17
-        fluency_analysis.append("Moderate pause control - some hesitation")
-    elif pause_frequency <= 14:
-        fluency_score += 12
-        fluency_analysis.append("Frequent pauses - indicates nervousness")
-    else:
-        fluency_score += 6
-        fluency_analysis.append("Excessive pauses - significant improvement needed")
-    
-    # Energy Variation Analysis (up to 10 points) - More balanced
-    if 0.3 <= energy_variation <= 0.8:  # Natural variation (more realistic)
-        fluency_score += 10
-        fluency_analysis.append("Natural energy variation - engaging delivery")
-    elif 0.15 <= energy_variation < 0.3:
-        fluency_score += 7
-        fluency_analysis.append("Good energy variation - expressive speech")
-    elif 0.8 < energy_variation <= 1.2:
-        fluency_score += 5
-        fluency_analysis.append("High energy variation - very expressive")
-    elif energy_variation > 1.2:
-        fluency_score += 3
-        fluency_analysis.append("Very high energy variation - overly dramatic")
-    else:
-        fluency_score += 2
-        fluency_analysis.append("Low energy variation - somewhat monotone")
-    
-    # Duration and Content Bonus - More balanced
-    if duration >= 40 and speech_bursts >= 6:  # Higher requirements
-        if fluency_score >= 70:
-            fluency_score += 5
-            fluency_analysis.append("Sustained fluency over extended speech")
-        elif fluency_score >= 50:
-            fluency_score += 3
-            fluency_analysis.append("Good sustained performance")
-    elif duration >= 20 and speech_bursts >= 4:  # Higher requirements
-        if fluency_score >= 60:
-            fluency_score += 2
-            fluency_analysis.append("Consistent performance")
-    
-    # Speech burst analysis - More balanced
-    if speech_bursts >= 8:  # Higher requirement
-        if rhythm_consistency >= 0.5:  # Higher requirement
-            fluency_score += 2
-            fluency_analysis.append("Good speech segmentation")
-    elif speech_bursts <= 2:  # Penalize more
-        fluency_score -= 3  # Higher penalty
-        fluency_analysis.append("Limited speech segments - may indicate hesitation")
-    
-    # Additional guards to prevent unrealistic perfect scores (still allow good audios to score high)
-    quality_flags = [
-        speech_activity_ratio >= 0.7,
-        0.65 <= speech_rate <= 0.9,
-        rhythm_consistency >= 0.7,
-        pause_frequency <= 3,
-        0.3 <= energy_variation <= 0.8,
-        duration >= 20.0,
-    ]
-    num_flags = sum(1 for x in quality_flags if x)
-    if num_flags < 2:
-        fluency_score = min(fluency_score, 70)
-    elif num_flags < 3:
-        fluency_score = min(fluency_score, 85)
-    elif num_flags < 4:
-        fluency_score = min(fluency_score, 95)
-    # Penalize clearly poor signals
-    if speech_activity_ratio < 0.2 or speech_bursts <= 1:
-        fluency_score = min(fluency_score, 40)
-        fluency_analysis.append("Very limited speech activity detected")
-    if duration < 8:
-        fluency_score = min(fluency_score, 70)
-        fluency_analysis.append("Short recording limits fluency assessment confidence")
-    
-    # Cap the score at 100
-    fluency_score = min(100, max(0, fluency_score))
+    # Bands, bonuses and caps live in scoring_rules.json
+    fluency_score, fluency_analysis = get_scorer("fluency").score(fluency_stats)
+    pitch_variation = fluency_stats.get('pitch_variation')
     
     return {
         "score": fluency_score,
@@ -464,7 +673,8 @@ def analyze_fluency_advanced_audio(fluency_stats):
             "rhythm_consistency": rhythm_consistency,
             "pause_frequency": pause_frequency,
             "estimated_wpm": estimated_wpm,
-            "energy_variation": energy_variation
+            "energy_variation": energy_variation,
+            "pitch_variation": pitch_variation
         }
     }
 
@@ -473,152 +683,77 @@ def analyze_grammar_advanced(text):
     # TextBlob for grammar analysis
     blob = TextBlob(text)
     
-    grammar_score = 100  # Start with 100
-    grammar_analysis = []
-    
     # Basic grammar checks using TextBlob
     # Note: TextBlob provides basic grammar checking without Java dependency
-    
-    # Sentence structure analysis
     sentences = blob.sentences
     avg_sentence_length = np.mean([len(s.words) for s in sentences]) if sentences else 0
     
-    if 8 <= avg_sentence_length <= 25:
-        grammar_analysis.append("Good sentence structure and variety")
-    elif avg_sentence_length < 8:
-        grammar_analysis.append("Sentences are too short - consider combining ideas")
-        grammar_score -= 5
-    else:
-        grammar_analysis.append("Sentences are quite long - consider breaking them up")
-        grammar_score -= 5
-    
-    # Word count analysis
-    words = text.split()
-    if len(words) < 10:
-        grammar_analysis.append("Text is very short - consider adding more content")
-        grammar_score -= 10
-    elif len(words) > 500:
-        grammar_analysis.append("Text is very long - consider breaking into sections")
-        grammar_score -= 5
-    
-    # Punctuation check
-    if text.count('.') < text.count('!') + text.count('?'):
-        grammar_analysis.append("Good use of varied punctuation")
-    else:
-        grammar_analysis.append("Consider using more varied punctuation")
-    
-    # Capitalization check
-    if text[0].isupper() and text.count('.') > 0:
-        grammar_analysis.append("Proper sentence capitalization")
-    else:
-        grammar_analysis.append("Check sentence capitalization")
-        grammar_score -= 5
-    
     # Basic spelling check (TextBlob has limited spelling correction)
     corrected_text = str(blob.correct())
-    if corrected_text != text:
-        grammar_analysis.append("Some spelling issues detected")
-        grammar_score -= 10
-    else:
-        grammar_analysis.append("No obvious spelling issues detected")
+    
+    metrics = {
+        "avg_sentence_length": float(avg_sentence_length),
+        "word_count": len(text.split()),
+        "period_count": text.count('.'),
+        "exclamation_count": text.count('!'),
+        "question_count": text.count('?'),
+        "starts_uppercase": text[:1].isupper(),
+        "spelling_changed": corrected_text != text,
+    }
+    grammar_score, grammar_analysis = get_scorer("grammar").score(metrics)
     
     return {
-        "score": max(0, grammar_score),  # Ensure score doesn't go below 0
+        "score": grammar_score,
         "analysis": grammar_analysis,
         "errors": ["Grammar analysis using TextBlob (limited compared to LanguageTool)"],
-        "error_count": 0  # TextBlob doesn't provide specific error counts
+        "error_count": 0,  # TextBlob doesn't provide specific error counts
+        "metrics": metrics
     }
 
 def analyze_professionalism(text):
     """Analyze professionalism based on language use"""
-    professionalism_score = 50
-    professionalism_analysis = []
-    
-    # Check for informal language - More lenient
+    # Check for informal language
     informal_words = ['um', 'uh', 'like', 'you know', 'basically', 'actually', 'literally']
     informal_count = sum(text.lower().count(word) for word in informal_words)
     
-    if informal_count == 0:
-        professionalism_score += 10
-        professionalism_analysis.append("Excellent professional language - no filler words")
-    elif informal_count <= 5:  # Increased from 3
-        professionalism_score += 5
-        professionalism_analysis.append("Good professional language with minimal filler words")
-    elif informal_count <= 10:  # Increased from 6
-        professionalism_analysis.append("Moderate use of filler words - could be more professional")
-    else:
-        professionalism_score -= 5  # Reduced penalty
-        professionalism_analysis.append("Excessive use of filler words - needs improvement")
-    
-    # Check for confident language - More lenient
+    # Check for confident language
     confident_phrases = ['i believe', 'i think', 'i feel', 'maybe', 'perhaps', 'might']
     confident_count = sum(text.lower().count(phrase) for phrase in confident_phrases)
     
-    if confident_count <= 4:  # Increased from 2
-        professionalism_score += 10
-        professionalism_analysis.append("Confident and assertive communication style")
-    elif confident_count <= 8:  # Increased from 5
-        professionalism_score += 5
-        professionalism_analysis.append("Generally confident with some hedging")
-    else:
-        professionalism_score -= 3  # Reduced penalty
-        professionalism_analysis.append("Overuse of hedging language - be more confident")
-    
     # Check vocabulary sophistication
     words = text.lower().split()
     unique_words = len(set(words))
     total_words = len(words)
     vocabulary_richness = unique_words / total_words if total_words > 0 else 0
     
-    if vocabulary_richness >= 0.6:  # Reduced from 0.7
-        professionalism_score += 10
-        professionalism_analysis.append("Excellent vocabulary diversity")
-    elif vocabulary_richness >= 0.4:  # Reduced from 0.5
-        professionalism_score += 5
-        professionalism_analysis.append("Good vocabulary diversity")
-    else:
-        professionalism_score -= 3  # Reduced penalty
-        professionalism_analysis.append("Limited vocabulary - consider expanding word choice")
+    metrics = {
+        "informal_words": informal_count,
+        "confident_phrases": confident_count,
+        "vocabulary_richness": vocabulary_richness
+    }
+    professionalism_score, professionalism_analysis = get_scorer("professionalism").score(metrics)
     
     return {
-        "score": min(100, max(0, professionalism_score)),
+        "score": professionalism_score,
         "analysis": professionalism_analysis,
-        "metrics": {
-            "informal_words": informal_count,
-            "confident_phrases": confident_count,
-            "vocabulary_richness": vocabulary_richness
-        }
+        "metrics": metrics
     }
 
 def calculate_overall_score(fluency_score, grammar_score, professionalism_score):
-    """Calculate overall score with weighted components: 50% fluency, 30% grammar, 20% professionalism"""
-    weights = {
-        'fluency': 0.50,      # 50% weight for fluency
-        'grammar': 0.30,      # 30% weight for grammar
-        'professionalism': 0.20  # 20% weight for professionalism
-    }
-    
-    overall_score = (
-        fluency_score * weights['fluency'] +
-        grammar_score * weights['grammar'] +
-        professionalism_score * weights['professionalism']
-    )
-    
-    return round(min(100, overall_score), 1)
+    """Calculate overall score with weighted components (default: 50% fluency, 30% grammar, 20% professionalism)"""
+    return get_scorer("overall").score({
+        'fluency': fluency_score,
+        'grammar': grammar_score,
+        'professionalism': professionalism_score
+    })
 
 def calculate_overall_score_with_similarity(fluency_score, grammar_score, similarity_score):
-    """Overall score when custom text is provided: 60% similarity, 20% fluency, 20% grammar."""
-    weights = {
-        'similarity': 0.60,
-        'fluency': 0.20,
-        'grammar': 0.20,
-    }
-    overall_score = (
-        similarity_score * weights['similarity'] +
-        fluency_score * weights['fluency'] +
-        grammar_score * weights['grammar']
-    )
-    return round(min(100, overall_score), 1)
+    """Overall score when custom text is provided (default: 60% similarity, 20% fluency, 20% grammar)."""
+    return get_scorer("overall_with_similarity").score({
+        'similarity': similarity_score,
+        'fluency': fluency_score,
+        'grammar': grammar_score
+    })
 
 def generate_json_report(fluency_analysis, grammar_analysis, professionalism_analysis, overall_score):
     """Generate the JSON report in the requested format"""
@@ -664,21 +799,54 @@ def generate_json_report_with_similarity(fluency_analysis, grammar_analysis, sim
         }
     }
 
-def analyze_audio(audio_path):
-    """Main function to analyze audio and return JSON result"""
+def generate_partial_report(fluency_analysis, timeout):
+    """Report with the acoustic fluency analysis only, for requests whose later stages timed out"""
+    return {
+        "overall_score": None,
+        "partial": True,
+        "incomplete_stages": [timeout.stage],
+        "message": f"{timeout} - only the acoustic fluency analysis is available",
+        "report": {
+            "fluency_analysis": {
+                "score": fluency_analysis["score"],
+                "analysis": fluency_analysis["analysis"]
+            }
+        }
+    }
+
+def analyze_audio(audio_path, long_file=False, deadline=None):
+    """Main function to analyze audio and return JSON result
+    
+    Decoding and transcription run under per-stage deadlines; if transcription or the
+    text analysis does not finish in time, a partial fluency-only report is returned.
+    """
     start_time = time.time()
-    print("Transcribing audio...")
-    transcript = transcribe_audio(audio_path)
+    deadline = deadline or Deadline()
     print("Analyzing fluency...")
-    fluency_stats = analyze_fluency_audio_only(audio_path)
-    print("Performing advanced analysis...")
+    with profile_stage("fluency_features"):
+        fluency_stats = run_stage("decode", analyze_fluency_audio_only, audio_path, deadline=deadline)
     
     # Analyze fluency using audio metrics only
-    fluency_analysis = analyze_fluency_advanced_audio(fluency_stats)
+    with profile_stage("fluency_scoring"):
+        fluency_analysis = analyze_fluency_advanced_audio(fluency_stats)
     
-    # Analyze grammar and professionalism using transcribed text
-    grammar_analysis = analyze_grammar_advanced(transcript)
-    professionalism_analysis = analyze_professionalism(transcript)
+    try:
+        print("Transcribing audio...")
+        with profile_stage("transcribe"):
+            transcript = run_stage("transcribe", transcribe_audio, audio_path, long_file=long_file,
+                                   deadline=deadline)
+        print("Performing advanced analysis...")
+        
+        # Analyze grammar and professionalism using transcribed text
+        deadline.check("grammar")
+        with profile_stage("grammar"):
+            grammar_analysis = analyze_grammar_advanced(transcript)
+        deadline.check("professionalism")
+        with profile_stage("professionalism"):
+            professionalism_analysis = analyze_professionalism(transcript)
+    except StageTimeout as timeout:
+        print(f"Returning partial report: {timeout}")
+        return generate_partial_report(fluency_analysis, timeout)
     
     # Calculate overall score
     overall_score = calculate_overall_score(
@@ -697,25 +865,38 @@ def analyze_audio(audio_path):
     
     return report
 
-def analyze_audio_with_text(audio_path, text):
+def analyze_audio_with_text(audio_path, text, long_file=False, deadline=None):
     """Main function to analyze audio with provided text for grammar and professionalism"""
     start_time = time.time()
+    deadline = deadline or Deadline()
     print("Analyzing audio and text...")
     
     # Analyze fluency using audio-only metrics
-    fluency_stats = analyze_fluency_audio_only(audio_path)
-    fluency_analysis = analyze_fluency_advanced_audio(fluency_stats)
+    with profile_stage("fluency_features"):
+        fluency_stats = run_stage("decode", analyze_fluency_audio_only, audio_path, deadline=deadline)
+    with profile_stage("fluency_scoring"):
+        fluency_analysis = analyze_fluency_advanced_audio(fluency_stats)
 
-    # Transcribe audio to compare with provided custom text
-    print("Transcribing audio for similarity check...")
-    transcript = transcribe_audio(audio_path)
+    try:
+        # Transcribe audio to compare with provided custom text
+        print("Transcribing audio for similarity check...")
+        with profile_stage("transcribe"):
+            transcript = run_stage("transcribe", transcribe_audio, audio_path, long_file=long_file,
+                                   deadline=deadline)
 
-    # Analyze grammar using transcribed text (actual speech)
-    grammar_analysis = analyze_grammar_advanced(transcript)
-    # professionalism_analysis = analyze_professionalism(transcript) # Removed as per edit hint
+        # Analyze grammar using transcribed text (actual speech)
+        deadline.check("grammar")
+        with profile_stage("grammar"):
+            grammar_analysis = analyze_grammar_advanced(transcript)
+        # professionalism_analysis = analyze_professionalism(transcript) # Removed as per edit hint
 
-    # Compare transcript with provided custom text for similarity (WER-based)
-    similarity = compare_transcript_to_reference(text, transcript)
+        # Compare transcript with provided custom text for similarity (WER-based)
+        deadline.check("similarity")
+        with profile_stage("similarity"):
+            similarity = compare_transcript_to_reference(text, transcript)
+    except StageTimeout as timeout:
+        print(f"Returning partial report: {timeout}")
+        return generate_partial_report(fluency_analysis, timeout)
 
     # Calculate overall score with custom weights (similarity 0.6, fluency 0.2, grammar 0.2)
     overall_score = calculate_overall_score_with_similarity(
@@ -734,16 +915,128 @@ def analyze_audio_with_text(audio_path, text):
     
     return report
 
+def _segment_to_whisper_input(audio):
+    """16 kHz mono float32 samples in [-1, 1], as whisper expects"""
+    audio = audio.set_frame_rate(whisper.audio.SAMPLE_RATE).set_channels(1)
+    samples = _audio_to_mono_float32(audio)
+    samples *= 1.0 / float(1 << (8 * audio.sample_width - 1))
+    return samples
+
+def _join_turns(audio, turns):
+    """One segment holding the given turns back to back, built with a single copy of their frames"""
+    frame_width = audio.frame_width
+    data = memoryview(audio.raw_data)
+    parts = [data[int(t["start_sec"] * audio.frame_rate) * frame_width:
+                  int(t["end_sec"] * audio.frame_rate) * frame_width] for t in turns]
+    return AudioSegment(data=b"".join(parts), sample_width=audio.sample_width,
+                        frame_rate=audio.frame_rate, channels=audio.channels)
+
+def _speaker_tracks(audio_path):
+    """Diarize a recording; per speaker, its turns and fluency stats"""
+    audio = AudioSegment.from_file(audio_path)
+    print("Diarizing speakers...")
+    turns = diarize(_audio_to_mono_float32(audio), audio.frame_rate)
+    
+    speakers = {}
+    for turn in turns:
+        speakers.setdefault(turn["speaker"], []).append(turn)
+    
+    tracks = []
+    for speaker, speaker_turns in sorted(speakers.items()):
+        # Join the speaker's turns so gaps while others talk do not count as their pauses
+        speech = _join_turns(audio, speaker_turns)
+        print(f"Analyzing {speaker} ({len(speech) / 1000.0:.1f}s over {len(speaker_turns)} turns)...")
+        tracks.append({
+            "speaker": speaker,
+            "turns": [[t["start_sec"], t["end_sec"]] for t in speaker_turns],
+            "speaking_time_sec": round(len(speech) / 1000.0, 2),
+            "fluency_stats": analyze_fluency_segment(speech),
+        })
+    return tracks
+
+def transcribe_speaker(audio_path, turns, long_file=False):
+    """Transcribe one speaker's turns ([start_sec, end_sec] pairs) of a recording, joined back to back
+
+    The transcription stage re-reads the upload itself, so only the path and the turn
+    offsets cross the worker pipe instead of the speaker's samples.
+    """
+    speech = _join_turns(AudioSegment.from_file(audio_path),
+                         [{"start_sec": start, "end_sec": end} for start, end in turns])
+    return transcribe_audio(_segment_to_whisper_input(speech), long_file=long_file)
+
+def analyze_audio_by_speaker(audio_path, long_file=False, deadline=None):
+    """Diarize a multi-party recording and score each speaker's speech separately
+    
+    Diarization and each speaker's transcription run under the request deadline; a
+    speaker whose transcription or text analysis does not finish in time (and every
+    speaker after it) gets a partial fluency-only report.
+    """
+    start_time = time.time()
+    deadline = deadline or Deadline()
+    with profile_stage("diarize"):
+        tracks = run_stage("decode", _speaker_tracks, audio_path, deadline=deadline)
+    
+    speaker_reports = []
+    for track in tracks:
+        fluency_analysis = analyze_fluency_advanced_audio(track["fluency_stats"])
+        try:
+            # A long speaker track takes the same chunked route as a long single-speaker upload
+            with profile_stage("transcribe"):
+                transcript = run_stage("transcribe", transcribe_speaker, audio_path, track["turns"],
+                                       long_file=long_file, deadline=deadline)
+            deadline.check("grammar")
+            if transcript.strip():
+                with profile_stage("grammar"):
+                    grammar_analysis = analyze_grammar_advanced(transcript)
+                deadline.check("professionalism")
+                with profile_stage("professionalism"):
+                    professionalism_analysis = analyze_professionalism(transcript)
+            else:
+                # Nothing intelligible from this speaker; score text components as zero
+                grammar_analysis = {"score": 0, "analysis": ["No speech transcribed for this speaker"],
+                                    "errors": [], "error_count": 0}
+                professionalism_analysis = {"score": 0, "analysis": ["No speech transcribed for this speaker"]}
+        except StageTimeout as timeout:
+            print(f"Returning partial report for {track['speaker']}: {timeout}")
+            report = generate_partial_report(fluency_analysis, timeout)
+        else:
+            overall_score = calculate_overall_score(
+                fluency_analysis["score"],
+                grammar_analysis["score"],
+                professionalism_analysis["score"]
+            )
+            report = generate_json_report(
+                fluency_analysis, grammar_analysis, professionalism_analysis, overall_score
+            )
+        report.update({
+            "speaker": track["speaker"],
+            "speaking_time_sec": track["speaking_time_sec"],
+            "turns": track["turns"]
+        })
+        speaker_reports.append(report)
+    
+    end_time = time.time()
+    print(f"Total processing time: {end_time - start_time:.2f} seconds")
+    
+    return {
+        "speaker_count": len(speaker_reports),
+        "speakers": speaker_reports
+    }
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Audio Analysis Model for AI Recruiter")
     parser.add_argument("audio_path", help="Path to the candidate's audio file (wav/mp3)")
     parser.add_argument("--text", help="Optional transcribed text for grammar and professionalism analysis")
+    parser.add_argument("--long-file", action="store_true", help="Transcribe in parallel pause-aligned chunks")
+    parser.add_argument("--per-speaker", action="store_true", help="Diarize and report each speaker separately")
     args = parser.parse_args()
     
-    if args.text:
-        result = analyze_audio_with_text(args.audio_path, args.text)
+    if args.per_speaker:
+        result = analyze_audio_by_speaker(args.audio_path, long_file=args.long_file)
+    elif args.text:
+        result = analyze_audio_with_text(args.audio_path, args.text, long_file=args.long_file)
     else:
-        result = analyze_audio(args.audio_path)
+        result = analyze_audio(args.audio_path, long_file=args.long_file)
     
     print(json.dumps(result, indent=2))
@@ -0,0 +1,222 @@
+import os
+import struct
+
+# MPEG audio header tables, indexed by version ('1', '2', '2.5') and layer
+_MP3_BITRATES = {
+    ('1', 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    ('1', 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    ('1', 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    ('2', 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    ('2', 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    ('2', 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {'1': [44100, 48000, 32000], '2': [22050, 24000, 16000], '2.5': [11025, 12000, 8000]}
+_MP3_VERSIONS = {0: '2.5', 2: '2', 3: '1'}
+
+# Bytes read from the end of an Ogg file to find the last page
+_OGG_TAIL_BYTES = 65536
+
+
+def _probe_wav(f, file_size):
+    f.seek(12)
+    channels = sample_rate = byte_rate = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+        if chunk_id == b'fmt ':
+            fmt = f.read(16)
+            _, channels, sample_rate, byte_rate = struct.unpack('<HHII', fmt[:12])
+            f.seek(chunk_size - 16 + (chunk_size & 1), os.SEEK_CUR)
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            # Streamed WAVs leave the data size unset; use the rest of the file instead
+            data_size = min(chunk_size, file_size - f.tell())
+            return {"format": "wav", "duration_sec": data_size / float(byte_rate),
+                    "sample_rate": sample_rate, "channels": channels}
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def _probe_flac(f):
+    f.seek(4)
+    header = f.read(4)
+    if len(header) < 4 or header[0] & 0x7F != 0:
+        return None
+    info = f.read(34)
+    if len(info) < 18:
+        return None
+    # 20 bits sample rate, 3 bits channels-1, 5 bits bits-per-sample-1, 36 bits total samples
+    packed = int.from_bytes(info[10:18], 'big')
+    sample_rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    if not sample_rate:
+        return None
+    return {"format": "flac", "duration_sec": total_samples / float(sample_rate),
+            "sample_rate": sample_rate, "channels": channels}
+
+
+def _probe_ogg(f, file_size):
+    f.seek(0)
+    page = f.read(27)
+    if len(page) < 27:
+        return None
+    segments = page[26]
+    lacing = f.read(segments)
+    packet = f.read(sum(lacing))
+    if packet.startswith(b'OpusHead'):
+        channels = packet[9]
+        pre_skip = struct.unpack('<H', packet[10:12])[0]
+        # Opus granule positions always count 48 kHz samples
+        sample_rate, granule_rate = struct.unpack('<I', packet[12:16])[0] or 48000, 48000
+        fmt = "opus"
+    elif packet.startswith(b'\x01vorbis'):
+        channels = packet[11]
+        sample_rate = granule_rate = struct.unpack('<I', packet[12:16])[0]
+        pre_skip = 0
+        fmt = "vorbis"
+    else:
+        return None
+
+    f.seek(max(0, file_size - _OGG_TAIL_BYTES))
+    tail = f.read()
+    last = tail.rfind(b'OggS')
+    if last < 0 or last + 14 > len(tail) or not granule_rate:
+        return None
+    granule = struct.unpack('<q', tail[last + 6:last + 14])[0]
+    return {"format": fmt, "duration_sec": max(0, granule - pre_skip) / float(granule_rate),
+            "sample_rate": sample_rate, "channels": channels}
+
+
+def _mp3_header(data, pos):
+    """Parse the MPEG frame header at pos, or return None if it is not a valid one"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = _MP3_VERSIONS.get((b1 >> 3) & 0x3)
+    layer = 4 - ((b1 >> 1) & 0x3)
+    bitrate_idx, rate_idx = b2 >> 4, (b2 >> 2) & 0x3
+    if version is None or layer == 4 or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None
+    table_version = '1' if version == '1' else '2'
+    bitrate = _MP3_BITRATES[(table_version, layer)][bitrate_idx] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_idx]
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 3 and version != '1':
+        samples_per_frame = 576
+    else:
+        samples_per_frame = 1152
+    channels = 1 if (b3 >> 6) == 3 else 2
+    return {"version": version, "layer": layer, "bitrate": bitrate, "sample_rate": sample_rate,
+            "samples_per_frame": samples_per_frame, "channels": channels}
+
+
+def _probe_mp3(f, file_size):
+    f.seek(0)
+    head = f.read(10)
+    offset = 0
+    if head[:3] == b'ID3' and len(head) == 10:
+        # ID3v2 size is a 28-bit syncsafe integer, plus an optional 10-byte footer
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        offset = 10 + size + (10 if head[5] & 0x10 else 0)
+    f.seek(offset)
+    data = f.read(16384)
+
+    pos = 0
+    while pos < len(data) - 4:
+        frame = _mp3_header(data, pos)
+        if frame:
+            break
+        pos += 1
+    else:
+        return None
+
+    result = {"format": "mp3", "sample_rate": frame["sample_rate"], "channels": frame["channels"]}
+    # Xing/Info (VBR) header sits after the side information of the first frame
+    if frame["version"] == '1':
+        side_info = 17 if frame["channels"] == 1 else 32
+    else:
+        side_info = 9 if frame["channels"] == 1 else 17
+    for tag_pos in (pos + 4 + side_info, pos + 36):
+        tag = data[tag_pos:tag_pos + 12]
+        if tag[:4] in (b'Xing', b'Info') and struct.unpack('>I', tag[4:8])[0] & 0x1:
+            frames = struct.unpack('>I', tag[8:12])[0]
+            result["duration_sec"] = frames * frame["samples_per_frame"] / float(frame["sample_rate"])
+            return result
+        if tag[:4] == b'VBRI':
+            frames = struct.unpack('>I', data[tag_pos + 14:tag_pos + 18])[0]
+            result["duration_sec"] = frames * frame["samples_per_frame"] / float(frame["sample_rate"])
+            return result
+
+    # Constant bitrate: audio bytes over the byte rate of the first frame
+    result["duration_sec"] = (file_size - offset - pos) * 8.0 / frame["bitrate"]
+    return result
+
+
+def probe_audio(audio_path):
+    """Read duration, sample rate and channels from container headers without decoding
+
+    Supports WAV, FLAC, Ogg (Vorbis/Opus) and MP3. Returns None for other
+    containers or when the headers cannot be parsed.
+    """
+    try:
+        file_size = os.path.getsize(audio_path)
+        with open(audio_path, 'rb') as f:
+            magic = f.read(12)
+            if magic[:4] == b'RIFF' and magic[8:12] == b'WAVE':
+                return _probe_wav(f, file_size)
+            if magic[:4] == b'fLaC':
+                return _probe_flac(f)
+            if magic[:4] == b'OggS':
+                return _probe_ogg(f, file_size)
+            if magic[:3] == b'ID3' or (len(magic) > 1 and magic[0] == 0xFF and magic[1] & 0xE0 == 0xE0):
+                return _probe_mp3(f, file_size)
+    except (OSError, struct.error, IndexError) as e:
+        print(f"Audio probe failed for {audio_path}: {e}")
+    return None
+
+
+# Duration-based admission: uploads above max_duration_sec are rejected (0: no limit),
+# uploads above long_duration_sec are routed to the long-file path. Processing cost is
+# estimated as a fixed overhead plus duration times a real-time factor per device.
+ADMISSION_CONFIG = {
+    "max_duration_sec": float(os.environ.get("MAX_AUDIO_DURATION_SEC", "0")),
+    "long_duration_sec": float(os.environ.get("LONG_AUDIO_DURATION_SEC", "180")),
+    "overhead_sec": 1.5,
+    "realtime_factor": {"cpu": 0.35, "cuda": 0.06},
+}
+
+
+def estimate_processing_cost(duration_sec, device="cpu"):
+    """Estimated processing seconds for an upload of the given duration"""
+    rtf = ADMISSION_CONFIG["realtime_factor"].get(device, ADMISSION_CONFIG["realtime_factor"]["cpu"])
+    return round(ADMISSION_CONFIG["overhead_sec"] + max(0.0, duration_sec) * rtf, 2)
+
+
+def evaluate_admission(probe, device="cpu", duration_sec=None):
+    """Decide whether to accept, route or reject an upload from its probe result
+
+    duration_sec is used when the header probe found nothing, e.g. from ffprobe.
+    """
+    duration = probe["duration_sec"] if probe is not None else duration_sec
+    if duration is None:
+        # Duration unknown even to ffprobe: admit on the standard path and let decoding decide
+        return {"action": "accept", "route": "standard", "duration_sec": None,
+                "estimated_cost_sec": None, "reason": "duration unknown"}
+
+    max_duration = ADMISSION_CONFIG["max_duration_sec"]
+    decision = {"duration_sec": round(duration, 2),
+                "estimated_cost_sec": estimate_processing_cost(duration, device)}
+    if max_duration and duration > max_duration:
+        decision.update(action="reject", route=None,
+                        reason=f"Audio is {duration / 60.0:.1f} minutes long; the limit is "
+                               f"{max_duration / 60.0:.1f} minutes")
+    elif duration > ADMISSION_CONFIG["long_duration_sec"]:
+        decision.update(action="accept", route="long", reason="long recording")
+    else:
+        decision.update(action="accept", route="standard", reason="within limits")
+    return decision
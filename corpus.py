@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from scoring_rules import get_scorer, load_rules
+
+# Raw per-file metrics kept for offline re-scoring. Scores are never stored: they are
+# recomputed from these columns with the active scoring rules, so a calibration change
+# only needs a vectorized pass over the store instead of reprocessing audio.
+FLUENCY_COLUMNS = (
+    "duration_sec", "speech_activity_ratio", "speech_rate", "rhythm_consistency",
+    "energy_variation", "pause_count", "pause_frequency", "estimated_wpm", "speech_bursts",
+    "voiced_ratio", "pitch_variation", "spectral_flux",
+)
+GRAMMAR_COLUMNS = (
+    "avg_sentence_length", "word_count", "period_count", "exclamation_count",
+    "question_count", "starts_uppercase", "spelling_changed",
+)
+PROFESSIONALISM_COLUMNS = ("informal_words", "confident_phrases", "vocabulary_richness")
+# What analyze_grammar_advanced("") and analyze_professionalism("") report, so records
+# stored without text metrics score like an empty transcript does in a live analysis
+EMPTY_TEXT_METRICS = {
+    "grammar": {"avg_sentence_length": 0.0, "word_count": 0, "period_count": 0, "exclamation_count": 0,
+                "question_count": 0, "starts_uppercase": False, "spelling_changed": False},
+    "professionalism": {"informal_words": 0, "confident_phrases": 0, "vocabulary_richness": 0},
+}
+SIMILARITY_COLUMNS = ("wer", "substitutions", "insertions", "deletions")
+
+# Column names in the store are prefixed by their source so metric names cannot collide
+_SECTIONS = (
+    ("fluency", FLUENCY_COLUMNS),
+    ("grammar", GRAMMAR_COLUMNS),
+    ("professionalism", PROFESSIONALISM_COLUMNS),
+    ("similarity", SIMILARITY_COLUMNS),
+)
+ID_COLUMN = "file_id"
+
+
+def collect_metrics(audio_path, reference_text=None, long_file=False):
+    """Raw metrics for one recording: fluency stats, text metrics and similarity errors"""
+    # Imported here so re-scoring an existing store does not load whisper
+    from audio_analysis import (
+        analyze_fluency_audio_only, analyze_grammar_advanced, analyze_professionalism,
+        transcribe_audio,
+    )
+    from alignment import prepare_reference
+
+    transcript = transcribe_audio(audio_path, long_file=long_file)
+    # Candidate rulesets may read the prosody metrics even if the active one does not
+    record = {"fluency": analyze_fluency_audio_only(audio_path, prosody=True)}
+    # Empty transcripts are scored too, as the live analysis does
+    record["grammar"] = analyze_grammar_advanced(transcript)["metrics"]
+    record["professionalism"] = analyze_professionalism(transcript)["metrics"]
+    if reference_text:
+        wer, subs, ins, dels = prepare_reference(reference_text).align(transcript)
+        record["similarity"] = {"wer": wer, "substitutions": len(subs),
+                                "insertions": len(ins), "deletions": len(dels)}
+    return record
+
+
+def records_to_columns(file_ids, records):
+    """Flatten metric records into float64 columns; missing metrics become NaN"""
+    columns = {ID_COLUMN: np.array([str(f) for f in file_ids])}
+    for section, names in _SECTIONS:
+        for name in names:
+            values = []
+            for record in records:
+                value = record.get(section, {}).get(name)
+                values.append(np.nan if value is None else float(value))
+            columns[f"{section}.{name}"] = np.array(values, dtype=np.float64)
+    return columns
+
+
+def save_store(path, columns):
+    """Write columns to .parquet (needs pyarrow) or .npz"""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet stores need pyarrow; install it or use a .npz path")
+        pq.write_table(pa.table({name: values for name, values in columns.items()}), path)
+    else:
+        np.savez(path, **columns)
+
+
+def load_store(path):
+    """Read a store written by save_store() back into a dict of NumPy columns"""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet stores need pyarrow; install it or use a .npz path")
+        table = pq.read_table(path)
+        return {name: table.column(name).to_numpy() for name in table.column_names}
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
+
+
+def append_to_store(path, file_ids, records):
+    """Add records to a store, replacing earlier rows with the same file id"""
+    new = records_to_columns(file_ids, records)
+    if not os.path.exists(path):
+        save_store(path, new)
+        return new
+    old = load_store(path)
+    keep = ~np.isin(old[ID_COLUMN], new[ID_COLUMN])
+    merged = {name: np.concatenate([np.asarray(old[name])[keep], values]) for name, values in new.items()}
+    save_store(path, merged)
+    return merged
+
+
+def _section(columns, section):
+    prefix = section + "."
+    values = {name[len(prefix):]: np.asarray(column, dtype=np.float64)
+              for name, column in columns.items() if name.startswith(prefix)}
+    for name, empty in EMPTY_TEXT_METRICS.get(section, {}).items():
+        if name in values:
+            values[name] = np.where(np.isnan(values[name]), float(empty), values[name])
+    return values
+
+
+def rescore(columns, scorers=None):
+    """Recompute every score for the whole store in one vectorized pass
+
+    scorers defaults to the active rules file; pass load_rules(path) to try a
+    candidate ruleset. Records stored without text metrics are scored as an empty
+    transcript, like a live analysis; records with similarity errors use the
+    with-similarity overall weighting. Returns a dict of score columns.
+    """
+    def scorer(name):
+        return scorers[name] if scorers is not None else get_scorer(name)
+
+    scores = {"fluency": scorer("fluency").score_batch(_section(columns, "fluency"))["score"]}
+    scores["grammar"] = scorer("grammar").score_batch(_section(columns, "grammar"))["score"]
+    scores["professionalism"] = scorer("professionalism").score_batch(
+        _section(columns, "professionalism")
+    )["score"]
+
+    similarity = _section(columns, "similarity")
+    has_reference = ~np.isnan(similarity["substitutions"])
+    scores["similarity"] = np.where(has_reference, scorer("similarity").score_batch(similarity), np.nan)
+    standard = scorer("overall").score_batch(scores)
+    with_similarity = scorer("overall_with_similarity").score_batch(
+        dict(scores, similarity=np.nan_to_num(scores["similarity"]))
+    )
+    scores["overall"] = np.where(has_reference, with_similarity, standard)
+    return scores
+
+
+def score_distribution(values, bins=10, value_range=(0.0, 100.0)):
+    """Histogram and summary statistics of one score column, ignoring NaN"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    counts, edges = np.histogram(values, bins=bins, range=value_range)
+    summary = {"count": int(values.size), "histogram": {"edges": edges.tolist(), "counts": counts.tolist()}}
+    if values.size:
+        quantiles = np.quantile(values, [0.1, 0.25, 0.5, 0.75, 0.9])
+        summary.update({
+            "mean": round(float(np.mean(values)), 2),
+            "std": round(float(np.std(values)), 2),
+            "min": float(np.min(values)),
+            "max": float(np.max(values)),
+            "percentiles": {f"p{p}": round(float(q), 2) for p, q in zip((10, 25, 50, 75, 90), quantiles)},
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect raw metrics and re-score a corpus offline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    collect = commands.add_parser("collect", help="Analyze recordings and append their raw metrics to a store")
+    collect.add_argument("store", help="Store path (.npz or .parquet)")
+    collect.add_argument("audio", nargs="+", help="Audio files")
+    collect.add_argument("--reference", help="File with the reference script read in every recording")
+    collect.add_argument("--long-file", action="store_true", help="Transcribe in parallel chunks")
+
+    rescore_cmd = commands.add_parser("rescore", help="Recompute scores over a store")
+    rescore_cmd.add_argument("store", help="Store path (.npz or .parquet)")
+    rescore_cmd.add_argument("--rules", help="Scoring rules file (default: the active rules)")
+    rescore_cmd.add_argument("--out", help="Write per-record scores to this .npz or .parquet path")
+    rescore_cmd.add_argument("--bins", type=int, default=10, help="Histogram bins for the distributions")
+    args = parser.parse_args()
+
+    if args.command == "collect":
+        reference_text = None
+        if args.reference:
+            with open(args.reference, encoding="utf-8") as f:
+                reference_text = f.read()
+        records = []
+        for audio_path in args.audio:
+            print(f"Collecting metrics for {audio_path}...")
+            records.append(collect_metrics(audio_path, reference_text, long_file=args.long_file))
+        columns = append_to_store(args.store, args.audio, records)
+        print(f"Store {args.store} now holds {len(columns[ID_COLUMN])} records")
+        return
+
+    columns = load_store(args.store)
+    start_time = time.time()
+    scores = rescore(columns, load_rules(args.rules) if args.rules else None)
+    elapsed = time.time() - start_time
+    if args.out:
+        save_store(args.out, dict(scores, **{ID_COLUMN: columns[ID_COLUMN]}))
+    print(json.dumps({
+        "records": int(len(columns[ID_COLUMN])),
+        "rescore_seconds": round(elapsed, 3),
+        "distributions": {name: score_distribution(values, args.bins) for name, values in scores.items()},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
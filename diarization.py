@@ -0,0 +1,209 @@
+import numpy as np
+
+from features import mel_filterbank
+
+# Speaker diarization on CPU: log-mel statistics per 1s segment, clustered online so
+# cost grows linearly with recording length (n segments x k speakers).
+DIARIZATION_CONFIG = {
+    "segment_sec": 1.0,
+    "n_bands": 24,
+    "block_sec": 60.0,              # audio framed and transformed per block to bound memory
+    "max_speakers": 4,
+    "new_speaker_distance": 0.45,   # cosine distance that opens a new speaker
+    "merge_distance": 0.25,         # speakers closer than this are merged afterwards
+    "min_speaker_share": 0.05,      # smaller clusters are folded into their nearest speaker
+    "min_turn_persistence": 3.5,    # runs-test z below which two clusters are separate speakers
+    "min_turn_sec": 2.0,
+}
+
+
+def segment_embeddings(samples, sample_rate, segment_sec=1.0, n_bands=24, block_sec=60.0):
+    """Log-mel mean/std embedding and RMS energy for each fixed-length segment"""
+    frame_length = int(0.025 * sample_rate)
+    hop_length = int(0.010 * sample_rate)
+    n_fft = 1 << (frame_length - 1).bit_length()
+    seg_len = int(segment_sec * sample_rate)
+    n_segments = len(samples) // seg_len if seg_len else 0
+    embeddings = np.zeros((n_segments, 2 * n_bands), dtype=np.float32)
+    energy = np.zeros(n_segments, dtype=np.float32)
+    if n_segments == 0:
+        return embeddings, energy
+
+    filterbank = mel_filterbank(n_fft, sample_rate, n_bands)
+    window = np.hanning(frame_length).astype(np.float32)
+    frames_per_seg = (seg_len - frame_length) // hop_length + 1
+    frame_index = np.arange(frames_per_seg)[:, None] * hop_length + np.arange(frame_length)[None, :]
+    segs_per_block = max(1, int(block_sec / segment_sec))
+
+    for first in range(0, n_segments, segs_per_block):
+        last = min(n_segments, first + segs_per_block)
+        block = samples[first * seg_len:last * seg_len].reshape((last - first, seg_len))
+        # (segments, frames, frame_length) -> power spectrum -> log-mel bands
+        power = np.abs(np.fft.rfft(block[:, frame_index] * window, n=n_fft, axis=-1)) ** 2
+        log_mel = np.log(power @ filterbank.T + 1e-10)
+        embeddings[first:last, :n_bands] = log_mel.mean(axis=1)
+        embeddings[first:last, n_bands:] = log_mel.std(axis=1)
+        energy[first:last] = np.sqrt(np.mean(block.astype(np.float64) ** 2, axis=1))
+    return embeddings, energy
+
+
+def _online_cluster(embeddings, new_speaker_distance, max_speakers):
+    """Leader-follower clustering of unit vectors; returns centroid sums"""
+    sums = np.zeros((max_speakers, embeddings.shape[1]), dtype=np.float64)
+    n_clusters = 0
+    for emb in embeddings:
+        if n_clusters:
+            centroids = sums[:n_clusters] / np.linalg.norm(sums[:n_clusters], axis=1, keepdims=True)
+            sims = centroids @ emb
+            best = int(np.argmax(sims))
+            if 1.0 - sims[best] <= new_speaker_distance or n_clusters == max_speakers:
+                sums[best] += emb
+                continue
+        sums[n_clusters] = emb
+        n_clusters += 1
+    return sums[:n_clusters]
+
+
+def _merge_close(centroids, merge_distance):
+    """Greedily merge centroid sums whose directions are within merge_distance"""
+    merged = True
+    while merged and len(centroids) > 1:
+        merged = False
+        units = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+        sims = units @ units.T
+        np.fill_diagonal(sims, -1.0)
+        i, j = np.unravel_index(int(np.argmax(sims)), sims.shape)
+        if 1.0 - sims[i, j] <= merge_distance:
+            centroids[i] += centroids[j]
+            centroids = np.delete(centroids, j, axis=0)
+            merged = True
+    return centroids
+
+
+def _assign(embeddings, centroids):
+    units = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+    return np.argmax(embeddings @ units.T, axis=1)
+
+
+def _runs_z(labels):
+    """Wald-Wolfowitz runs test on a two-valued sequence; very negative when values come in long runs"""
+    n = len(labels)
+    n1 = int(np.sum(labels == labels[0]))
+    n2 = n - n1
+    if n1 == 0 or n2 == 0:
+        return np.inf
+    runs = 1 + int(np.count_nonzero(labels[1:] != labels[:-1]))
+    expected = 2.0 * n1 * n2 / n + 1.0
+    variance = 2.0 * n1 * n2 * (2.0 * n1 * n2 - n) / (n * n * (n - 1))
+    return (runs - expected) / np.sqrt(variance) if variance > 0 else np.inf
+
+
+def _merge_interleaved(labels, min_persistence):
+    """Merge clusters that alternate segment by segment instead of forming turns
+
+    One voice split by the clustering gives labels that interleave at random, while
+    separate speakers hold the floor for runs of segments. Pairs are merged, most
+    interleaved first, until every remaining pair forms turns.
+    """
+    labels = labels.copy()
+    while True:
+        present = np.unique(labels)
+        best = None
+        for i, a in enumerate(present):
+            for b in present[i + 1:]:
+                z = _runs_z(labels[(labels == a) | (labels == b)])
+                if best is None or z > best[0]:
+                    best = (z, a, b)
+        if best is None or best[0] < -min_persistence:
+            return labels
+        labels[labels == best[2]] = best[1]
+
+
+def _rank_by_time(labels, durations):
+    """Map labels to 0..k-1 in order of decreasing speaking time"""
+    order = np.argsort(-durations, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[labels]
+
+
+def diarize(samples, sample_rate, config=None):
+    """Split a mono recording into speaker turns
+
+    Returns a list of {"speaker", "start_sec", "end_sec"} dicts in time order.
+    Speakers are numbered by total speaking time, "speaker_1" speaking most.
+    """
+    cfg = dict(DIARIZATION_CONFIG, **(config or {}))
+    seg_sec = cfg["segment_sec"]
+    embeddings, energy = segment_embeddings(
+        samples, sample_rate, seg_sec, cfg["n_bands"], cfg["block_sec"]
+    )
+    if embeddings.shape[0] == 0:
+        return []
+
+    # Speech segments are within ~20 dB of the loud end of the recording
+    speech = (energy > 0) & (energy >= 0.1 * np.percentile(energy, 95))
+    if not np.any(speech):
+        return []
+
+    # Mean normalization removes channel/level effects shared by every speaker
+    feats = embeddings[speech] - embeddings[speech].mean(axis=0)
+    feats /= np.maximum(np.linalg.norm(feats, axis=1, keepdims=True), 1e-8)
+
+    centroids = _online_cluster(feats, cfg["new_speaker_distance"], cfg["max_speakers"])
+    centroids = _merge_close(centroids, cfg["merge_distance"])
+    labels = _assign(feats, centroids)
+    # One speaker is enough unless the clusters form turns (checked before smoothing,
+    # which would make any labelling look persistent)
+    labels = _merge_interleaved(labels, cfg["min_turn_persistence"])
+    centroids = np.array([feats[labels == k].sum(axis=0) for k in np.unique(labels)])
+    labels = _assign(feats, centroids)
+
+    # Fold clusters that hold too little speech into their nearest neighbour
+    counts = np.bincount(labels, minlength=len(centroids))
+    keep = counts >= max(1, cfg["min_speaker_share"] * len(labels))
+    if not np.all(keep) and np.any(keep):
+        centroids = np.array([feats[labels == k].sum(axis=0) for k in np.flatnonzero(keep)])
+        labels = _assign(feats, centroids)
+
+    # Smooth single-segment flips with a 3-segment majority vote
+    if len(labels) >= 3:
+        smoothed = labels.copy()
+        agree = labels[:-2] == labels[2:]
+        smoothed[1:-1][agree] = labels[:-2][agree]
+        labels = smoothed
+
+    labels = _rank_by_time(labels, np.bincount(labels))
+
+    # Collapse consecutive speech segments into turns; non-speech extends the current turn
+    turns = []
+    for seg_idx, label in zip(np.flatnonzero(speech), labels):
+        start, end = seg_idx * seg_sec, (seg_idx + 1) * seg_sec
+        if turns and turns[-1]["label"] == label:
+            turns[-1]["end_sec"] = end
+        else:
+            turns.append({"label": int(label), "start_sec": start, "end_sec": end})
+
+    # Absorb turns shorter than min_turn_sec into the previous turn
+    merged = []
+    for turn in turns:
+        if merged and (turn["end_sec"] - turn["start_sec"] < cfg["min_turn_sec"] or
+                       merged[-1]["label"] == turn["label"]):
+            merged[-1]["end_sec"] = turn["end_sec"]
+        else:
+            merged.append(turn)
+
+    # Absorbing short turns can leave gaps in the numbering; rank again on the final turns
+    final = np.array([t["label"] for t in merged])
+    durations = np.zeros(final.max() + 1)
+    np.add.at(durations, final, [t["end_sec"] - t["start_sec"] for t in merged])
+    present = np.flatnonzero(durations > 0)
+    ranks = _rank_by_time(np.searchsorted(present, final), durations[present])
+    for turn, label in zip(merged, ranks):
+        turn["label"] = int(label)
+
+    return [
+        {"speaker": f"speaker_{t['label'] + 1}", "start_sec": round(float(t["start_sec"]), 2),
+         "end_sec": round(float(t["end_sec"]), 2)}
+        for t in merged
+    ]
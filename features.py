@@ -0,0 +1,152 @@
+import numpy as np
+
+FEATURE_NAMES = ("rms", "zcr", "spectral_flux", "pitch", "pitch_clarity")
+# Features derived from the spectrum; the others only need the framed samples
+_SPECTRAL_FEATURES = {"spectral_flux", "pitch", "pitch_clarity"}
+
+
+def mel_filterbank(n_fft, sample_rate, n_bands, fmin=60.0, fmax=8000.0):
+    """Triangular mel filterbank, shape (n_bands, n_fft // 2 + 1)"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    mels = np.linspace(hz_to_mel(fmin), hz_to_mel(min(fmax, sample_rate / 2.0)), n_bands + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mels) / sample_rate).astype(int)
+    filterbank = np.zeros((n_bands, n_fft // 2 + 1), dtype=np.float32)
+    for b in range(n_bands):
+        left, center, right = bins[b], bins[b + 1], bins[b + 2]
+        if center > left:
+            filterbank[b, left:center] = (np.arange(left, center) - left) / float(center - left)
+        if right > center:
+            filterbank[b, center:right] = (right - np.arange(center, right)) / float(right - center)
+    return filterbank
+
+
+class SpectralFeatures:
+    """Frame-level features of a mono signal, computed lazily from one blocked STFT pass
+
+    Features are only computed when asked for. compute() fills every requested
+    feature that is not cached yet in a single pass over the audio, so callers
+    that need several features should request them together. Frames are 25ms
+    with a 10ms hop, like the energy analysis in audio_analysis.
+    """
+
+    def __init__(self, samples, sample_rate, frame_sec=0.025, hop_sec=0.010, block_frames=1024,
+                 fmin=70.0, fmax=400.0):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.frame_length = max(1, int(frame_sec * sample_rate))
+        self.hop_length = max(1, int(hop_sec * sample_rate))
+        self.block_frames = block_frames
+        self.fmin = fmin
+        self.fmax = fmax
+        if len(samples) >= self.frame_length:
+            self.n_frames = 1 + (len(samples) - self.frame_length) // self.hop_length
+        else:
+            self.n_frames = 0
+        # Zero-pad to twice the frame so the autocorrelation from the power spectrum is not circular
+        self.n_fft = 1 << (2 * self.frame_length - 1).bit_length()
+        self._cache = {}
+
+    def __getitem__(self, name):
+        self.compute(name)
+        return self._cache[name]
+
+    def compute(self, *names):
+        """Compute the requested features that are not cached yet, in a single pass"""
+        unknown = set(names) - set(FEATURE_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown features: {', '.join(sorted(unknown))}")
+        missing = [name for name in dict.fromkeys(names) if name not in self._cache]
+        if not missing:
+            return
+        if "pitch" in missing or "pitch_clarity" in missing:
+            missing = list(dict.fromkeys(missing + ["pitch", "pitch_clarity"]))
+            missing = [name for name in missing if name not in self._cache]
+
+        parts = {name: [] for name in missing}
+        needs_spectrum = any(name in _SPECTRAL_FEATURES for name in missing)
+        window = np.hanning(self.frame_length).astype(np.float32)
+        if "pitch" in missing:
+            min_lag = max(1, int(self.sample_rate / self.fmax))
+            max_lag = min(self.frame_length - 1, int(self.sample_rate / self.fmin))
+            # Divide out the window's own autocorrelation taper
+            window_ac = np.fft.irfft(np.abs(np.fft.rfft(window, n=self.n_fft)) ** 2, n=self.n_fft)
+            window_ac = window_ac[:max_lag + 1] / window_ac[0]
+        prev_mag = None
+        offsets = np.arange(self.frame_length)
+
+        for first in range(0, self.n_frames, self.block_frames):
+            last = min(self.n_frames, first + self.block_frames)
+            frames = self.samples[np.arange(first, last)[:, None] * self.hop_length + offsets]
+
+            if "rms" in missing:
+                parts["rms"].append(np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1)))
+            if "zcr" in missing:
+                parts["zcr"].append(np.mean(np.diff(np.signbit(frames), axis=1), axis=1, dtype=np.float32))
+            if not needs_spectrum:
+                continue
+
+            spectrum = np.fft.rfft(frames * window, n=self.n_fft, axis=1)
+            power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+            del spectrum
+
+            if "spectral_flux" in missing:
+                mag = np.sqrt(power)
+                mag /= np.maximum(np.linalg.norm(mag, axis=1, keepdims=True), 1e-10)
+                previous = np.vstack([mag[:1] if prev_mag is None else prev_mag, mag[:-1]])
+                parts["spectral_flux"].append(np.sum(np.maximum(mag - previous, 0.0), axis=1))
+                prev_mag = mag[-1:]
+            if "pitch" in missing:
+                # Wiener-Khinchin: the autocorrelation is the inverse FFT of the power spectrum
+                ac = np.fft.irfft(power, n=self.n_fft, axis=1)[:, :max_lag + 1]
+                energy = np.maximum(ac[:, :1], 1e-10)
+                ac = ac / energy / np.maximum(window_ac, 1e-3)
+                # First local peak within 90% of the best one, which avoids sub-octave picks
+                search = ac[:, min_lag:max_lag]
+                peaks = (search >= ac[:, min_lag - 1:max_lag - 1]) & (search >= ac[:, min_lag + 1:max_lag + 1])
+                peaks &= search >= 0.9 * np.max(search, axis=1, keepdims=True)
+                lags = min_lag + np.argmax(peaks, axis=1)
+                clarity = ac[np.arange(len(lags)), lags]
+                parts["pitch_clarity"].append(np.clip(clarity, 0.0, 1.0).astype(np.float32))
+                parts["pitch"].append((self.sample_rate / lags).astype(np.float32))
+
+        for name in missing:
+            if parts[name]:
+                self._cache[name] = np.concatenate(parts[name])
+            else:
+                self._cache[name] = np.zeros(0, dtype=np.float32)
+
+    def voice_activity(self, min_clarity=0.45, max_zcr=0.25):
+        """Boolean mask of voiced frames: energetic, periodic and not noise-like"""
+        self.compute("rms", "zcr", "pitch_clarity")
+        rms = self._cache["rms"]
+        if rms.size == 0:
+            return np.zeros(0, dtype=bool)
+        loud = rms > 0.05 * float(np.percentile(rms, 95))
+        return loud & (self._cache["pitch_clarity"] >= min_clarity) & (self._cache["zcr"] <= max_zcr)
+
+    def prosody(self):
+        """Voicing, pitch and spectral-change summary used by the fluency scoring"""
+        self.compute("rms", "zcr", "pitch", "pitch_clarity", "spectral_flux")
+        voiced = self.voice_activity()
+        voiced_ratio = float(np.mean(voiced)) if voiced.size else 0.0
+        pitch = self._cache["pitch"][voiced]
+        if pitch.size >= 10:
+            # Semitones around the speaker's median pitch; clip octave errors
+            semitones = np.clip(12.0 * np.log2(pitch / float(np.median(pitch))), -12.0, 12.0)
+            pitch_variation = float(np.std(semitones))
+            pitch_mean_hz = float(np.median(pitch))
+        else:
+            pitch_variation = 0.0
+            pitch_mean_hz = 0.0
+        flux = self._cache["spectral_flux"]
+        return {
+            "voiced_ratio": voiced_ratio,
+            "pitch_mean_hz": pitch_mean_hz,
+            "pitch_variation": pitch_variation,
+            "spectral_flux": float(np.mean(flux)) if flux.size else 0.0,
+        }
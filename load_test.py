@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Load generator for the Audio Analysis API
+
+Drives /speaking, /listening and /analyze-text with a configurable request mix,
+concurrency and audio durations, then reports throughput, latency percentiles,
+error rates and memory over time. Without --url the app is started in this
+process with the stub transcriber (TRANSCRIBER_BACKEND=stub), so the web layer,
+decoding and scoring are exercised without whisper weights or network access.
+
+Examples:
+    python load_test.py --concurrency 8 --requests 200
+    python load_test.py --mix speaking=1 --durations 30,60 --stub-latency-ms 800
+    python load_test.py --url http://localhost:10000 --pid 12345 --duration 120
+
+Memory is the resident memory of the server process plus all of its descendants
+(stage workers, long-file pool), sampled with psutil when it is installed and from
+/proc otherwise. Pages shared between processes count once per process.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+from synthetic_audio import synth_speech_wav
+
+REFERENCE_TEXT = (
+    "Thank you for the question. In my last role I led a small team that rebuilt our "
+    "reporting pipeline."
+)
+ANALYZE_TEXT = "Hello world, this is a test message for grammar analysis. I think it reads well!"
+
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _descendants(pid):
+    """Process ids of every descendant of pid, from the parent links in /proc"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the parent pid follows it
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    found, stack = [], list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        found.append(child)
+        stack.extend(children.get(child, []))
+    return found
+
+
+def _proc_rss_bytes(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_mb(pid):
+    """Resident memory of a process and all its descendants in MB, or None if unavailable"""
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            total = root.memory_info().rss
+        except psutil.Error:
+            return None
+        for child in root.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass  # exited since it was listed
+        return total / 1024.0 ** 2
+    try:
+        total = _proc_rss_bytes(pid)
+        children = _descendants(pid)
+    except (OSError, ValueError, IndexError):
+        return None
+    for child in children:
+        try:
+            total += _proc_rss_bytes(child)
+        except (OSError, ValueError, IndexError):
+            pass  # exited since it was listed
+    return total / 1024.0 ** 2
+
+
+def wait_until_ready(base_url, timeout):
+    """Wait for the boot warm-up to finish; raises RuntimeError if it fails or times out"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            warmup = requests.get(f"{base_url}/ready", timeout=10).json().get("warmup", {})
+        except (requests.RequestException, ValueError) as e:
+            warmup = {"status": "unreachable", "error": str(e)}
+        status = warmup.get("status")
+        if status == "ready":
+            return
+        if status == "failed":
+            # A cold server would measure model loading, not serving
+            raise RuntimeError(f"Server warm-up failed: {warmup.get('error')}")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server not ready after {timeout:.0f}s (warm-up {status})")
+        time.sleep(0.5)
+
+
+def start_local_server(stub_latency_ms, stub_rtf):
+    """Run app.py in a background thread with the stub transcriber; returns its base URL"""
+    os.environ["TRANSCRIBER_BACKEND"] = "stub"
+    os.environ["STUB_TRANSCRIBER_LATENCY_MS"] = str(stub_latency_ms)
+    os.environ["STUB_TRANSCRIBER_RTF"] = str(stub_rtf)
+    from werkzeug.serving import make_server
+    from app import app
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("speaking", "listening", "analyze-text"):
+            raise SystemExit(f"Unknown endpoint in --mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def send_request(base_url, endpoint, audio, request_id, timeout):
+    """Send one request; returns (status code or None, error message or None)"""
+    try:
+        if endpoint == "analyze-text":
+            response = requests.post(f"{base_url}/analyze-text", json={"text": ANALYZE_TEXT}, timeout=timeout)
+        else:
+            # Unique names so concurrent uploads do not share a temporary file on the server
+            files = {"audio": (f"load_{request_id}.wav", audio, "audio/wav")}
+            data = {"text": REFERENCE_TEXT} if endpoint == "listening" else {}
+            response = requests.post(f"{base_url}/{endpoint}", files=files, data=data, timeout=timeout)
+        if response.status_code >= 400:
+            return response.status_code, response.text[:200]
+        return response.status_code, None
+    except requests.RequestException as e:
+        return None, str(e)
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    arr = np.asarray(values) * 1000.0
+    p50, p90, p95, p99 = np.percentile(arr, [50, 90, 95, 99])
+    return {"count": len(values), "p50_ms": round(p50, 1), "p90_ms": round(p90, 1),
+            "p95_ms": round(p95, 1), "p99_ms": round(p99, 1), "max_ms": round(float(arr.max()), 1)}
+
+
+def run_load(base_url, args, memory_pid):
+    mix = parse_mix(args.mix)
+    endpoints, weights = list(mix), list(mix.values())
+    durations = [float(d) for d in args.durations.split(",")]
+    clips = {d: synth_speech_wav(d, seed=int(d * 10)) for d in durations}
+    rng = random.Random(args.seed)
+    # Fix the whole request plan up front so runs with the same seed send the same requests
+    plan = [(rng.choices(endpoints, weights)[0], rng.choice(durations)) for _ in range(args.requests)]
+
+    results = []
+    results_lock = threading.Lock()
+    next_index = [0]
+    stop_at = time.monotonic() + args.duration if args.duration else None
+    done = threading.Event()
+
+    def worker():
+        while not done.is_set():
+            with results_lock:
+                index = next_index[0]
+                next_index[0] += 1
+            if stop_at is not None:
+                if time.monotonic() >= stop_at:
+                    return
+                endpoint, duration = plan[index % len(plan)]
+            elif index >= len(plan):
+                return
+            else:
+                endpoint, duration = plan[index]
+            start = time.perf_counter()
+            status, error = send_request(base_url, endpoint, clips[duration], index, args.timeout)
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                results.append({"endpoint": endpoint, "audio_sec": duration, "status": status,
+                                "error": error, "latency": elapsed, "finished": time.monotonic()})
+
+    timeline = []
+    started = time.monotonic()
+
+    def monitor():
+        # Sample every interval and once more at the end, so short runs get a sample too
+        finished = False
+        while not finished:
+            finished = done.wait(args.report_interval)
+            with results_lock:
+                completed = len(results)
+                errors = sum(1 for r in results if r["error"])
+            sample = {"t_sec": round(time.monotonic() - started, 1), "completed": completed,
+                      "errors": errors, "rss_mb": None}
+            rss = rss_mb(memory_pid) if memory_pid else None
+            if rss is not None:
+                sample["rss_mb"] = round(rss, 1)
+            timeline.append(sample)
+            print(f"  t={sample['t_sec']:>6}s completed={completed} errors={errors} rss_mb={sample['rss_mb']}")
+
+    print(f"Load test against {base_url}: concurrency={args.concurrency}, mix={mix}, durations={durations}")
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    monitor_thread = threading.Thread(target=monitor, daemon=True)
+    monitor_thread.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    monitor_thread.join()
+    wall = time.monotonic() - started
+
+    report = {
+        "base_url": base_url,
+        "concurrency": args.concurrency,
+        "wall_sec": round(wall, 2),
+        "requests": len(results),
+        "throughput_rps": round(len(results) / wall, 2) if wall > 0 else 0.0,
+        "error_rate": round(sum(1 for r in results if r["error"]) / len(results), 4) if results else 0.0,
+        "latency": {"all": percentiles([r["latency"] for r in results])},
+        "status_codes": {},
+        "sample_errors": [r["error"] for r in results if r["error"]][:5],
+        "memory_timeline": timeline,
+    }
+    for endpoint in endpoints:
+        report["latency"][endpoint] = percentiles([r["latency"] for r in results if r["endpoint"] == endpoint])
+    for duration in durations:
+        report["latency"][f"audio_{duration:g}s"] = percentiles(
+            [r["latency"] for r in results if r["endpoint"] != "analyze-text" and r["audio_sec"] == duration]
+        )
+    for r in results:
+        key = str(r["status"]) if r["status"] is not None else "connection_error"
+        report["status_codes"][key] = report["status_codes"].get(key, 0) + 1
+    rss_values = [s["rss_mb"] for s in timeline if s["rss_mb"] is not None]
+    if rss_values:
+        report["peak_rss_mb"] = max(rss_values)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Audio Analysis API")
+    parser.add_argument("--url", help="Target a running server instead of starting one with the stub transcriber")
+    parser.add_argument("--pid", type=int,
+                        help="Server process id to sample memory from (with its child processes) when using --url")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="Requests to send (request plan length with --duration)")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of a fixed request count")
+    parser.add_argument("--mix", default="speaking=6,listening=3,analyze-text=1",
+                        help="Endpoint weights, e.g. speaking=6,listening=3,analyze-text=1")
+    parser.add_argument("--durations", default="5,15,30", help="Comma-separated audio durations in seconds")
+    parser.add_argument("--stub-latency-ms", type=float, default=200, help="Stub transcriber fixed latency")
+    parser.add_argument("--stub-rtf", type=float, default=0.0,
+                        help="Stub transcriber latency per second of audio (real-time factor)")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--report-interval", type=float, default=2.0, help="Seconds between progress/memory samples")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the request plan")
+    parser.add_argument("--ready-timeout", type=float, default=600,
+                        help="Seconds to wait for the server's warm-up before giving up")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        base_url, memory_pid = args.url.rstrip("/"), args.pid
+    else:
+        base_url, server = start_local_server(args.stub_latency_ms, args.stub_rtf)
+        # The server runs in this process, so its memory is ours (plus the client's small share)
+        memory_pid = os.getpid()
+
+    try:
+        # Measure the warm server, as a load balancer would only route to it once ready
+        try:
+            wait_until_ready(base_url, args.ready_timeout)
+        except RuntimeError as e:
+            print(f"Aborting: {e}", file=sys.stderr)
+            return 1
+        report = run_load(base_url, args, memory_pid)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["requests"] and report["error_rate"] < 1.0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import collections
+import contextlib
+import multiprocessing
+import threading
+import time
+
+import torch
+import whisper
+
+
+def _is_oom_error(exc):
+    """True for CUDA out-of-memory errors across torch versions"""
+    oom_type = getattr(torch.cuda, "OutOfMemoryError", None)
+    if oom_type is not None and isinstance(exc, oom_type):
+        return True
+    return isinstance(exc, RuntimeError) and "out of memory" in str(exc).lower()
+
+
+def _model_bytes(model):
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class _LocalBudget:
+    """Admission state of a single process"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.in_use = [0]
+        self.active = [0]
+        self.weights = [0]
+
+
+class SharedBudget:
+    """Device admission state shared by the ModelManagers of several processes
+
+    Create it before starting the worker processes and pass it to each of them; every
+    process attaches to its own slot with ModelManager.share_budget(). Admission then
+    counts the requests in flight and resident weights of all processes, and
+    release_slot() frees the share of a process that was killed.
+    """
+
+    def __init__(self, slots, ctx=None):
+        ctx = ctx or multiprocessing.get_context("spawn")
+        self.cond = ctx.Condition()
+        self.in_use = ctx.RawArray("q", slots)
+        self.active = ctx.RawArray("q", slots)
+        self.weights = ctx.RawArray("q", slots)
+
+    def release_slot(self, slot):
+        with self.cond:
+            self.in_use[slot] = self.active[slot] = self.weights[slot] = 0
+            self.cond.notify_all()
+
+
+class ModelManager:
+    """Keeps whisper models resident and admits GPU work up to a memory budget.
+
+    Models are loaded once per (name, device) and stay resident. A whisper model is
+    not safe to decode from several threads at once (decoding installs kv-cache hooks
+    on the shared modules), so callers check an instance out with using(); up to
+    max_instances copies of a model are loaded when requests overlap. With a
+    weights_budget, the least recently used unpinned model on a device is evicted
+    when a new load would exceed it; models named in pinned are never evicted.
+
+    Each GPU request reserves an estimated activation cost against the budget (device
+    memory times memory_fraction, minus resident weights); requests that cannot be
+    admitted within admit_timeout, or that hit an out-of-memory error, run on the
+    resident CPU copy instead. Passing memory_budget and request_cost simulates a
+    device budget, which makes admission testable on CPU-only machines together with
+    a custom loader. Processes that share a device share one budget through
+    share_budget().
+    """
+
+    def __init__(self, device=None, fp16=None, memory_fraction=0.8, memory_budget=None,
+                 request_cost=None, admit_timeout=30.0, loader=None, weights_budget=None,
+                 pinned=(), max_instances=1):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.fp16 = (self.device != "cpu") if fp16 is None else (fp16 and self.device != "cpu")
+        self.memory_fraction = memory_fraction
+        self.memory_budget = memory_budget
+        self.admit_timeout = admit_timeout
+        self.weights_budget = weights_budget
+        self.pinned = set(pinned)
+        self.max_instances = max(1, max_instances)
+        self._loader = loader or whisper.load_model
+        # Without an explicit cost, start from a conservative guess and learn from measured peaks
+        self._fixed_cost = request_cost is not None
+        self.request_cost = request_cost if request_cost is not None else 512 * 1024 ** 2
+        self._measured_peak = 0
+        self._real_cuda = memory_budget is None and self.device != "cpu" and torch.cuda.is_available()
+        # (name, device) -> {"instances", "free", "bytes", "loading"}, least recently used first
+        self._resident = collections.OrderedDict()
+        self._models_cond = threading.Condition()
+        self._budget = _LocalBudget()
+        self._slot = 0
+        self._stats_lock = threading.Lock()
+        self.stats = {"device_runs": 0, "cpu_runs": 0, "oom_fallbacks": 0, "budget_fallbacks": 0,
+                      "loads": 0, "evictions": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _checkout(self, key):
+        with self._models_cond:
+            while True:
+                entry = self._resident.get(key)
+                if entry is None:
+                    entry = self._resident[key] = {"instances": [], "free": [], "bytes": 0, "loading": 0}
+                self._resident.move_to_end(key)
+                if entry["free"]:
+                    return entry["free"].pop()
+                if len(entry["instances"]) + entry["loading"] < self.max_instances:
+                    entry["loading"] += 1
+                    break
+                self._models_cond.wait()
+
+        # Load outside the lock so other models stay usable meanwhile
+        name, device = key
+        try:
+            print(f"Loading whisper '{name}' model on {device}")
+            model = self._loader(name, device=device)
+        except Exception:
+            with self._models_cond:
+                entry["loading"] -= 1
+                if not entry["instances"] and not entry["loading"]:
+                    self._resident.pop(key, None)
+                self._models_cond.notify_all()
+            raise
+        self._count("loads")
+        with self._models_cond:
+            entry["loading"] -= 1
+            entry["instances"].append(model)
+            entry["bytes"] = _model_bytes(model)
+            self._evict(keep=key)
+        self._publish_weights()
+        return model
+
+    def _checkin(self, key, model):
+        with self._models_cond:
+            self._resident[key]["free"].append(model)
+            self._models_cond.notify_all()
+
+    def resident_bytes(self, device):
+        with self._models_cond:
+            return sum(e["bytes"] * len(e["instances"]) for k, e in self._resident.items() if k[1] == device)
+
+    def _publish_weights(self):
+        # Resident weights on the device count against the activation budget of every process
+        weights = self.resident_bytes(self.device)
+        with self._budget.cond:
+            self._budget.weights[self._slot] = weights
+            self._budget.cond.notify_all()
+
+    def share_budget(self, budget, slot):
+        """Admit device work against a SharedBudget, as the process in the given slot"""
+        budget.release_slot(slot)
+        self._budget = budget
+        self._slot = slot
+        self._publish_weights()
+
+    def _evict(self, keep):
+        """Drop least recently used idle, unpinned models until the device fits its weights budget"""
+        device = keep[1]
+        if self.weights_budget is None:
+            return
+        while self.resident_bytes(device) > self.weights_budget:
+            victim = next((k for k, e in self._resident.items()
+                           if k != keep and k[1] == device and k[0] not in self.pinned and
+                           e["instances"] and not e["loading"] and len(e["free"]) == len(e["instances"])), None)
+            if victim is None:
+                print(f"Resident weights on {device} exceed the budget; nothing idle to evict")
+                return
+            print(f"Evicting whisper '{victim[0]}' model from {device}")
+            del self._resident[victim]
+            self._count("evictions")
+            if device != "cpu" and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    @contextlib.contextmanager
+    def using(self, name, device=None):
+        """Check out a resident instance of a model for exclusive use, loading it if needed"""
+        key = (name, device or self.device)
+        model = self._checkout(key)
+        try:
+            yield model
+        finally:
+            self._checkin(key, model)
+
+    def get_model(self, name, device=None):
+        """Load a model if it is not resident yet (preloading); use using() to run it"""
+        with self.using(name, device) as model:
+            return model
+
+    def resident(self):
+        """(name, device) pairs with at least one loaded instance"""
+        with self._models_cond:
+            return [key for key, entry in self._resident.items() if entry["instances"]]
+
+    def device_budget(self):
+        """Bytes available for concurrent request activations on the device"""
+        if self.memory_budget is not None:
+            return self.memory_budget
+        total = torch.cuda.get_device_properties(0).total_memory
+        return max(0, int(total * self.memory_fraction) - sum(self._budget.weights))
+
+    def _admit(self, cost):
+        deadline = time.monotonic() + self.admit_timeout
+        budget = self._budget
+        with budget.cond:
+            # A lone request is always admitted, even if its estimate exceeds the budget
+            while sum(budget.active) and sum(budget.in_use) + cost > self.device_budget():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                budget.cond.wait(remaining)
+            budget.in_use[self._slot] += cost
+            budget.active[self._slot] += 1
+            return True
+
+    def _release(self, cost):
+        budget = self._budget
+        with budget.cond:
+            budget.in_use[self._slot] -= cost
+            budget.active[self._slot] -= 1
+            budget.cond.notify_all()
+
+    def _stream(self):
+        # Separate CUDA streams let admitted requests overlap on the device
+        if self._real_cuda:
+            return torch.cuda.stream(torch.cuda.Stream())
+        return contextlib.nullcontext()
+
+    def _run_cpu(self, fn):
+        self._count("cpu_runs")
+        return fn("cpu", False)
+
+    def run(self, fn):
+        """Run fn(device, fp16) on the device if admitted, otherwise on the CPU"""
+        if self.device == "cpu":
+            return self._run_cpu(fn)
+
+        cost = self.request_cost
+        if not self._admit(cost):
+            print("GPU memory budget exhausted; running request on CPU")
+            self._count("budget_fallbacks")
+            return self._run_cpu(fn)
+
+        try:
+            # Peaks are only attributable to this request when it runs alone
+            with self._budget.cond:
+                measure = self._real_cuda and not self._fixed_cost and sum(self._budget.active) == 1
+            if measure:
+                torch.cuda.reset_peak_memory_stats()
+                baseline = torch.cuda.memory_allocated()
+            with self._stream():
+                result = fn(self.device, self.fp16)
+            if measure:
+                with self._stats_lock:
+                    self._measured_peak = max(self._measured_peak, torch.cuda.max_memory_allocated() - baseline)
+                    self.request_cost = int(self._measured_peak * 1.25)
+            self._count("device_runs")
+            return result
+        except Exception as e:
+            if not _is_oom_error(e):
+                raise
+            print(f"GPU out of memory; running request on CPU: {e}")
+            self._count("oom_fallbacks")
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        finally:
+            self._release(cost)
+        return self._run_cpu(fn)
@@ -0,0 +1,234 @@
+import collections
+import contextlib
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+
+# Opt-in request profiling: a request is profiled when it sends the profile header
+# together with the debug token (X-Debug-Token), or is picked by the sampling rate.
+# Without a debug token configured, the header is ignored and profiles cannot be read. Profiled requests get a stack sampler thread plus
+# per-stage timings and RSS deltas; the last buffer_size profiles are kept in memory.
+# Unprofiled requests only pay for a thread-local lookup per stage. Stages that run in
+# stage worker processes are sampled inside the worker, and the worker's timings and
+# stacks (prefixed "<stage>-worker;") are merged into the request's profile.
+PROFILING_CONFIG = {
+    "sample_rate": float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+    "header": os.environ.get("PROFILE_HEADER", "X-Profile"),
+    "buffer_size": int(os.environ.get("PROFILE_BUFFER_SIZE", "20")),
+    "interval_sec": float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000.0,
+    "debug_token": os.environ.get("PROFILE_DEBUG_TOKEN", ""),
+}
+
+_local = threading.local()
+_profiles = collections.deque(maxlen=PROFILING_CONFIG["buffer_size"])
+_profiles_lock = threading.Lock()
+_ids = itertools.count(1)
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+def _rss_bytes():
+    """Resident set size of this process, or None where it cannot be read"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class _StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed stacks"""
+
+    def __init__(self, target_thread_id, interval_sec):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval_sec = interval_sec
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval_sec):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfile:
+    """Timings, memory deltas and sampled stacks of one profiled request"""
+
+    def __init__(self, endpoint, reason):
+        self.id = next(_ids)
+        self.endpoint = endpoint
+        self.reason = reason
+        self.started_at = time.time()
+        self.stages = []
+        self.total_sec = None
+        self._sampler = _StackSampler(threading.get_ident(), PROFILING_CONFIG["interval_sec"])
+        self._worker_stacks = collections.Counter()
+        self._worker_samples = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            rss_after = _rss_bytes()
+            self.stages.append({
+                "stage": name,
+                "seconds": round(time.perf_counter() - start, 4),
+                "rss_delta_bytes": None if rss_before is None or rss_after is None else rss_after - rss_before,
+            })
+
+    def merge_worker(self, stage, data):
+        """Add what a stage worker sampled while running stage for this request"""
+        self.stages.append({
+            "stage": f"{stage}-worker",
+            "seconds": data["seconds"],
+            "rss_delta_bytes": data["rss_delta_bytes"],
+        })
+        for stack, count in data["stacks"].items():
+            self._worker_stacks[f"{stage}-worker;{stack}"] += count
+        self._worker_samples += data["samples"]
+
+    def samples(self):
+        return self._sampler.samples + self._worker_samples
+
+    def collapsed(self):
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope"""
+        stacks = self._sampler.stacks + self._worker_stacks
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "endpoint": self.endpoint,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "total_sec": self.total_sec,
+            "samples": self.samples(),
+            "stages": self.stages,
+        }
+
+
+def stage(name):
+    """Context manager timing a pipeline stage of the current request, if it is profiled"""
+    profile = getattr(_local, "profile", None)
+    if profile is None:
+        return _NULL_CONTEXT
+    return profile.stage(name)
+
+
+def worker_interval():
+    """Sampling interval for work done in a stage worker for this request; None if unprofiled"""
+    if getattr(_local, "profile", None) is None:
+        return None
+    return PROFILING_CONFIG["interval_sec"]
+
+
+def call_profiled(fn, args, kwargs, interval_sec):
+    """Run fn under a stack sampler (in a stage worker); returns (result, profile data)"""
+    sampler = _StackSampler(threading.get_ident(), interval_sec)
+    sampler.start()
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        sampler.stop()
+    rss_after = _rss_bytes()
+    return result, {
+        "seconds": round(time.perf_counter() - start, 4),
+        "rss_delta_bytes": None if rss_before is None or rss_after is None else rss_after - rss_before,
+        "stacks": dict(sampler.stacks),
+        "samples": sampler.samples,
+    }
+
+
+def merge_worker_profile(stage, data):
+    """Merge a stage worker's profile data into the current request's profile"""
+    profile = getattr(_local, "profile", None)
+    if profile is not None and data is not None:
+        profile.merge_worker(stage, data)
+
+
+def debug_authorized(headers):
+    """True if the headers carry the configured debug token; always False when none is set"""
+    token = PROFILING_CONFIG["debug_token"]
+    if not token or headers is None:
+        return False
+    return hmac.compare_digest(headers.get("X-Debug-Token", "").encode(), token.encode())
+
+
+def _profile_reason(headers):
+    if (headers is not None and headers.get(PROFILING_CONFIG["header"], "").lower() in ("1", "true", "yes")
+            and debug_authorized(headers)):
+        return "header"
+    if PROFILING_CONFIG["sample_rate"] > 0 and random.random() < PROFILING_CONFIG["sample_rate"]:
+        return "sampled"
+    return None
+
+
+@contextlib.contextmanager
+def profiled_request(endpoint, headers=None):
+    """Profile the enclosed request when asked to by header or sampling; yields the profile or None"""
+    reason = _profile_reason(headers)
+    if reason is None:
+        yield None
+        return
+
+    profile = RequestProfile(endpoint, reason)
+    _local.profile = profile
+    profile._sampler.start()
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.total_sec = round(time.perf_counter() - start, 4)
+        rss_after = _rss_bytes()
+        profile.stages.append({
+            "stage": "total",
+            "seconds": profile.total_sec,
+            "rss_delta_bytes": None if rss_before is None or rss_after is None else rss_after - rss_before,
+        })
+        profile._sampler.stop()
+        _local.profile = None
+        with _profiles_lock:
+            _profiles.append(profile)
+        print(f"Profiled {endpoint} request {profile.id}: {profile.total_sec:.2f}s, "
+              f"{profile.samples()} stack samples")
+
+
+def recent_profiles():
+    """Summaries of the buffered profiles, newest first"""
+    with _profiles_lock:
+        return [p.summary() for p in reversed(_profiles)]
+
+
+def get_profile(profile_id):
+    with _profiles_lock:
+        for profile in _profiles:
+            if profile.id == profile_id:
+                return profile
+    return None
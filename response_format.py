@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import json
+import os
+
+from scoring_rules import get_scorer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compact responses replace analysis messages with integer codes from the message
+# table (GET /messages) and drop text that can be derived from the numbers. Bodies
+# larger than min_compress_bytes are compressed when the client accepts it.
+COMPACT_JSON = "application/vnd.audio-analysis.compact+json"
+COMPACT_MSGPACK = "application/vnd.audio-analysis.compact+msgpack"
+MSGPACK_TYPES = (COMPACT_MSGPACK, "application/msgpack", "application/x-msgpack")
+RESPONSE_CONFIG = {
+    "min_compress_bytes": int(os.environ.get("COMPRESS_MIN_BYTES", "1024")),
+    "gzip_level": 6,
+    "zstd_level": 3,
+}
+
+_SCORED_SECTIONS = ("fluency", "grammar", "professionalism")
+# Messages produced outside the scoring rules
+_FIXED_MESSAGES = (
+    "Grammar analysis using TextBlob (limited compared to LanguageTool)",
+    "No speech transcribed for this speaker",
+    "Perfect match with the provided script",
+)
+
+_table_cache = {"key": None, "table": None, "codes": None}
+
+
+def message_table():
+    """{"version", "messages": [text, ...]}; a message's code is its index"""
+    scorers = [get_scorer(name) for name in _SCORED_SECTIONS]
+    key = tuple(scorers)
+    if _table_cache["key"] != key:
+        messages = []
+        for scorer in scorers:
+            for group in scorer.groups:
+                for case in group["cases"]:
+                    if case["message"] and case["message"] not in messages:
+                        messages.append(case["message"])
+        messages.extend(m for m in _FIXED_MESSAGES if m not in messages)
+        version = hashlib.sha1("\n".join(messages).encode("utf-8")).hexdigest()[:12]
+        _table_cache.update(key=key, table={"version": version, "messages": messages},
+                            codes={m: i for i, m in enumerate(messages)})
+    return _table_cache["table"]
+
+
+def _compact_similarity(similarity, codes):
+    errors = similarity["errors"]
+    compact = {
+        "score": similarity["score"],
+        "counts": [len(errors["substitutions"]), len(errors["insertions"]), len(errors["deletions"])],
+        "substitutions": [[s["from"], s["to"]] for s in errors["substitutions"]],
+        "insertions": errors["insertions"],
+        "deletions": errors["deletions"],
+    }
+    # The summary restates the counts; keep only a perfect-match marker
+    if "Perfect match with the provided script" in similarity.get("summary", []):
+        compact["analysis"] = [codes["Perfect match with the provided script"]]
+    return compact
+
+
+def compact_report(report):
+    """Report with message codes instead of text, and similarity errors as plain lists
+
+    Messages missing from the table (e.g. from an older rules file) stay as text.
+    """
+    table = message_table()
+    codes = _table_cache["codes"]
+
+    def convert(value, key=None):
+        if key == "similarity_analysis" and isinstance(value, dict) and "errors" in value:
+            return _compact_similarity(value, codes)
+        if key in ("analysis", "errors") and isinstance(value, list):
+            return [codes.get(m, m) if isinstance(m, str) else m for m in value]
+        if isinstance(value, dict):
+            return {k: convert(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [convert(v) for v in value]
+        return value
+
+    compact = convert(report)
+    if isinstance(compact, dict):
+        compact["messages_version"] = table["version"]
+    return compact
+
+
+def negotiate_format(accept_mimetypes, query_format=None):
+    """'json', 'compact' or 'msgpack' from the Accept header (or a ?format= override)"""
+    if query_format in ("json", "compact", "msgpack"):
+        return query_format
+    offered = ["application/json", COMPACT_JSON]
+    if msgpack is not None:
+        offered.extend(MSGPACK_TYPES)
+    best = accept_mimetypes.best_match(offered, default="application/json")
+    if best in MSGPACK_TYPES:
+        return "msgpack"
+    return "compact" if best == COMPACT_JSON else "json"
+
+
+def encode_body(payload, fmt):
+    """(bytes, mimetype) for a report in the negotiated format"""
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("MessagePack responses need the msgpack package")
+        return msgpack.packb(compact_report(payload), use_bin_type=True), COMPACT_MSGPACK
+    if fmt == "compact":
+        body = json.dumps(compact_report(payload), separators=(",", ":"), ensure_ascii=False)
+        return body.encode("utf-8"), COMPACT_JSON
+    return json.dumps(payload).encode("utf-8"), "application/json"
+
+
+def choose_encoding(accept_encodings):
+    """Best supported content coding from the parsed Accept-Encoding header, or None
+
+    Codings are ranked by q-value (q=0 refuses one) and zstd wins ties with gzip. An
+    identity ranked above every supported coding leaves the body uncompressed.
+    """
+    best, best_quality = None, 0
+    for encoding in (("zstd", "gzip") if zstandard is not None else ("gzip",)):
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    if "identity" in accept_encodings and accept_encodings.quality("identity") > best_quality:
+        return None
+    return best
+
+
+def compress_body(body, encoding):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=RESPONSE_CONFIG["zstd_level"]).compress(body)
+    return gzip.compress(body, compresslevel=RESPONSE_CONFIG["gzip_level"])
+
+
+def compress_response(response, accept_encodings):
+    """Compress a large response body in place for a client that accepts it; returns the response"""
+    response.vary.add("Accept-Encoding")
+    if (response.direct_passthrough or response.status_code < 200 or
+            "Content-Encoding" in response.headers or
+            (response.content_length or 0) < RESPONSE_CONFIG["min_compress_bytes"]):
+        return response
+    encoding = choose_encoding(accept_encodings)
+    if encoding:
+        response.set_data(compress_body(response.get_data(), encoding))
+        response.headers["Content-Encoding"] = encoding
+        # A strong ETag names exact bytes; the coded body only matches the identity one weakly
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,264 @@
+import contextlib
+import heapq
+import ipaddress
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+from audio_probe import estimate_processing_cost
+from stage_runner import STAGE_CONFIG, StageTimeout
+
+
+def _parse_weights(spec):
+    """'team-a=2,team-b=1' -> {"team-a": 2.0, "team-b": 1.0}"""
+    weights = {}
+    for part in spec.split(","):
+        tenant, _, weight = part.strip().partition("=")
+        if tenant:
+            weights[tenant] = float(weight or 1)
+    _check_weights(weights)
+    return weights
+
+
+def _check_weights(weights):
+    for tenant, weight in weights.items():
+        if not weight > 0:
+            raise ValueError(f"Tenant weight for '{tenant}' must be greater than 0, got {weight}")
+
+
+def _parse_networks(spec):
+    """'10.0.0.1,192.168.0.0/16' -> list of ip_network"""
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+
+# Per-tenant scheduling of analysis requests. A request's cost is its estimated
+# processing seconds (from the upload's duration and the endpoint). Each tenant (the
+# client address, or TENANT_HEADER on requests from trusted_proxies, which set it from
+# an authenticated identity) has a token bucket refilled at rate_cost_sec_per_min, and
+# requests over the limit get 429. Admitted audio requests then wait in a weighted fair
+# queue for one of `slots` analysis slots, so one tenant's bulk upload cannot starve
+# the others. 0 disables rate limiting.
+SCHEDULER_CONFIG = {
+    "tenant_header": os.environ.get("TENANT_HEADER", "X-Tenant-Key"),
+    "trusted_proxies": _parse_networks(os.environ.get("TENANT_TRUSTED_PROXIES", "")),
+    "rate_cost_sec_per_min": float(os.environ.get("TENANT_RATE_COST_SEC_PER_MIN", "0")),
+    "burst_cost_sec": float(os.environ.get("TENANT_BURST_COST_SEC", "0")),  # 0: one minute of rate
+    "weights": _parse_weights(os.environ.get("TENANT_WEIGHTS", "")),
+    "slots": int(os.environ.get("SCHEDULER_SLOTS", "0")) or max(1, STAGE_CONFIG["workers"]),
+    "db_path": os.environ.get("SCHEDULER_DB_PATH", ""),
+    "endpoint_cost_factor": {"/speaking": 1.0, "/listening": 1.1},
+    "text_cost_sec": 0.1,
+    "unknown_duration_sec": 60.0,
+}
+
+
+def tenant_for(headers, remote_addr):
+    """Tenant of a request: the tenant header if a trusted proxy sent it, else the client address
+
+    Clients could otherwise pick any tenant (another team's, or a fresh one per
+    request) to dodge their rate limit and fair-queue share.
+    """
+    if remote_addr and _is_trusted_proxy(remote_addr):
+        tenant = headers.get(SCHEDULER_CONFIG["tenant_header"])
+        if tenant:
+            return tenant
+    return remote_addr or "anonymous"
+
+
+def warn_on_untrusted_tenants():
+    """Print a startup warning when rate limits are on but no proxy may name tenants; True if warned
+
+    Behind a reverse proxy every request then comes from the proxy's address, so all
+    clients share one tenant's budget and queue share.
+    """
+    if SCHEDULER_CONFIG["rate_cost_sec_per_min"] <= 0 or SCHEDULER_CONFIG["trusted_proxies"]:
+        return False
+    print("Warning: tenant rate limits are on but TENANT_TRUSTED_PROXIES is empty, so "
+          f"'{SCHEDULER_CONFIG['tenant_header']}' is ignored and each client address is a tenant. "
+          "Behind a reverse proxy or NAT, all clients share one rate limit.")
+    return True
+
+
+def _is_trusted_proxy(remote_addr):
+    try:
+        address = ipaddress.ip_address(remote_addr)
+    except ValueError:
+        return False
+    return any(address in network for network in SCHEDULER_CONFIG["trusted_proxies"])
+
+
+def estimate_request_cost(endpoint, admission=None, device="cpu"):
+    """Estimated processing seconds of a request, used for rate limits and fair queuing"""
+    if endpoint not in SCHEDULER_CONFIG["endpoint_cost_factor"]:
+        return SCHEDULER_CONFIG["text_cost_sec"]
+    duration = admission.get("duration_sec") if admission else None
+    if duration is None:
+        duration = SCHEDULER_CONFIG["unknown_duration_sec"]
+    return estimate_processing_cost(duration, device) * SCHEDULER_CONFIG["endpoint_cost_factor"][endpoint]
+
+
+def _take(tokens, updated_at, cost, capacity, rate, now):
+    """Refill a bucket and try to take cost from it; returns (tokens, retry_after_sec)
+
+    A request costlier than the whole bucket is let through once the bucket is full
+    and leaves it in debt, so long uploads are still charged in full.
+    """
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+    needed = min(cost, capacity)
+    if tokens >= needed:
+        return tokens - cost, 0.0
+    return tokens, (needed - tokens) / rate
+
+
+class MemoryBuckets:
+    """Token buckets held in this process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, tenant, cost, capacity, rate):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(tenant, (capacity, now))
+            tokens, retry_after = _take(tokens, updated_at, cost, capacity, rate, now)
+            self._buckets[tenant] = (tokens, now)
+        return retry_after
+
+
+class SQLiteBuckets:
+    """Token buckets in a local SQLite file, shared by processes and kept across restarts"""
+
+    def __init__(self, path):
+        self.path = path
+        with contextlib.closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS token_buckets ("
+                         "tenant TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+
+    def take(self, tenant, cost, capacity, rate):
+        with contextlib.closing(self._connect()) as conn:
+            # IMMEDIATE takes the write lock up front, so concurrent takes cannot interleave
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute("SELECT tokens, updated_at FROM token_buckets WHERE tenant = ?",
+                                   (tenant,)).fetchone()
+                tokens, updated_at = row if row else (capacity, now)
+                tokens, retry_after = _take(tokens, updated_at, cost, capacity, rate, now)
+                conn.execute("INSERT OR REPLACE INTO token_buckets (tenant, tokens, updated_at) VALUES (?, ?, ?)",
+                             (tenant, tokens, now))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return retry_after
+
+
+class FairScheduler:
+    """Token-bucket rate limits plus weighted fair queuing of analysis slots
+
+    Queuing is self-clocked fair queuing: a request's finish tag is its tenant's
+    previous tag (or the current virtual time, if later) plus cost / weight, and free
+    slots go to the smallest tag. Tenants therefore share the slots in proportion to
+    their weights, measured in estimated processing seconds rather than requests.
+    """
+
+    def __init__(self, slots, rate_per_sec=0.0, burst=0.0, weights=None, buckets=None):
+        self.slots = slots
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst or rate_per_sec * 60.0
+        self.weights = weights or {}
+        _check_weights(self.weights)
+        self.buckets = buckets or MemoryBuckets()
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish = {}
+        self._active = 0
+
+    def check_rate(self, tenant, cost):
+        """Charge cost to the tenant's bucket; returns 0 if admitted, else seconds to wait"""
+        if self.rate_per_sec <= 0:
+            return 0.0
+        return self.buckets.take(tenant, cost, self.burst, self.rate_per_sec)
+
+    def _dispatch(self):
+        while self._active < self.slots and self._queue:
+            finish, _, entry = heapq.heappop(self._queue)
+            entry["dispatched"] = True
+            self._active += 1
+            self._virtual_time = max(self._virtual_time, finish)
+        if not self._queue:
+            # Idle tenants fall behind the virtual clock; forget them
+            self._last_finish = {t: f for t, f in self._last_finish.items() if f > self._virtual_time}
+        self._cond.notify_all()
+
+    def _withdraw(self, entry):
+        """Drop a request that stopped waiting, as though its tenant had never queued it
+
+        The tenant's later queued requests are re-tagged from the tenant's clock before
+        it, and so is the tenant's last finish tag. Otherwise every timeout would push
+        the tenant's future requests further back.
+        """
+        tenant = entry["tenant"]
+        others = [item for item in self._queue if item[2] is not entry]
+        later = sorted((item for item in others if item[2]["tenant"] == tenant and item[1] > entry["seq"]),
+                       key=lambda item: item[1])
+        finish, retagged = entry["start"], {}
+        for _, seq, other in later:
+            other["start"] = max(other["floor"], finish)
+            finish = other["start"] + other["share"]
+            retagged[seq] = finish
+        self._queue = [(retagged.get(seq, f), seq, other) for f, seq, other in others]
+        heapq.heapify(self._queue)
+        self._last_finish[tenant] = finish
+
+    def acquire(self, tenant, cost, timeout):
+        """Wait for an analysis slot in fair-queue order; StageTimeout after timeout seconds"""
+        expires = time.monotonic() + timeout
+        with self._cond:
+            entry = {"tenant": tenant, "share": cost / self.weights.get(tenant, 1.0), "seq": next(self._seq),
+                     "floor": self._virtual_time, "dispatched": False}
+            entry["start"] = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+            finish = entry["start"] + entry["share"]
+            self._last_finish[tenant] = finish
+            heapq.heappush(self._queue, (finish, entry["seq"], entry))
+            self._dispatch()
+            try:
+                while not entry["dispatched"]:
+                    remaining = expires - time.monotonic()
+                    if remaining <= 0:
+                        raise StageTimeout("queue", timeout)
+                    self._cond.wait(remaining)
+            except BaseException:
+                # Timed out or interrupted: give back the slot or the place in the queue
+                if entry["dispatched"]:
+                    self._active -= 1
+                    self._dispatch()
+                else:
+                    self._withdraw(entry)
+                raise
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._dispatch()
+
+    def stats(self):
+        with self._cond:
+            return {"slots": self.slots, "active": self._active, "queued": len(self._queue)}
+
+
+SCHEDULER = FairScheduler(
+    SCHEDULER_CONFIG["slots"],
+    rate_per_sec=SCHEDULER_CONFIG["rate_cost_sec_per_min"] / 60.0,
+    burst=SCHEDULER_CONFIG["burst_cost_sec"],
+    weights=SCHEDULER_CONFIG["weights"],
+    buckets=SQLiteBuckets(SCHEDULER_CONFIG["db_path"]) if SCHEDULER_CONFIG["db_path"] else None,
+)
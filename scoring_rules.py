@@ -0,0 +1,297 @@
+import ast
+import json
+import os
+import threading
+
+import numpy as np
+
+# Declarative scoring: scoring_rules.json holds the thresholds, points, messages and
+# weights; each scorer compiles its rule expressions once and evaluates them on either
+# a single metrics dict or a batch of metric columns (np.select over the cases).
+SCORING_RULES_PATH = os.environ.get(
+    "SCORING_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_rules.json")
+)
+
+_COMPARE_OPS = {
+    ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater,
+    ast.GtE: np.greater_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+_BINARY_OPS = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide}
+
+
+def _truth(value):
+    """Element-wise truth of a rule value; missing (NaN) metrics are false"""
+    value = np.asarray(value)
+    if value.dtype.kind == "f":
+        return (value != 0) & ~np.isnan(value)
+    return value.astype(bool)
+
+
+def _count(*conditions):
+    return sum(_truth(c).astype(np.int64) for c in conditions)
+
+
+def _present(value):
+    value = np.asarray(value, dtype=np.float64)
+    return ~np.isnan(value)
+
+
+_FUNCTIONS = {"count": _count, "present": _present}
+
+
+def compile_expression(source):
+    """Compile a rule expression into fn(env) that works on scalars and NumPy columns
+
+    Supported: names (metrics, derived values and the running 'score'), numbers,
+    arithmetic, chained comparisons, and/or/not, and the count()/present() helpers.
+    Names missing from env evaluate to NaN, so comparisons on them are false.
+    """
+    def build(node):
+        if isinstance(node, ast.Expression):
+            return build(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, bool)):
+            value = node.value
+            return lambda env: value
+        if isinstance(node, ast.Name):
+            name = node.id
+            return lambda env: env.get(name, np.nan)
+        if isinstance(node, ast.BoolOp):
+            parts = [build(v) for v in node.values]
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            return lambda env: combine.reduce([_truth(p(env)) for p in parts])
+        if isinstance(node, ast.UnaryOp):
+            operand = build(node.operand)
+            if isinstance(node.op, ast.Not):
+                return lambda env: np.logical_not(_truth(operand(env)))
+            if isinstance(node.op, ast.USub):
+                return lambda env: np.negative(operand(env))
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            op, left, right = _BINARY_OPS[type(node.op)], build(node.left), build(node.right)
+            return lambda env: op(left(env), right(env))
+        if isinstance(node, ast.Compare) and all(type(o) in _COMPARE_OPS for o in node.ops):
+            operands = [build(node.left)] + [build(c) for c in node.comparators]
+            ops = [_COMPARE_OPS[type(o)] for o in node.ops]
+
+            def compare(env):
+                values = [f(env) for f in operands]
+                result = ops[0](values[0], values[1])
+                for i in range(1, len(ops)):
+                    result = np.logical_and(result, ops[i](values[i], values[i + 1]))
+                return result
+            return compare
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                and node.func.id in _FUNCTIONS and not node.keywords):
+            fn, args = _FUNCTIONS[node.func.id], [build(a) for a in node.args]
+            return lambda env: fn(*[a(env) for a in args])
+        raise ValueError(f"Unsupported syntax in scoring rule {source!r}: {ast.dump(node)}")
+
+    return build(ast.parse(source, mode="eval"))
+
+
+def expression_names(source):
+    """Metric names a rule expression reads (helper function names excluded)"""
+    tree = ast.parse(source, mode="eval")
+    called = {node.func.id for node in ast.walk(tree)
+              if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)}
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)} - called
+
+
+class RuleScorer:
+    """Base score plus ordered groups of first-match cases, then a clamp
+
+    Each group is an if/elif chain: the first case whose 'when' holds adds its
+    'points', applies its 'max' cap and records its 'message'. A case without
+    'when' is the else branch. A group's own 'when' guards the whole chain.
+    metrics is the set of input metric names the rules read.
+    """
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.base = spec.get("base", 0)
+        derive = spec.get("derive", {})
+        self.derive = [(key, compile_expression(expr)) for key, expr in derive.items()]
+        sources = list(derive.values())
+        self.groups = []
+        for group in spec["groups"]:
+            cases = []
+            for case in group["cases"]:
+                when = case.get("when")
+                if when:
+                    sources.append(when)
+                cases.append({
+                    "when": compile_expression(when) if when else None,
+                    "points": case.get("points", 0),
+                    "max": case.get("max"),
+                    "message": case.get("message"),
+                })
+            guard = group.get("when")
+            if guard:
+                sources.append(guard)
+            self.groups.append({
+                "name": group["name"],
+                "when": compile_expression(guard) if guard else None,
+                "cases": cases,
+            })
+        self.clamp = spec.get("clamp", [None, None])
+        self.metrics = set().union(*map(expression_names, sources)) - set(derive) - {"score"}
+
+    def _clamp(self, score):
+        low, high = self.clamp
+        if low is not None:
+            score = max(low, score)
+        if high is not None:
+            score = min(high, score)
+        return score
+
+    def score(self, metrics):
+        """Score one metrics dict; returns (score, messages)"""
+        env = {key: np.nan if value is None else value for key, value in metrics.items()}
+        for key, expr in self.derive:
+            env[key] = expr(env)
+        score = self.base
+        messages = []
+        for group in self.groups:
+            env["score"] = score
+            if group["when"] is not None and not bool(_truth(group["when"](env))):
+                continue
+            for case in group["cases"]:
+                if case["when"] is None or bool(_truth(case["when"](env))):
+                    score += case["points"]
+                    if case["max"] is not None:
+                        score = min(score, case["max"])
+                    if case["message"]:
+                        messages.append(case["message"])
+                    break
+        return self._clamp(score), messages
+
+    def score_batch(self, columns):
+        """Score a batch of metric columns (dict of equal-length arrays)
+
+        Returns {"score": float array, "cases": {group name: matched case index,
+        -1 where no case matched}}; messages() turns one row back into text.
+        """
+        env = {key: np.asarray(value) for key, value in columns.items()}
+        n = len(next(iter(env.values()))) if env else 0
+        for key, expr in self.derive:
+            env[key] = np.broadcast_to(expr(env), (n,))
+        score = np.full(n, self.base, dtype=np.float64)
+        chosen = {}
+        for group in self.groups:
+            env["score"] = score
+            conditions = [np.ones(n, dtype=bool) if case["when"] is None
+                          else np.broadcast_to(_truth(case["when"](env)), (n,))
+                          for case in group["cases"]]
+            index = np.select(conditions, np.arange(len(conditions)), default=-1)
+            if group["when"] is not None:
+                index = np.where(np.broadcast_to(_truth(group["when"](env)), (n,)), index, -1)
+            points = np.array([case["points"] for case in group["cases"]] + [0], dtype=np.float64)
+            caps = np.array([np.inf if case["max"] is None else case["max"]
+                             for case in group["cases"]] + [np.inf])
+            score = np.minimum(score + points[index], caps[index])
+            chosen[group["name"]] = index
+        low, high = self.clamp
+        score = np.clip(score, -np.inf if low is None else low, np.inf if high is None else high)
+        return {"score": score, "cases": chosen}
+
+    def messages(self, batch_result, row):
+        """Messages for one row of a score_batch() result, in rule order"""
+        messages = []
+        for group in self.groups:
+            index = int(batch_result["cases"][group["name"]][row])
+            if index >= 0 and group["cases"][index]["message"]:
+                messages.append(group["cases"][index]["message"])
+        return messages
+
+
+class WeightedScorer:
+    """Weighted sum of component scores, capped and rounded"""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.weights = dict(spec["weights"])
+        self.max = spec.get("max", 100)
+        self.digits = spec.get("round", 1)
+
+    def score(self, components):
+        total = 0
+        for key, weight in self.weights.items():
+            total += components[key] * weight
+        return round(min(self.max, total), self.digits)
+
+    def score_batch(self, columns):
+        total = np.zeros(len(next(iter(columns.values()))), dtype=np.float64)
+        for key, weight in self.weights.items():
+            total += np.asarray(columns[key], dtype=np.float64) * weight
+        return np.round(np.minimum(self.max, total), self.digits)
+
+
+class PenaltyScorer:
+    """Base score minus fixed points per counted error, clamped and rounded"""
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.base = spec.get("base", 100.0)
+        self.penalties = dict(spec["penalties"])
+        self.clamp = spec.get("clamp", [0, 100])
+        self.digits = spec.get("round", 1)
+
+    def deductions(self, counts):
+        return {key: weight * counts[key] for key, weight in self.penalties.items()}
+
+    def score(self, counts):
+        total = self.base
+        for deduction in self.deductions(counts).values():
+            total -= deduction
+        return round(max(self.clamp[0], min(self.clamp[1], total)), self.digits)
+
+    def score_batch(self, columns):
+        total = np.full(len(next(iter(columns.values()))), self.base, dtype=np.float64)
+        for key, weight in self.penalties.items():
+            total -= weight * np.asarray(columns[key], dtype=np.float64)
+        return np.round(np.clip(total, self.clamp[0], self.clamp[1]), self.digits)
+
+
+def load_rules(path=None):
+    """Compile every scorer in a rules file
+
+    Sections with 'weights' are weighted sums, sections with 'penalties' deduct
+    points per error, and all others are rule groups.
+    """
+    with open(path or SCORING_RULES_PATH) as f:
+        spec = json.load(f)
+    scorers = {}
+    for name, section in spec.items():
+        if "weights" in section:
+            scorers[name] = WeightedScorer(name, section)
+        elif "penalties" in section:
+            scorers[name] = PenaltyScorer(name, section)
+        else:
+            scorers[name] = RuleScorer(name, section)
+    return scorers
+
+
+_RULES = {"path": None, "mtime": None, "scorers": None}
+_RULES_LOCK = threading.Lock()
+
+
+def get_scorer(name):
+    """Compiled scorer from the active rules file, recompiled when the file changes
+
+    If a changed file fails to load (bad JSON or rule syntax), the error is logged and
+    the last good rules stay active; the file is retried when it changes again.
+    """
+    path = SCORING_RULES_PATH
+    mtime = os.path.getmtime(path)
+    with _RULES_LOCK:
+        if _RULES["path"] != path or _RULES["mtime"] != mtime:
+            try:
+                scorers = load_rules(path)
+            except (OSError, ValueError, KeyError, TypeError, SyntaxError) as e:
+                if _RULES["scorers"] is None:
+                    raise
+                print(f"Failed to reload scoring rules from {path}, keeping the previous rules: {e}")
+            else:
+                _RULES["scorers"] = scorers
+                print(f"Loaded scoring rules from {path}")
+            _RULES["path"], _RULES["mtime"] = path, mtime
+        return _RULES["scorers"][name]
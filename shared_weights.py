@@ -0,0 +1,115 @@
+import contextlib
+import hashlib
+import inspect
+import os
+import tempfile
+
+import torch
+import whisper
+from torch.overrides import TorchFunctionMode
+from whisper.model import ModelDimensions, Whisper
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Shared CPU weights: the first process to load a model writes its tensors once to a
+# local file; every process then memory-maps that file and points the model's
+# parameters at the mapping. The pages live in the OS page cache and are shared by
+# all workers, so each extra worker only adds its own activations to RSS.
+SHARED_WEIGHTS_CONFIG = {
+    "enabled": os.environ.get("WHISPER_SHARED_WEIGHTS", "0") == "1",
+    "cache_dir": os.environ.get("WHISPER_WEIGHTS_CACHE", os.path.join(tempfile.gettempdir(), "whisper-shared")),
+}
+_FORMAT_VERSION = 1
+
+
+def _supports_mmap():
+    # torch.load(mmap=True) and load_state_dict(assign=True) arrived in torch 2.1
+    return ("mmap" in inspect.signature(torch.load).parameters and
+            "assign" in inspect.signature(torch.nn.Module.load_state_dict).parameters)
+
+
+def shared_weights_path(name, cache_dir=None):
+    key = hashlib.sha1(f"{name}|{getattr(whisper, '__version__', '')}|{_FORMAT_VERSION}".encode()).hexdigest()[:10]
+    base = os.path.basename(name).replace(os.sep, "_")
+    return os.path.join(cache_dir or SHARED_WEIGHTS_CONFIG["cache_dir"], f"{base}-{key}.pt")
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Exclusive lock so concurrent workers write the shared file only once"""
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class _DenseMetaBuffers(TorchFunctionMode):
+    """Keeps meta tensors dense where a model would make them sparse
+
+    whisper stores its alignment heads as a sparse buffer, which the meta device
+    cannot hold; the loader replaces that buffer from the checkpoint anyway.
+    """
+
+    def __torch_function__(self, func, types, args=(), kwargs=None):
+        if func is torch.Tensor.to_sparse and args[0].is_meta:
+            return args[0]
+        return func(*args, **(kwargs or {}))
+
+
+def export_shared_weights(name, path):
+    """Load a whisper model normally and write the shareable weights file for it"""
+    model = whisper.load_model(name, device="cpu")
+    persistent = model.state_dict()
+    # Non-persistent buffers (causal mask, alignment heads) are not in the state dict
+    extra, sparse = {}, []
+    for buffer_name, buffer in model.named_buffers():
+        if buffer_name not in persistent:
+            if buffer.layout == torch.sparse_coo:
+                sparse.append(buffer_name)
+                buffer = buffer.to_dense()
+            extra[buffer_name] = buffer.contiguous()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save({"dims": model.dims.__dict__, "state_dict": persistent,
+                "extra_buffers": extra, "sparse_buffers": sparse}, tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Wrote shared weights for whisper '{name}' to {path}")
+
+
+def load_shared_model(name, device="cpu", cache_dir=None):
+    """ModelManager loader that maps CPU weights from a shared file
+
+    GPU models and torch versions without mmap loading fall back to whisper.load_model.
+    """
+    if device != "cpu" or not _supports_mmap():
+        return whisper.load_model(name, device=device)
+
+    path = shared_weights_path(name, cache_dir)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _file_lock(path):
+            if not os.path.exists(path):
+                export_shared_weights(name, path)
+
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    # Build the module without storage, then adopt the mapped tensors. Both modes are
+    # thread-local, so models built by other threads meanwhile are unaffected
+    with torch.device("meta"), _DenseMetaBuffers():
+        model = Whisper(ModelDimensions(**checkpoint["dims"]))
+    model.load_state_dict(checkpoint["state_dict"], assign=True)
+    for buffer_name, buffer in checkpoint["extra_buffers"].items():
+        module_name, _, leaf = buffer_name.rpartition(".")
+        module = model.get_submodule(module_name) if module_name else model
+        if buffer_name in checkpoint["sparse_buffers"]:
+            buffer = buffer.to_sparse()
+        module._buffers[leaf] = buffer
+    # Inference only: the mapping is copy-on-write, so nothing may write to the weights
+    model.requires_grad_(False)
+    return model.eval()
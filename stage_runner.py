@@ -0,0 +1,251 @@
+import atexit
+import importlib
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+from profiling import call_profiled, merge_worker_profile, worker_interval
+
+# Per-stage deadlines: decoding and transcription run in long-lived worker processes
+# that keep their models resident. A stage that overruns its deadline has its worker
+# (and the worker's whole process group, e.g. ffmpeg or long-file chunk workers) killed
+# and replaced, so a hung upload costs one stage timeout instead of a stuck Flask worker.
+STAGE_CONFIG = {
+    "request_timeout_sec": float(os.environ.get("ANALYSIS_TIMEOUT_SEC", "600")),
+    "timeouts_sec": {
+        "prescreen": float(os.environ.get("DECODE_TIMEOUT_SEC", "120")),
+        "decode": float(os.environ.get("DECODE_TIMEOUT_SEC", "120")),
+        "transcribe": float(os.environ.get("TRANSCRIBE_TIMEOUT_SEC", "300")),
+    },
+    "isolate": os.environ.get("STAGE_ISOLATION", "1") == "1",
+    # Each worker is a full interpreter with PyTorch and its own models: one fits a 2 GB instance
+    "workers": int(os.environ.get("STAGE_WORKERS", "1")),
+}
+
+
+def is_server_process():
+    """False in spawned worker processes, including while they re-import the parent's main module
+
+    Spawn imports the main module before parent_process() is set, but after the
+    child's process name is.
+    """
+    return multiprocessing.parent_process() is None and multiprocessing.current_process().name == "MainProcess"
+
+
+class StageTimeout(Exception):
+    """A pipeline stage did not finish before its deadline"""
+
+    def __init__(self, stage, seconds):
+        super().__init__(f"Stage '{stage}' did not finish within {seconds:.1f}s")
+        self.stage = stage
+        self.seconds = seconds
+
+
+class Deadline:
+    """Wall-clock budget shared by the stages of one request"""
+
+    def __init__(self, seconds=None):
+        self.seconds = STAGE_CONFIG["request_timeout_sec"] if seconds is None else seconds
+        self._expires = time.monotonic() + self.seconds
+
+    def remaining(self):
+        return max(0.0, self._expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0.0
+
+    def check(self, stage):
+        """Cooperative cancellation point: raise before starting stage if time is up"""
+        if self.expired():
+            raise StageTimeout(stage, self.seconds)
+
+    def stage_timeout(self, stage):
+        return min(STAGE_CONFIG["timeouts_sec"].get(stage, self.seconds), self.remaining())
+
+
+def _worker_main(conn, slot, initializer, initargs):
+    # Own process group, so killing the worker also kills ffmpeg and chunk workers it started
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    if initializer is not None:
+        initializer(slot, *initargs)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        module_name, fn_name, args, kwargs, profile_interval = task
+        try:
+            fn = getattr(importlib.import_module(module_name), fn_name)
+            if profile_interval is None:
+                conn.send(("ok", fn(*args, **kwargs), None))
+            else:
+                # The parent only sees itself waiting, so profiled requests are sampled here
+                conn.send(("ok",) + call_profiled(fn, args, kwargs, profile_interval))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}", None))
+
+
+class _StageWorker:
+    def __init__(self, slot, initializer=None, initargs=()):
+        ctx = multiprocessing.get_context("spawn")
+        self.slot = slot
+        self.conn, child_conn = ctx.Pipe()
+        # Not a daemon: workers may start their own process pools (long-file mode)
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, slot, initializer, initargs),
+                                   name=f"stage-worker-{slot}")
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except (ProcessLookupError, PermissionError):
+            self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+
+
+class StageWorkerPool:
+    """Fixed number of killable worker processes that run pipeline stages
+
+    Each worker holds a slot number in [0, size). A new worker calls
+    initializer(slot, *initargs) before taking tasks, and on_worker_exit(slot) is
+    called in the parent when a worker is killed or found dead. A killed worker is
+    replaced straight away, so its replacement initializes before the next task.
+    """
+
+    def __init__(self, size, initializer=None, initargs=(), on_worker_exit=None):
+        self.size = size
+        self.initializer = initializer
+        self.initargs = initargs
+        self.on_worker_exit = on_worker_exit
+        self._idle = queue.Queue()
+        self._free_slots = list(range(size))
+        self._lock = threading.Lock()
+        self._workers = []
+        self._closed = False
+
+    def _start_worker(self):
+        # Callers hold self._lock
+        worker = _StageWorker(self._free_slots.pop(0), self.initializer, self.initargs)
+        self._workers.append(worker)
+        return worker
+
+    def _acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._idle.empty() and self._free_slots:
+                    return self._start_worker()
+            try:
+                worker = self._idle.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return None
+            if worker.process.is_alive():
+                return worker
+            # Died while idle; drop it so a fresh worker can take its place
+            self._replace(worker)
+
+    def _replace(self, worker):
+        with self._lock:
+            if worker not in self._workers:
+                return
+            self._workers.remove(worker)
+            self._free_slots.append(worker.slot)
+            if self.on_worker_exit is not None:
+                self.on_worker_exit(worker.slot)
+            if not self._closed:
+                self._idle.put(self._start_worker())
+
+    def run(self, stage, fn, args, kwargs, timeout):
+        """Run fn(*args, **kwargs) in a worker; kill it and raise StageTimeout after timeout"""
+        start = time.monotonic()
+        worker = self._acquire(timeout)
+        if worker is None:
+            raise StageTimeout(stage, timeout)
+        try:
+            worker.conn.send((fn.__module__, fn.__name__, args, kwargs, worker_interval()))
+            if not worker.conn.poll(max(0.0, timeout - (time.monotonic() - start))):
+                print(f"Stage '{stage}' exceeded {timeout:.1f}s; killing worker {worker.process.pid}")
+                worker.kill()
+                self._replace(worker)
+                worker = None
+                raise StageTimeout(stage, timeout)
+            status, value, profile_data = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            # The worker died mid-task (e.g. killed by the OOM killer); start afresh next time
+            if worker is not None:
+                worker.kill()
+                self._replace(worker)
+                worker = None
+            raise RuntimeError(f"Stage '{stage}' worker exited unexpectedly: {e}")
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+        merge_worker_profile(stage, profile_data)
+        if status == "error":
+            raise RuntimeError(value)
+        return value
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._free_slots = list(range(self.size))
+            self._idle = queue.Queue()
+            self._closed = True
+        for worker in workers:
+            worker.close()
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+_POOL_OPTIONS = {}
+
+
+def configure_workers(initializer, initargs=(), on_worker_exit=None):
+    """Set the stage worker initializer (see StageWorkerPool); call before the first stage runs"""
+    with _POOL_LOCK:
+        if _POOL is not None:
+            raise RuntimeError("Stage workers are already running")
+        _POOL_OPTIONS.update(initializer=initializer, initargs=initargs, on_worker_exit=on_worker_exit)
+
+
+def _get_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = StageWorkerPool(STAGE_CONFIG["workers"], **_POOL_OPTIONS)
+            atexit.register(_POOL.shutdown)
+        return _POOL
+
+
+def run_stage(stage, fn, *args, deadline=None, **kwargs):
+    """Run one pipeline stage under the request deadline
+
+    With STAGE_ISOLATION on, fn runs in a killable worker process and must be a
+    module-level function with picklable arguments and result. With it off, fn runs
+    in-process and the deadline is only checked before the stage starts.
+    """
+    deadline = deadline or Deadline()
+    deadline.check(stage)
+    if not STAGE_CONFIG["isolate"]:
+        return fn(*args, **kwargs)
+    return _get_pool().run(stage, fn, args, kwargs, deadline.stage_timeout(stage))
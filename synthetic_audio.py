@@ -0,0 +1,36 @@
+import io
+import wave
+
+import numpy as np
+
+# Synthetic speech-like audio for the boot warm-up and the load generator: no
+# recordings need to ship with the service, and the clip is the same every time.
+SAMPLE_RATE = 16000
+
+
+def synth_speech_wav(duration_sec, seed=0):
+    """Speech-like WAV bytes: gliding harmonic voice in ~4 Hz syllables with pauses"""
+    rng = np.random.default_rng(seed)
+    n = int(duration_sec * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    # Pitch wanders between ~110 and ~190 Hz like an intonation contour
+    f0 = 150.0 + 40.0 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, 2 * np.pi))
+    phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = np.clip(np.sin(2 * np.pi * 4.0 * t), 0.0, None) ** 0.5
+    # Words of 0.6-1.8s separated by 0.2-0.8s pauses
+    envelope = np.zeros(n)
+    pos = int(0.3 * SAMPLE_RATE)
+    while pos < n:
+        word = int(rng.uniform(0.6, 1.8) * SAMPLE_RATE)
+        envelope[pos:pos + word] = 1.0
+        pos += word + int(rng.uniform(0.2, 0.8) * SAMPLE_RATE)
+    signal = voice * syllables * envelope * 0.25 + rng.normal(0.0, 0.002, n)
+    pcm = (np.clip(signal, -1.0, 1.0) * 32767).astype(np.int16)
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+    return buf.getvalue()
@@ -0,0 +1,169 @@
+import string
+
+import numpy as np
+import pytest
+
+import alignment
+from alignment import (
+    PreparedReference, _full_edits, _hirschberg_edits, normalize_text_for_compare, wer_alignment,
+)
+from audio_analysis import compare_transcript_to_reference, compare_transcripts_to_reference
+
+
+def _baseline_wer_alignment(ref_tokens, hyp_tokens):
+    """The float-cost alignment from before the vectorized DP, kept to pin its results"""
+    n, m = len(ref_tokens), len(hyp_tokens)
+    dp = [[0.0] * (m + 1) for _ in range(n + 1)]
+    op = [[None] * (m + 1) for _ in range(n + 1)]
+    for i in range(1, n + 1):
+        dp[i][0], op[i][0] = i * 1.2, 'D'
+    for j in range(1, m + 1):
+        dp[0][j], op[0][j] = j * 1.0, 'I'
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            if ref_tokens[i - 1] == hyp_tokens[j - 1]:
+                dp[i][j], op[i][j] = dp[i - 1][j - 1], 'E'
+            else:
+                dp[i][j], op[i][j] = min(((dp[i - 1][j - 1] + 1.2, 'S'), (dp[i][j - 1] + 1.0, 'I'),
+                                          (dp[i - 1][j] + 1.2, 'D')), key=lambda x: x[0])
+    i, j, edits = n, m, []
+    while i > 0 or j > 0:
+        cur = op[i][j]
+        edits.append((cur, ref_tokens[i - 1] if cur != 'I' else None, hyp_tokens[j - 1] if cur != 'D' else None))
+        i, j = i - (cur != 'I'), j - (cur != 'D')
+    edits.reverse()
+    return (dp[n][m] / max(1, float(n)), [(r, h) for t, r, h in edits if t == 'S'],
+            [h for t, r, h in edits if t == 'I'], [r for t, r, h in edits if t == 'D'])
+
+
+def _random_text(rng, vocab, max_words):
+    # A small vocabulary makes many alignments tie on cost
+    return " ".join(rng.choice(vocab, rng.integers(0, max_words + 1)))
+
+
+def _transcript_of(reference, rng, error_rate=0.15):
+    words = []
+    for word in reference.split():
+        roll = rng.random()
+        if roll < error_rate / 3:
+            continue
+        if roll < 2 * error_rate / 3:
+            words.append("uh")
+        elif roll < error_rate:
+            words.append(word[::-1])
+        words.append(word)
+    return " ".join(words)
+
+
+VOCAB = ["the", "a", "team", "plan", "we", "it"]
+PASSAGE = (
+    "In my last role I led a small team that rebuilt our reporting pipeline. We planned "
+    "the work in short iterations, and the most important thing was keeping everyone "
+    "informed about progress and risks. When a deadline slipped we said so early."
+)
+
+
+def _counts(alignment_result):
+    wer, subs, ins, dels = alignment_result
+    return len(subs), len(ins), len(dels)
+
+
+def test_tie_heavy_alignments_match_the_baseline():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        ref_tokens = normalize_text_for_compare(_random_text(rng, VOCAB, 25))
+        hyp_tokens = normalize_text_for_compare(_random_text(rng, VOCAB, 25))
+        result = PreparedReference(" ".join(ref_tokens)).align(" ".join(hyp_tokens))
+        # The integer-cost reference breaks ties the same way on every cell
+        assert result == wer_alignment(ref_tokens, hyp_tokens)
+        # Float costs can round a tie either way, which may pick other words but not other counts
+        baseline = _baseline_wer_alignment(ref_tokens, hyp_tokens)
+        assert result[0] == pytest.approx(baseline[0], abs=1e-9)
+        assert _counts(result) == _counts(baseline)
+
+
+def test_align_many_equals_aligning_one_by_one():
+    rng = np.random.default_rng(1)
+    prepared = PreparedReference(PASSAGE)
+    hypotheses = [_transcript_of(PASSAGE, rng) for _ in range(20)]
+    hypotheses += ["", PASSAGE, _random_text(rng, VOCAB, 80), PASSAGE.upper() + " " + PASSAGE]
+    assert prepared.align_many(hypotheses) == [prepared.align(h) for h in hypotheses]
+    for hypothesis, result in zip(hypotheses, prepared.align_many(hypotheses)):
+        baseline = _baseline_wer_alignment(prepared.tokens, normalize_text_for_compare(hypothesis))
+        assert result[0] == pytest.approx(baseline[0], abs=1e-9)
+        assert _counts(result) == _counts(baseline)
+
+
+def test_batches_are_split_to_bound_the_op_table(monkeypatch):
+    rng = np.random.default_rng(2)
+    prepared = PreparedReference(PASSAGE)
+    hypotheses = [_transcript_of(PASSAGE, rng, error_rate=rng.uniform(0, 0.5)) for _ in range(40)]
+    expected = [prepared.align(h) for h in hypotheses]
+
+    budget = 8 * (len(prepared.tokens) + 1) * 60
+    batches = []
+    align_batch = PreparedReference._align_batch
+
+    def recording(self, hyp_tokens):
+        batches.append(len(hyp_tokens) * (max(len(t) for t in hyp_tokens) + 1) * (len(self.tokens) + 1))
+        return align_batch(self, hyp_tokens)
+
+    monkeypatch.setattr(alignment, "MAX_BATCH_TABLE_BYTES", budget)
+    monkeypatch.setattr(PreparedReference, "_align_batch", recording)
+    assert prepared.align_many(hypotheses) == expected
+    assert len(batches) > 1 and max(batches) <= budget
+
+
+def test_long_hypotheses_in_a_batch_use_anchored_alignment(monkeypatch):
+    rng = np.random.default_rng(3)
+    prepared = PreparedReference(PASSAGE)
+    short = _transcript_of(PASSAGE, rng)
+    long = " ".join(_transcript_of(PASSAGE, rng) for _ in range(3))
+    cells = (len(prepared.tokens) + 1) * (len(normalize_text_for_compare(short)) + 1)
+    monkeypatch.setattr(alignment, "ANCHORED_ALIGNMENT_CELLS", cells)
+
+    results = prepared.align_many([short, long])
+    assert results[0] == prepared.align(short)
+    assert results[1] == prepared.align_anchored(long)
+
+
+def test_batched_similarity_reports_match_single_reports():
+    rng = np.random.default_rng(4)
+    transcripts = [_transcript_of(PASSAGE, rng) for _ in range(5)] + [PASSAGE.strip(string.punctuation)]
+    assert compare_transcripts_to_reference(PASSAGE, transcripts) == [
+        compare_transcript_to_reference(PASSAGE, t) for t in transcripts
+    ]
+
+
+@pytest.mark.parametrize("max_cells", [1, 12, 80])
+def test_linear_space_edits_match_the_full_table_on_ties(max_cells):
+    rng = np.random.default_rng(5)
+    for _ in range(200):
+        vocab_size = rng.integers(2, 6)
+        ref_ids = rng.integers(0, vocab_size, rng.integers(0, 40)).astype(np.int32)
+        hyp_ids = rng.integers(0, vocab_size, rng.integers(0, 40)).astype(np.int32)
+        ref_tokens = [f"w{i}" for i in ref_ids]
+        hyp_tokens = [f"w{i}" for i in hyp_ids]
+        edits = _hirschberg_edits(ref_ids, hyp_ids, ref_tokens, hyp_tokens, max_cells)
+        assert edits == _full_edits(ref_ids, hyp_ids, ref_tokens, hyp_tokens)
+
+
+def test_anchored_alignment_without_anchors_matches_the_full_table():
+    rng = np.random.default_rng(6)
+    for _ in range(100):
+        ref_tokens = normalize_text_for_compare(_random_text(rng, VOCAB, 60))
+        hyp_tokens = normalize_text_for_compare(_random_text(rng, VOCAB, 60))
+        prepared = PreparedReference(" ".join(ref_tokens))
+        # No 100-gram is shared, so the whole text is one gap split in linear space
+        result = prepared.align_anchored(hyp_tokens, ngram=100, max_gap_cells=30)
+        assert result == wer_alignment(ref_tokens, hyp_tokens)
+
+
+def test_anchored_alignment_of_transcripts_matches_the_full_table():
+    rng = np.random.default_rng(7)
+    reference = " ".join([PASSAGE] + [f"filler{i} word{i % 7}" for i in range(80)])
+    prepared = PreparedReference(reference)
+    for _ in range(20):
+        hypothesis = _transcript_of(reference, rng, error_rate=rng.uniform(0, 0.4))
+        hyp_tokens = normalize_text_for_compare(hypothesis)
+        assert prepared.align_anchored(hypothesis, max_gap_cells=50) == wer_alignment(prepared.tokens, hyp_tokens)
@@ -0,0 +1,113 @@
+import tracemalloc
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+
+import audio_analysis
+from audio_analysis import _audio_to_mono_float32, _join_turns, _read_window, transcribe_speaker
+
+HOUR_SEC = 3600
+SAMPLE_RATE = 16000
+
+
+def _segment(samples, channels):
+    """AudioSegment over interleaved int16 samples"""
+    return AudioSegment(samples.astype(np.int16).tobytes(), frame_rate=SAMPLE_RATE,
+                        sample_width=2, channels=channels)
+
+
+def test_mono_float32_matches_reference_conversion():
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-32768, 32767, size=(SAMPLE_RATE, 2))
+    audio = _segment(samples, channels=2)
+    expected = samples.mean(axis=1).astype(np.float32)
+    np.testing.assert_allclose(_audio_to_mono_float32(audio), expected, rtol=1e-6, atol=1e-3)
+
+
+def test_hour_long_stereo_peak_memory_is_one_output_buffer():
+    # Hour-long stereo 16-bit input: 230MB of raw frames, 230MB of float32 output
+    n = HOUR_SEC * SAMPLE_RATE
+    t = np.arange(n, dtype=np.float32) / SAMPLE_RATE
+    tone = (np.sin(2 * np.pi * 220.0 * t) * 8000).astype(np.int16)
+    del t
+    audio = _segment(np.repeat(tone, 2), channels=2)
+    del tone
+    output_bytes = n * np.dtype(np.float32).itemsize
+
+    tracemalloc.start()
+    try:
+        samples = _audio_to_mono_float32(audio)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert samples.shape == (n,) and samples.dtype == np.float32
+    # The old path (int64 array, float64 mean, float32 copy, normalized copy) peaked
+    # at several times the output; the raw-buffer path allocates the output once
+    assert peak < output_bytes * 1.1, f"peak {peak / 1e6:.0f}MB for a {output_bytes / 1e6:.0f}MB output"
+
+
+def test_hour_long_mono_peak_memory_is_one_output_buffer():
+    n = HOUR_SEC * SAMPLE_RATE
+    audio = _segment(np.zeros(n, dtype=np.int16), channels=1)
+    output_bytes = n * np.dtype(np.float32).itemsize
+
+    tracemalloc.start()
+    try:
+        samples = _audio_to_mono_float32(audio)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert samples.shape == (n,)
+    assert peak < output_bytes * 1.1
+
+
+def test_wav_window_reads_only_the_requested_frames(tmp_path):
+    samples = np.arange(4 * SAMPLE_RATE * 2, dtype=np.int64).reshape(-1, 2) % 30000
+    path = tmp_path / "clip.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.astype(np.int16).tobytes())
+
+    clip = _read_window(str(path), 1.5, 2.0)
+    assert (clip.frame_rate, clip.channels, clip.sample_width) == (SAMPLE_RATE, 2, 2)
+    expected = samples[int(1.5 * SAMPLE_RATE):int(3.5 * SAMPLE_RATE)].astype(np.int16)
+    assert clip.raw_data == expected.tobytes()
+    # A window running past the end is cut short, not padded
+    assert len(_read_window(str(path), 3.0, 5.0)) == 1000
+
+
+def test_speaker_turns_are_joined_frame_exactly():
+    samples = np.arange(600 * SAMPLE_RATE * 2, dtype=np.int64).reshape(-1, 2) % 30000
+    audio = _segment(samples.ravel(), channels=2)
+    # A ten-minute recording with a thousand short turns
+    turns = [{"start_sec": i * 0.6, "end_sec": i * 0.6 + 0.25} for i in range(1000)]
+
+    speech = _join_turns(audio, turns)
+    expected = np.concatenate([samples[int(t["start_sec"] * SAMPLE_RATE):int(t["end_sec"] * SAMPLE_RATE)]
+                               for t in turns])
+    assert speech.raw_data == expected.astype(np.int16).tobytes()
+    assert (speech.frame_rate, speech.channels) == (SAMPLE_RATE, 2)
+
+
+def test_speaker_transcription_rereads_its_turns_from_the_upload(tmp_path, monkeypatch):
+    samples = (np.sin(np.arange(10 * SAMPLE_RATE) * 0.05) * 8000).astype(np.int16)
+    path = tmp_path / "call.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+    received = []
+    monkeypatch.setattr(audio_analysis, "transcribe_audio",
+                        lambda audio, long_file=False: received.append((audio, long_file)) or "text")
+
+    assert transcribe_speaker(str(path), [[1.0, 3.0], [5.0, 6.5]], long_file=True) == "text"
+    audio, long_file = received[0]
+    expected = np.concatenate([samples[SAMPLE_RATE:3 * SAMPLE_RATE], samples[5 * SAMPLE_RATE:int(6.5 * SAMPLE_RATE)]])
+    np.testing.assert_allclose(audio, expected / 32768.0, atol=1e-6)
+    assert audio.dtype == np.float32 and long_file
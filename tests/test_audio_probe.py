@@ -0,0 +1,18 @@
+from audio_probe import ADMISSION_CONFIG, evaluate_admission
+
+
+def test_long_uploads_are_routed_not_rejected_by_default():
+    decision = evaluate_admission({"duration_sec": 3600.0})
+    assert (decision["action"], decision["route"]) == ("accept", "long")
+
+
+def test_uploads_over_a_configured_limit_are_rejected(monkeypatch):
+    monkeypatch.setitem(ADMISSION_CONFIG, "max_duration_sec", 900.0)
+    assert evaluate_admission({"duration_sec": 901.0})["action"] == "reject"
+
+
+def test_fallback_duration_is_used_when_the_probe_finds_nothing(monkeypatch):
+    monkeypatch.setitem(ADMISSION_CONFIG, "max_duration_sec", 900.0)
+    assert evaluate_admission(None, duration_sec=1200.0)["action"] == "reject"
+    assert evaluate_admission(None, duration_sec=600.0)["route"] == "long"
+    assert evaluate_admission(None)["reason"] == "duration unknown"
@@ -0,0 +1,22 @@
+import pytest
+
+from audio_analysis import analyze_grammar_advanced, analyze_professionalism
+from corpus import EMPTY_TEXT_METRICS, records_to_columns, rescore
+
+
+def test_records_without_text_metrics_score_like_an_empty_transcript():
+    columns = records_to_columns(["a.wav"], [{"fluency": {"duration_sec": 30.0}}])
+    scores = rescore(columns)
+    assert scores["professionalism"][0] == analyze_professionalism("")["score"]
+    assert scores["grammar"][0] > 0
+
+
+def test_empty_text_metrics_match_the_live_analysis():
+    assert analyze_professionalism("")["metrics"] == EMPTY_TEXT_METRICS["professionalism"]
+    try:
+        grammar = analyze_grammar_advanced("")
+    except Exception as e:  # TextBlob corpora not downloaded
+        pytest.skip(f"TextBlob unavailable: {e}")
+    assert grammar["metrics"] == EMPTY_TEXT_METRICS["grammar"]
+    columns = records_to_columns(["a.wav"], [{"fluency": {"duration_sec": 30.0}}])
+    assert rescore(columns)["grammar"][0] == grammar["score"]
@@ -0,0 +1,99 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+from diarization import diarize
+from synthetic_audio import SAMPLE_RATE, synth_speech_wav
+
+# Formants (Hz) of a few vowels; each syllable picks one, so the spectrum keeps changing
+VOWELS = [(730, 1090, 2440), (270, 2290, 3010), (530, 1840, 2480), (570, 840, 2410), (300, 870, 2240)]
+
+
+def _voice(f0, formant_scale, duration_sec, seed):
+    """Harmonic voice speaking random vowels in 0.12-0.3s syllables with short pauses"""
+    rng = np.random.default_rng(seed)
+    n = int(duration_sec * SAMPLE_RATE)
+    out = np.zeros(n, dtype=np.float32)
+    pos = 0
+    while pos < n:
+        if rng.random() < 0.15:
+            pos += int(rng.uniform(0.1, 0.5) * SAMPLE_RATE)
+            continue
+        length = min(int(rng.uniform(0.12, 0.3) * SAMPLE_RATE), n - pos)
+        t = np.arange(length) / SAMPLE_RATE
+        formants = [f * formant_scale for f in VOWELS[rng.integers(len(VOWELS))]]
+        pitch = f0 * rng.uniform(0.85, 1.2) * (1 + 0.08 * np.sin(2 * np.pi * rng.uniform(1, 4) * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+        syllable = sum(
+            sum(np.exp(-((k * f0 - f) / (80 + 0.05 * f)) ** 2) for f in formants) * np.sin(k * phase)
+            for k in range(1, int(7000 / (f0 * 1.3)))
+        )
+        envelope = np.abs(np.sin(np.pi * np.arange(length) / max(length - 1, 1))) ** 0.5
+        out[pos:pos + length] = syllable * envelope * rng.uniform(0.4, 1.0) * 3000
+        pos += length
+    return out + rng.normal(0, 30, n).astype(np.float32)
+
+
+def _steady_voice(f0, formants, duration_sec, seed):
+    """Harmonic voice holding one vowel, in 4 Hz syllables"""
+    t = np.arange(int(duration_sec * SAMPLE_RATE)) / SAMPLE_RATE
+    phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.05 * np.sin(2 * np.pi * 3 * t))) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) * sum(np.exp(-((k * f0 - f) / 150) ** 2) for f in formants)
+                for k in range(1, 40))
+    syllables = np.sin(2 * np.pi * 4 * t) > -0.5
+    noise = np.random.default_rng(seed).normal(0, 50, len(t))
+    return (voice * syllables * 3000 + noise).astype(np.float32)
+
+
+def _low(duration_sec, seed=0):
+    return _steady_voice(120.0, (700, 1200, 2600), duration_sec, seed)
+
+
+def _high(duration_sec, seed=0):
+    return _steady_voice(220.0, (400, 2000, 3000), duration_sec, seed)
+
+
+def _speakers(turns):
+    return {t["speaker"] for t in turns}
+
+
+@pytest.mark.parametrize("duration_sec", [8, 30, 120])
+def test_one_varied_voice_is_one_speaker(duration_sec):
+    turns = diarize(_voice(115.0, 1.0, duration_sec, seed=duration_sec), SAMPLE_RATE)
+    assert _speakers(turns) == {"speaker_1"}
+    assert turns[0]["start_sec"] == 0.0 and turns[-1]["end_sec"] == duration_sec
+
+
+@pytest.mark.parametrize("duration_sec", [8, 30, 120])
+def test_one_steady_voice_is_one_speaker(duration_sec):
+    assert _speakers(diarize(_high(duration_sec, seed=duration_sec), SAMPLE_RATE)) == {"speaker_1"}
+
+
+def test_synthetic_warmup_clip_is_one_speaker():
+    with wave.open(io.BytesIO(synth_speech_wav(60.0))) as f:
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).astype(np.float32)
+    assert _speakers(diarize(samples, SAMPLE_RATE)) == {"speaker_1"}
+
+
+def test_two_voices_taking_turns_are_separated():
+    durations = [12, 8, 15, 20, 5, 10]
+    parts = [(_low if i % 2 == 0 else _high)(sec, seed=i) for i, sec in enumerate(durations)]
+    turns = diarize(np.concatenate(parts), SAMPLE_RATE)
+
+    bounds = np.cumsum([0] + durations)
+    assert [(t["start_sec"], t["end_sec"]) for t in turns] == list(zip(bounds[:-1], bounds[1:]))
+    # The high voice speaks 38s of the 70s and is numbered first
+    assert [t["speaker"] for t in turns] == ["speaker_2", "speaker_1"] * 3
+
+
+def test_two_single_turns_are_separated():
+    turns = diarize(np.concatenate([_low(10), _high(10, seed=1)]), SAMPLE_RATE)
+    assert [(t["speaker"], t["start_sec"], t["end_sec"]) for t in turns] == [
+        ("speaker_1", 0.0, 10.0), ("speaker_2", 10.0, 20.0)
+    ]
+
+
+def test_silence_has_no_turns():
+    assert diarize(np.zeros(5 * SAMPLE_RATE, dtype=np.float32), SAMPLE_RATE) == []
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from features import FEATURE_NAMES, SpectralFeatures
+
+SAMPLE_RATE = 16000
+
+
+def _tone(freq, duration_sec=1.0, harmonics=1):
+    t = np.arange(int(duration_sec * SAMPLE_RATE)) / SAMPLE_RATE
+    return sum(np.sin(2 * np.pi * k * freq * t) / k for k in range(1, harmonics + 1)).astype(np.float32)
+
+
+@pytest.mark.parametrize("freq", [100.0, 150.0, 220.0, 330.0])
+@pytest.mark.parametrize("harmonics", [1, 5])
+def test_pitch_of_a_steady_tone(freq, harmonics):
+    features = SpectralFeatures(_tone(freq, harmonics=harmonics), SAMPLE_RATE)
+    # Pitch comes from an integer autocorrelation lag: within one lag of the true period
+    lag_error = freq * freq / SAMPLE_RATE
+    np.testing.assert_allclose(features["pitch"], freq, atol=lag_error)
+    assert np.min(features["pitch_clarity"]) > 0.95
+
+
+def test_pitch_variation_of_a_gliding_tone_in_semitones():
+    # Pitch swings +-2 semitones around 150 Hz: a standard deviation of sqrt(2) semitones
+    t = np.arange(4 * SAMPLE_RATE) / SAMPLE_RATE
+    semitones = 2.0 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(150.0 * 2.0 ** (semitones / 12.0)) / SAMPLE_RATE
+    prosody = SpectralFeatures(np.sin(phase).astype(np.float32), SAMPLE_RATE).prosody()
+
+    assert prosody["voiced_ratio"] == 1.0
+    assert prosody["pitch_mean_hz"] == pytest.approx(150.0, rel=0.01)
+    assert prosody["pitch_variation"] == pytest.approx(np.sqrt(2.0), abs=0.05)
+
+
+@pytest.mark.parametrize("freq", [500.0, 1000.0, 2000.0])
+def test_zero_crossing_rate_of_a_tone(freq):
+    # A sine crosses zero twice per period
+    zcr = SpectralFeatures(_tone(freq), SAMPLE_RATE)["zcr"]
+    np.testing.assert_allclose(zcr, 2.0 * freq / SAMPLE_RATE, atol=1.5 / 400)
+
+
+def test_zero_crossing_rate_of_white_noise_is_one_half():
+    noise = np.random.default_rng(0).normal(size=SAMPLE_RATE).astype(np.float32)
+    assert np.mean(SpectralFeatures(noise, SAMPLE_RATE)["zcr"]) == pytest.approx(0.5, abs=0.01)
+
+
+def test_spectral_flux_is_zero_for_a_steady_tone_and_peaks_at_a_change():
+    half = SAMPLE_RATE // 2
+    signal = np.concatenate([_tone(300.0)[:half], _tone(1200.0)[half:]])
+    flux = SpectralFeatures(signal, SAMPLE_RATE)["spectral_flux"]
+
+    # Frames are 25ms with a 10ms hop: frames 48-50 straddle the change at 0.5s
+    assert np.max(flux[:47]) < 1e-6
+    assert np.max(flux[51:]) < 1e-6
+    assert 48 <= int(np.argmax(flux)) <= 50
+    assert np.max(flux) > 1.0
+
+
+def test_block_size_does_not_change_the_features():
+    signal = _tone(180.0, duration_sec=3.0, harmonics=3)
+    signal += np.random.default_rng(1).normal(0, 0.05, signal.size).astype(np.float32)
+    one_pass = SpectralFeatures(signal, SAMPLE_RATE)
+    blocked = SpectralFeatures(signal, SAMPLE_RATE, block_frames=7)
+    for name in FEATURE_NAMES:
+        np.testing.assert_allclose(blocked[name], one_pass[name], rtol=1e-5, atol=1e-6)
+
+
+def test_unknown_features_are_rejected():
+    with pytest.raises(ValueError):
+        SpectralFeatures(_tone(200.0), SAMPLE_RATE).compute("mfcc")
@@ -0,0 +1,17 @@
+from audio_analysis import _stitch_transcripts
+
+
+def test_words_repeated_at_a_boundary_are_kept_without_overlap():
+    # Chunks cut at pauses do not overlap: a repeated phrase was really spoken twice
+    texts = [" We need to go. We need to go", " We need to go now."]
+    assert _stitch_transcripts(texts) == " We need to go. We need to go We need to go now."
+
+
+def test_overlapping_chunks_drop_the_repeated_words():
+    texts = [" and then the meeting started", " The meeting started late."]
+    assert _stitch_transcripts(texts, max_overlap=3) == " and then the meeting started late."
+
+
+def test_deduplication_is_limited_to_the_overlap():
+    texts = [" one two three four", " one two three four five"]
+    assert _stitch_transcripts(texts, max_overlap=2) == " one two three four one two three four five"
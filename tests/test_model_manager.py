@@ -0,0 +1,187 @@
+import threading
+import time
+
+import pytest
+import torch
+
+from model_manager import ModelManager, SharedBudget
+
+MB = 1024 ** 2
+
+
+class FakeLoader:
+    """Loader returning small modules of a known size; counts loads per model"""
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.loads = []
+
+    def __call__(self, name, device="cpu"):
+        self.loads.append((name, device))
+        # float32 parameters: size_mb MB of weights
+        return torch.nn.Linear(self.sizes[name] * MB // 4, 1, bias=False)
+
+
+def _manager(sizes, **kwargs):
+    loader = FakeLoader(sizes)
+    # A simulated device budget: "cuda" is only a label, nothing touches a GPU
+    kwargs.setdefault("device", "cuda")
+    kwargs.setdefault("memory_budget", 100)
+    kwargs.setdefault("request_cost", 60)
+    return ModelManager(loader=loader, **kwargs), loader
+
+
+def test_models_load_once_and_stay_resident():
+    manager, loader = _manager({"tiny": 1})
+    first = manager.get_model("tiny")
+    with manager.using("tiny") as model:
+        assert model is first
+    assert loader.loads == [("tiny", "cuda")]
+    assert manager.resident() == [("tiny", "cuda")]
+
+
+def test_least_recently_used_unpinned_model_is_evicted_over_weights_budget():
+    manager, loader = _manager({"tiny": 1, "base": 2, "small": 2}, weights_budget=4 * MB, pinned={"tiny"})
+    manager.get_model("tiny")
+    manager.get_model("base")
+    manager.get_model("small")  # 5MB resident: base is the oldest unpinned model
+    assert set(manager.resident()) == {("tiny", "cuda"), ("small", "cuda")}
+    assert manager.stats["evictions"] == 1
+    manager.get_model("base")  # reloads, and now small is the oldest unpinned model
+    assert set(manager.resident()) == {("tiny", "cuda"), ("base", "cuda")}
+    assert loader.loads.count(("base", "cuda")) == 2
+
+
+def test_pinned_and_checked_out_models_are_never_evicted():
+    manager, _ = _manager({"tiny": 3, "base": 3, "small": 3}, weights_budget=4 * MB, pinned={"tiny"})
+    manager.get_model("tiny")
+    with manager.using("base"):
+        manager.get_model("small")  # over budget, but tiny is pinned and base is in use
+        assert set(manager.resident()) == {("tiny", "cuda"), ("base", "cuda"), ("small", "cuda")}
+    assert manager.stats["evictions"] == 0
+
+
+def test_models_are_checked_out_exclusively():
+    manager, loader = _manager({"tiny": 1})
+    holders = []
+    overlap = []
+
+    def decode():
+        with manager.using("tiny") as model:
+            holders.append(model)
+            overlap.append(len(holders))
+            time.sleep(0.02)
+            holders.remove(model)
+
+    threads = [threading.Thread(target=decode) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(overlap) == 1
+    assert len(loader.loads) == 1
+
+
+def test_extra_instances_are_loaded_for_concurrent_requests():
+    manager, loader = _manager({"tiny": 1}, max_instances=2)
+    barrier = threading.Barrier(2)
+
+    def decode():
+        with manager.using("tiny"):
+            barrier.wait(timeout=5)
+
+    threads = [threading.Thread(target=decode) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loader.loads) == 2
+
+
+def _run_concurrently(manager, count, hold_sec=0.1):
+    devices = []
+    active = [0]
+    peak = [0]
+    lock = threading.Lock()
+
+    def work(device, fp16):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(hold_sec)
+        with lock:
+            active[0] -= 1
+        devices.append(device)
+
+    threads = [threading.Thread(target=manager.run, args=(work,)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return devices, peak[0]
+
+
+@pytest.mark.parametrize("budget,expected_peak", [(100, 1), (200, 2)])
+def test_admission_limits_concurrent_device_requests_to_the_budget(budget, expected_peak):
+    manager, _ = _manager({}, memory_budget=budget, request_cost=60)
+    devices, peak = _run_concurrently(manager, 2)
+    assert devices == ["cuda", "cuda"]
+    assert peak == expected_peak
+
+
+def test_requests_not_admitted_in_time_run_on_cpu():
+    manager, _ = _manager({}, memory_budget=100, request_cost=60, admit_timeout=0.05)
+    devices, _ = _run_concurrently(manager, 2, hold_sec=0.3)
+    assert sorted(devices) == ["cpu", "cuda"]
+    assert manager.stats["budget_fallbacks"] == 1
+
+
+def test_out_of_memory_falls_back_to_cpu_and_releases_the_budget():
+    manager, _ = _manager({})
+
+    def work(device, fp16):
+        if device == "cuda":
+            raise RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")
+        return device
+
+    assert manager.run(work) == "cpu"
+    assert manager.stats["oom_fallbacks"] == 1
+    assert sum(manager._budget.in_use) == 0 and sum(manager._budget.active) == 0
+
+
+def test_managers_sharing_a_budget_admit_requests_together():
+    # Two worker processes' managers, each of which alone would admit a request
+    budget = SharedBudget(2)
+    first, _ = _manager({}, memory_budget=100, request_cost=60, admit_timeout=0.05)
+    second, _ = _manager({}, memory_budget=100, request_cost=60, admit_timeout=0.05)
+    first.share_budget(budget, 0)
+    second.share_budget(budget, 1)
+
+    assert first._admit(60)
+    assert not second._admit(60)
+    first._release(60)
+    assert second._admit(60)
+
+
+def test_a_dead_workers_share_of_the_budget_is_released():
+    budget = SharedBudget(2)
+    dead, _ = _manager({}, memory_budget=100, request_cost=60)
+    alive, _ = _manager({}, memory_budget=100, request_cost=60, admit_timeout=0.05)
+    dead.share_budget(budget, 0)
+    alive.share_budget(budget, 1)
+    assert dead._admit(60)
+
+    budget.release_slot(0)  # the parent replaced the killed worker
+    assert alive._admit(60)
+    assert list(budget.active) == [0, 1]
+
+
+def test_resident_weights_of_every_worker_are_published_to_the_budget():
+    budget = SharedBudget(2)
+    first, _ = _manager({"tiny": 1})
+    second, _ = _manager({"base": 2})
+    first.share_budget(budget, 0)
+    second.share_budget(budget, 1)
+    first.get_model("tiny")
+    second.get_model("base")
+    assert list(budget.weights) == [1 * MB, 2 * MB]
@@ -0,0 +1,41 @@
+import time
+
+from profiling import (
+    PROFILING_CONFIG, _profile_reason, call_profiled, debug_authorized, merge_worker_profile, profiled_request,
+    worker_interval,
+)
+
+
+def test_profile_header_is_ignored_without_a_debug_token(monkeypatch):
+    monkeypatch.setitem(PROFILING_CONFIG, "debug_token", "")
+    headers = {PROFILING_CONFIG["header"]: "true", "X-Debug-Token": ""}
+    assert not debug_authorized(headers)
+    assert _profile_reason(headers) is None
+
+
+def test_profile_header_needs_the_matching_debug_token(monkeypatch):
+    monkeypatch.setitem(PROFILING_CONFIG, "debug_token", "s3cret")
+    assert _profile_reason({PROFILING_CONFIG["header"]: "true"}) is None
+    assert _profile_reason({PROFILING_CONFIG["header"]: "true", "X-Debug-Token": "guess"}) is None
+    assert _profile_reason({PROFILING_CONFIG["header"]: "true", "X-Debug-Token": "s3cret"}) == "header"
+
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+    return "done"
+
+
+def test_stage_worker_samples_are_merged_into_the_request_profile(monkeypatch):
+    monkeypatch.setitem(PROFILING_CONFIG, "debug_token", "s3cret")
+    headers = {PROFILING_CONFIG["header"]: "true", "X-Debug-Token": "s3cret"}
+    with profiled_request("/speaking", headers) as profile:
+        # What a stage worker does for a profiled request, and what the parent merges
+        result, data = call_profiled(_busy, (0.1,), {}, worker_interval())
+        merge_worker_profile("decode", data)
+    assert result == "done"
+    assert "decode-worker" in [s["stage"] for s in profile.stages]
+    assert "decode-worker;" in profile.collapsed()
+    assert profile.summary()["samples"] >= data["samples"] > 0
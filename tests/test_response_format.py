@@ -0,0 +1,131 @@
+import gzip
+import json
+
+import pytest
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Response
+
+import response_format
+from response_format import (
+    COMPACT_JSON, COMPACT_MSGPACK, choose_encoding, compact_report, compress_response, encode_body,
+    message_table, negotiate_format,
+)
+
+needs_msgpack = pytest.mark.skipif(response_format.msgpack is None, reason="msgpack is not installed")
+
+REPORT = {
+    "transcription": "we planned the work in short iterations",
+    "fluency": {"score": 72, "analysis": ["Perfect match with the provided script", "Not a known message"]},
+    "similarity_analysis": {
+        "score": 90,
+        "summary": ["Perfect match with the provided script"],
+        "errors": {"substitutions": [{"from": "plan", "to": "planned"}], "insertions": ["uh"], "deletions": []},
+    },
+}
+
+
+def _encodings(header):
+    return parse_accept_header(header)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", "gzip"),
+    ("gzip, zstd;q=0.5", "gzip"),
+    ("zstd;q=0, gzip", "gzip"),
+    ("zstd, gzip", "zstd"),
+    ("gzip;q=0.8, zstd;q=0.8", "zstd"),
+    ("*", "zstd"),
+    ("*;q=0.5, gzip", "gzip"),
+    ("identity, gzip;q=0.5", None),
+    ("identity;q=0.5, gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("*;q=0", None),
+    ("br", None),
+    ("", None),
+])
+def test_encoding_follows_q_values(header, expected):
+    if response_format.zstandard is None and expected == "zstd":
+        expected = "gzip"
+    assert choose_encoding(_encodings(header)) == expected
+
+
+def test_gzip_is_chosen_without_zstandard(monkeypatch):
+    monkeypatch.setattr(response_format, "zstandard", None)
+    assert choose_encoding(_encodings("zstd, gzip;q=0.5")) == "gzip"
+    assert choose_encoding(_encodings("zstd")) is None
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("application/json", "json"),
+    ("*/*", "json"),
+    (COMPACT_JSON, "compact"),
+    pytest.param(COMPACT_MSGPACK, "msgpack", marks=needs_msgpack),
+    pytest.param("application/x-msgpack, application/json;q=0.5", "msgpack", marks=needs_msgpack),
+])
+def test_format_negotiation(header, expected):
+    assert negotiate_format(parse_accept_header(header, MIMEAccept)) == expected
+
+
+def test_format_query_overrides_the_accept_header():
+    assert negotiate_format(parse_accept_header("application/json", MIMEAccept), "msgpack") == "msgpack"
+
+
+def test_compact_report_uses_message_codes():
+    codes = {m: i for i, m in enumerate(message_table()["messages"])}
+    compact = compact_report(REPORT)
+    assert compact["fluency"]["analysis"] == [codes["Perfect match with the provided script"], "Not a known message"]
+    assert compact["similarity_analysis"] == {
+        "score": 90, "counts": [1, 1, 0], "substitutions": [["plan", "planned"]],
+        "insertions": ["uh"], "deletions": [], "analysis": [codes["Perfect match with the provided script"]],
+    }
+    assert compact["messages_version"] == message_table()["version"]
+
+
+@needs_msgpack
+def test_msgpack_body_holds_the_compact_report():
+    body, mimetype = encode_body(REPORT, "msgpack")
+    assert mimetype == COMPACT_MSGPACK
+    assert response_format.msgpack.unpackb(body, raw=False) == compact_report(REPORT)
+
+
+def test_compact_json_body_holds_the_compact_report():
+    body, mimetype = encode_body(REPORT, "compact")
+    assert mimetype == COMPACT_JSON
+    assert json.loads(body) == compact_report(REPORT)
+    assert len(body) < len(encode_body(REPORT, "json")[0])
+
+
+def _response(body=b"x" * 4096, etag="v1"):
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response
+
+
+def test_compressed_body_gets_a_weak_etag_and_vary():
+    response = compress_response(_response(), _encodings("gzip"))
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.get_data()) == b"x" * 4096
+    assert response.get_etag() == ("v1", True)
+    assert "Accept-Encoding" in response.vary
+
+
+def test_identity_body_keeps_its_strong_etag_and_still_varies():
+    response = compress_response(_response(), _encodings("identity"))
+    assert "Content-Encoding" not in response.headers
+    assert response.get_etag() == ("v1", False)
+    assert "Accept-Encoding" in response.vary
+
+
+def test_small_bodies_are_not_compressed():
+    response = compress_response(_response(b"{}"), _encodings("gzip"))
+    assert "Content-Encoding" not in response.headers
+    assert response.get_etag() == ("v1", False)
+
+
+def test_weak_etag_of_a_compressed_body_revalidates():
+    etag = compress_response(_response(), _encodings("gzip")).headers["ETag"]
+    assert etag == 'W/"v1"'
+    environ = EnvironBuilder(headers={"If-None-Match": etag, "Accept-Encoding": "gzip"}).get_environ()
+    assert _response().make_conditional(environ).status_code == 304
@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import (
+    SCHEDULER_CONFIG, FairScheduler, _parse_networks, _parse_weights, tenant_for, warn_on_untrusted_tenants,
+)
+from stage_runner import StageTimeout
+
+HEADER = SCHEDULER_CONFIG["tenant_header"]
+
+
+@pytest.mark.parametrize("spec", ["team-a=0", "team-a=2,team-b=-1"])
+def test_non_positive_weights_are_rejected(spec):
+    with pytest.raises(ValueError, match="greater than 0"):
+        _parse_weights(spec)
+
+
+def test_weights_parse_with_a_default_of_one():
+    assert _parse_weights("team-a=2, team-b") == {"team-a": 2.0, "team-b": 1.0}
+
+
+def test_scheduler_rejects_zero_weights():
+    with pytest.raises(ValueError):
+        FairScheduler(1, weights={"team-a": 0.0})
+
+
+def test_tenant_header_is_ignored_from_untrusted_clients(monkeypatch):
+    monkeypatch.setitem(SCHEDULER_CONFIG, "trusted_proxies", [])
+    assert tenant_for({HEADER: "team-a"}, "203.0.113.7") == "203.0.113.7"
+
+
+def test_tenant_header_is_used_from_trusted_proxies(monkeypatch):
+    monkeypatch.setitem(SCHEDULER_CONFIG, "trusted_proxies", _parse_networks("10.0.0.5, 10.1.0.0/16"))
+    assert tenant_for({HEADER: "team-a"}, "10.0.0.5") == "team-a"
+    assert tenant_for({HEADER: "team-b"}, "10.1.2.3") == "team-b"
+    assert tenant_for({}, "10.1.2.3") == "10.1.2.3"
+    assert tenant_for({HEADER: "team-a"}, "10.0.0.6") == "10.0.0.6"
+    assert tenant_for({HEADER: "team-a"}, None) == "anonymous"
+
+
+def _queue(scheduler, tenant, cost, order, timeout=5.0):
+    """Wait for a slot in a thread; appends the tenant to order once it gets one"""
+    queued = scheduler.stats()["queued"]
+
+    def wait():
+        try:
+            scheduler.acquire(tenant, cost, timeout)
+        except StageTimeout:
+            return
+        order.append(tenant)
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    while scheduler.stats()["queued"] == queued:
+        time.sleep(0.001)
+    return thread
+
+
+def _release_all(scheduler, threads, order):
+    for count in range(1, len(threads) + 1):
+        scheduler.release()
+        while len(order) < count:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+
+
+def test_slots_go_to_the_smallest_finish_tag():
+    scheduler, order = FairScheduler(1), []
+    scheduler.acquire("a", 10.0, 1.0)
+    threads = [_queue(scheduler, "a", 10.0, order), _queue(scheduler, "a", 10.0, order),
+               _queue(scheduler, "b", 15.0, order)]
+    _release_all(scheduler, threads, order)
+    assert order == ["a", "b", "a"]
+
+
+def test_timed_out_requests_do_not_push_back_their_tenant():
+    scheduler, order = FairScheduler(1), []
+    scheduler.acquire("a", 10.0, 1.0)
+    for _ in range(3):
+        with pytest.raises(StageTimeout):
+            scheduler.acquire("b", 10.0, 0.01)
+    assert scheduler.stats()["queued"] == 0
+
+    threads = [_queue(scheduler, "a", 10.0, order), _queue(scheduler, "b", 5.0, order)]
+    # b's abandoned requests no longer count: its tag (15) is ahead of a's (20)
+    _release_all(scheduler, threads, order)
+    assert order == ["b", "a"]
+
+
+def test_later_requests_move_up_when_an_earlier_one_times_out():
+    scheduler, order = FairScheduler(1), []
+    scheduler.acquire("a", 10.0, 1.0)
+    abandoned = _queue(scheduler, "b", 10.0, order, timeout=0.2)
+    threads = [_queue(scheduler, "b", 10.0, order), _queue(scheduler, "a", 15.0, order)]
+    abandoned.join()
+    assert scheduler.stats()["queued"] == 2
+
+    # b's remaining request is re-tagged 20, ahead of a's 25
+    _release_all(scheduler, threads, order)
+    assert order == ["b", "a"]
+
+
+def test_untrusted_tenants_warn_only_with_rate_limits(monkeypatch, capsys):
+    monkeypatch.setitem(SCHEDULER_CONFIG, "trusted_proxies", [])
+    monkeypatch.setitem(SCHEDULER_CONFIG, "rate_cost_sec_per_min", 0.0)
+    assert not warn_on_untrusted_tenants()
+
+    monkeypatch.setitem(SCHEDULER_CONFIG, "rate_cost_sec_per_min", 60.0)
+    assert warn_on_untrusted_tenants()
+    assert "TENANT_TRUSTED_PROXIES" in capsys.readouterr().out
+
+    monkeypatch.setitem(SCHEDULER_CONFIG, "trusted_proxies", _parse_networks("10.0.0.5"))
+    assert not warn_on_untrusted_tenants()
@@ -0,0 +1,301 @@
+import os
+
+import numpy as np
+from pydub import AudioSegment
+
+import audio_analysis
+import scoring_rules
+from scoring_rules import RuleScorer
+
+SAMPLE_RATE = 16000
+
+
+def _scorer(*whens):
+    return RuleScorer("fluency", {"derive": {"fast": "speech_rate > 2.5"},
+                                  "groups": [{"name": "g", "cases": [{"when": w, "points": 1} for w in whens]}]})
+
+
+def test_rule_scorer_lists_the_metrics_its_rules_read():
+    scorer = _scorer("fast and count(pause_count > 3, score > 50)", "present(pitch_variation)")
+    assert scorer.metrics == {"speech_rate", "pause_count", "pitch_variation"}
+
+
+def _tone(sec=3.0):
+    t = np.arange(int(sec * SAMPLE_RATE)) / SAMPLE_RATE
+    samples = (np.sin(2 * np.pi * 180.0 * t) * (np.sin(2 * np.pi * 2.0 * t) > 0) * 8000).astype(np.int16)
+    return AudioSegment(samples.tobytes(), frame_rate=SAMPLE_RATE, sample_width=2, channels=1)
+
+
+def test_prosody_is_only_computed_when_a_fluency_rule_reads_it(monkeypatch):
+    monkeypatch.setattr(audio_analysis, "get_scorer", lambda name: _scorer("speech_rate > 1"))
+    stats = audio_analysis.analyze_fluency_segment(_tone())
+    assert stats["pitch_variation"] is None and stats["voiced_ratio"] is None
+
+    monkeypatch.setattr(audio_analysis, "get_scorer", lambda name: _scorer("pitch_variation > 1"))
+    stats = audio_analysis.analyze_fluency_segment(_tone())
+    assert stats["voiced_ratio"] > 0
+    # Forced for raw-metric collection, whatever the active rules read
+    monkeypatch.setattr(audio_analysis, "get_scorer", lambda name: _scorer("speech_rate > 1"))
+    assert audio_analysis.analyze_fluency_segment(_tone(), prosody=True)["voiced_ratio"] > 0
+
+
+def test_a_broken_rules_file_keeps_the_last_good_rules(tmp_path, monkeypatch):
+    path = tmp_path / "rules.json"
+    path.write_text('{"fluency": {"base": 10, "groups": []}}')
+    monkeypatch.setattr(scoring_rules, "SCORING_RULES_PATH", str(path))
+    monkeypatch.setattr(scoring_rules, "_RULES", {"path": None, "mtime": None, "scorers": None})
+    assert scoring_rules.get_scorer("fluency").score({})[0] == 10
+
+    path.write_text('{"fluency": {"base": 20, "groups": [{"name": "g", "cases": [{"when": "x >"}]}]}}')
+    os.utime(path, (1, 1))
+    assert scoring_rules.get_scorer("fluency").score({})[0] == 10
+
+    path.write_text('{"fluency": {"base": 30, "groups": []}}')
+    os.utime(path, (2, 2))
+    assert scoring_rules.get_scorer("fluency").score({})[0] == 30
+
+
+# The hard-coded scoring functions the default scoring_rules.json replaced, restated
+# on their metrics (the text checks in grammar and professionalism feed these values)
+def _baseline_fluency(m):
+    score, messages = 0, []
+
+    def add(points, message):
+        nonlocal score
+        score += points
+        messages.append(message)
+
+    activity, rate, rhythm = m["speech_activity_ratio"], m["speech_rate"], m["rhythm_consistency"]
+    pauses, energy, duration, bursts = m["pause_frequency"], m["energy_variation"], m["duration_sec"], m["speech_bursts"]
+    if activity >= 0.7:
+        add(25, "Excellent speech activity - good use of speaking time")
+    elif activity >= 0.55:
+        add(22, "Good speech activity - reasonable speaking time")
+    elif activity >= 0.4:
+        add(17, "Moderate speech activity - some silence")
+    elif activity >= 0.25:
+        add(12, "Low speech activity - too much silence")
+    else:
+        add(6, "Very low speech activity - mostly silence")
+    if 0.62 <= rate <= 0.95:
+        add(25, "Excellent speech rate - natural and engaging pace")
+    elif 0.5 <= rate < 0.62 or 0.95 < rate <= 1.1:
+        add(22, "Good speech rate - clear and understandable")
+    elif 0.38 <= rate < 0.5 or 1.1 < rate <= 1.3:
+        add(16, "Moderate speech rate - could be improved")
+    elif 0.25 <= rate < 0.38 or 1.3 < rate <= 1.5:
+        add(10, "Below average speech rate - needs improvement")
+    else:
+        add(5, "Poor speech rate - significantly needs improvement")
+    if rhythm >= 0.7:
+        add(25, "Excellent rhythm consistency - smooth flow")
+    elif rhythm >= 0.55:
+        add(22, "Good rhythm consistency - generally smooth")
+    elif rhythm >= 0.4:
+        add(16, "Moderate rhythm - some irregularity")
+    elif rhythm >= 0.25:
+        add(10, "Irregular rhythm - needs improvement")
+    else:
+        add(5, "Very irregular rhythm - significant improvement needed")
+    if pauses <= 3:
+        add(25, "Excellent pause control - minimal hesitation")
+    elif pauses <= 6:
+        add(21, "Good pause control - reasonable pauses")
+    elif pauses <= 9:
+        add(17, "Moderate pause control - some hesitation")
+    elif pauses <= 14:
+        add(12, "Frequent pauses - indicates nervousness")
+    else:
+        add(6, "Excessive pauses - significant improvement needed")
+    if 0.3 <= energy <= 0.8:
+        add(10, "Natural energy variation - engaging delivery")
+    elif 0.15 <= energy < 0.3:
+        add(7, "Good energy variation - expressive speech")
+    elif 0.8 < energy <= 1.2:
+        add(5, "High energy variation - very expressive")
+    elif energy > 1.2:
+        add(3, "Very high energy variation - overly dramatic")
+    else:
+        add(2, "Low energy variation - somewhat monotone")
+    if duration >= 40 and bursts >= 6:
+        if score >= 70:
+            add(5, "Sustained fluency over extended speech")
+        elif score >= 50:
+            add(3, "Good sustained performance")
+    elif duration >= 20 and bursts >= 4:
+        if score >= 60:
+            add(2, "Consistent performance")
+    if bursts >= 8:
+        if rhythm >= 0.5:
+            add(2, "Good speech segmentation")
+    elif bursts <= 2:
+        add(-3, "Limited speech segments - may indicate hesitation")
+    flags = sum([activity >= 0.7, 0.65 <= rate <= 0.9, rhythm >= 0.7, pauses <= 3,
+                 0.3 <= energy <= 0.8, duration >= 20.0])
+    if flags < 2:
+        score = min(score, 70)
+    elif flags < 3:
+        score = min(score, 85)
+    elif flags < 4:
+        score = min(score, 95)
+    if activity < 0.2 or bursts <= 1:
+        score = min(score, 40)
+        messages.append("Very limited speech activity detected")
+    if duration < 8:
+        score = min(score, 70)
+        messages.append("Short recording limits fluency assessment confidence")
+    return min(100, max(0, score)), messages
+
+
+def _baseline_grammar(m):
+    score, messages = 100, []
+    if 8 <= m["avg_sentence_length"] <= 25:
+        messages.append("Good sentence structure and variety")
+    elif m["avg_sentence_length"] < 8:
+        messages.append("Sentences are too short - consider combining ideas")
+        score -= 5
+    else:
+        messages.append("Sentences are quite long - consider breaking them up")
+        score -= 5
+    if m["word_count"] < 10:
+        messages.append("Text is very short - consider adding more content")
+        score -= 10
+    elif m["word_count"] > 500:
+        messages.append("Text is very long - consider breaking into sections")
+        score -= 5
+    if m["period_count"] < m["exclamation_count"] + m["question_count"]:
+        messages.append("Good use of varied punctuation")
+    else:
+        messages.append("Consider using more varied punctuation")
+    if m["starts_uppercase"] and m["period_count"] > 0:
+        messages.append("Proper sentence capitalization")
+    else:
+        messages.append("Check sentence capitalization")
+        score -= 5
+    if m["spelling_changed"]:
+        messages.append("Some spelling issues detected")
+        score -= 10
+    else:
+        messages.append("No obvious spelling issues detected")
+    return max(0, score), messages
+
+
+def _baseline_professionalism(m):
+    score, messages = 50, []
+    if m["informal_words"] == 0:
+        score += 10
+        messages.append("Excellent professional language - no filler words")
+    elif m["informal_words"] <= 5:
+        score += 5
+        messages.append("Good professional language with minimal filler words")
+    elif m["informal_words"] <= 10:
+        messages.append("Moderate use of filler words - could be more professional")
+    else:
+        score -= 5
+        messages.append("Excessive use of filler words - needs improvement")
+    if m["confident_phrases"] <= 4:
+        score += 10
+        messages.append("Confident and assertive communication style")
+    elif m["confident_phrases"] <= 8:
+        score += 5
+        messages.append("Generally confident with some hedging")
+    else:
+        score -= 3
+        messages.append("Overuse of hedging language - be more confident")
+    if m["vocabulary_richness"] >= 0.6:
+        score += 10
+        messages.append("Excellent vocabulary diversity")
+    elif m["vocabulary_richness"] >= 0.4:
+        score += 5
+        messages.append("Good vocabulary diversity")
+    else:
+        score -= 3
+        messages.append("Limited vocabulary - consider expanding word choice")
+    return min(100, max(0, score)), messages
+
+
+def _baseline_overall(fluency, grammar, professionalism):
+    return round(min(100, fluency * 0.50 + grammar * 0.30 + professionalism * 0.20), 1)
+
+
+def _baseline_overall_with_similarity(fluency, grammar, similarity):
+    return round(min(100, similarity * 0.60 + fluency * 0.20 + grammar * 0.20), 1)
+
+
+def _pick(rng, n, edges, low, high, integer=False):
+    """Values on and next to the rule thresholds, mixed with uniform draws"""
+    if integer:
+        values = rng.integers(low, high + 1, n).astype(np.float64)
+    else:
+        values = rng.uniform(low, high, n)
+    on_edge = rng.random(n) < 0.5
+    nudge = rng.choice([-1e-9, 0.0, 1e-9], n) if not integer else rng.choice([-1, 0, 1], n)
+    values[on_edge] = rng.choice(edges, on_edge.sum()) + nudge[on_edge]
+    return values
+
+
+def _random_records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    fluency = {
+        "speech_activity_ratio": _pick(rng, n, [0.2, 0.25, 0.4, 0.55, 0.7], 0.0, 1.0),
+        "speech_rate": _pick(rng, n, [0.25, 0.38, 0.5, 0.62, 0.65, 0.9, 0.95, 1.1, 1.3, 1.5], 0.0, 2.0),
+        "rhythm_consistency": _pick(rng, n, [0.25, 0.4, 0.5, 0.55, 0.7], 0.0, 1.0),
+        "pause_frequency": _pick(rng, n, [3, 6, 9, 14], 0, 20, integer=True),
+        "energy_variation": _pick(rng, n, [0.15, 0.3, 0.8, 1.2], 0.0, 1.6),
+        "duration_sec": _pick(rng, n, [8.0, 20.0, 40.0], 0.0, 90.0),
+        "speech_bursts": _pick(rng, n, [1, 2, 4, 6, 8], 0, 12, integer=True),
+    }
+    grammar = {
+        "avg_sentence_length": _pick(rng, n, [8.0, 25.0], 0.0, 40.0),
+        "word_count": _pick(rng, n, [10, 500], 0, 700, integer=True),
+        "period_count": rng.integers(0, 6, n).astype(np.float64),
+        "exclamation_count": rng.integers(0, 4, n).astype(np.float64),
+        "question_count": rng.integers(0, 4, n).astype(np.float64),
+        "starts_uppercase": rng.random(n) < 0.5,
+        "spelling_changed": rng.random(n) < 0.5,
+    }
+    professionalism = {
+        "informal_words": _pick(rng, n, [0, 5, 10], 0, 15, integer=True),
+        "confident_phrases": _pick(rng, n, [4, 8], 0, 12, integer=True),
+        "vocabulary_richness": _pick(rng, n, [0.4, 0.6], 0.0, 1.0),
+    }
+    return fluency, grammar, professionalism
+
+
+def _row(columns, i):
+    return {key: column[i].item() for key, column in columns.items()}
+
+
+def test_default_rules_reproduce_the_baseline_scoring():
+    n = 5000
+    scorers = scoring_rules.load_rules()
+    sections = dict(zip(("fluency", "grammar", "professionalism"), _random_records(n)))
+    baselines = {"fluency": _baseline_fluency, "grammar": _baseline_grammar,
+                 "professionalism": _baseline_professionalism}
+    # Without prosody metrics the intonation group does not apply, as before it existed
+    sections["fluency"]["pitch_variation"] = np.full(n, np.nan)
+    sections["fluency"]["voiced_ratio"] = np.full(n, np.nan)
+
+    expected = {}
+    for name, columns in sections.items():
+        scorer = scorers[name]
+        batch = scorer.score_batch(columns)
+        expected[name] = np.zeros(n)
+        for i in range(n):
+            record = _row(columns, i)
+            score, messages = baselines[name](record)
+            expected[name][i] = score
+            assert scorer.score(record) == (score, messages), (name, record)
+            assert batch["score"][i] == score and scorer.messages(batch, i) == messages, (name, record)
+
+    similarity = np.round(np.random.default_rng(1).uniform(0, 100, n), 1)
+    overall = scorers["overall"].score_batch(expected)
+    with_similarity = scorers["overall_with_similarity"].score_batch(dict(expected, similarity=similarity))
+    for i in range(n):
+        fluency, grammar, professionalism = (expected[k][i] for k in ("fluency", "grammar", "professionalism"))
+        components = {"fluency": fluency, "grammar": grammar, "professionalism": professionalism}
+        assert scorers["overall"].score(components) == _baseline_overall(fluency, grammar, professionalism)
+        assert overall[i] == _baseline_overall(fluency, grammar, professionalism)
+        assert scorers["overall_with_similarity"].score(dict(components, similarity=similarity[i])) == \
+            _baseline_overall_with_similarity(fluency, grammar, similarity[i])
+        assert with_similarity[i] == _baseline_overall_with_similarity(fluency, grammar, similarity[i])
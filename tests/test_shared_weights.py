@@ -0,0 +1,91 @@
+import os
+import threading
+
+import pytest
+import torch
+from whisper.model import ModelDimensions, Whisper
+
+import shared_weights
+from shared_weights import _DenseMetaBuffers, load_shared_model, shared_weights_path
+
+pytestmark = pytest.mark.skipif(not shared_weights._supports_mmap(), reason="torch cannot mmap checkpoints")
+
+DIMS = {"n_mels": 80, "n_audio_ctx": 16, "n_audio_state": 32, "n_audio_head": 2, "n_audio_layer": 2,
+        "n_vocab": 51865, "n_text_ctx": 8, "n_text_state": 32, "n_text_head": 2, "n_text_layer": 2}
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    """A small randomly initialised whisper checkpoint in whisper's own format"""
+    torch.manual_seed(0)
+    model = Whisper(ModelDimensions(**DIMS))
+    # Some parameters start as torch.empty; give every one defined values
+    with torch.no_grad():
+        for param in model.parameters():
+            param.normal_(0, 0.1)
+    path = tmp_path / "small-test.pt"
+    torch.save({"dims": DIMS, "model_state_dict": model.state_dict()}, path)
+    return str(path), model.eval()
+
+
+def _mapped_files(tensor):
+    """Files whose mapping in this process holds the tensor's data"""
+    address = tensor.untyped_storage().data_ptr()
+    files = set()
+    with open("/proc/self/maps") as maps:
+        for line in maps:
+            fields = line.split()
+            start, end = (int(x, 16) for x in fields[0].split("-"))
+            if start <= address < end and len(fields) > 5:
+                files.add(fields[5])
+    return files
+
+
+def test_shared_model_matches_the_checkpoint(checkpoint, tmp_path):
+    path, original = checkpoint
+    model = load_shared_model(path, cache_dir=str(tmp_path / "cache"))
+
+    expected = original.state_dict()
+    loaded = model.state_dict()
+    assert loaded.keys() == expected.keys()
+    for name, tensor in expected.items():
+        assert torch.equal(loaded[name], tensor), name
+    assert torch.equal(model.decoder.mask, original.decoder.mask)
+    assert model.alignment_heads.is_sparse
+    assert torch.equal(model.alignment_heads.to_dense(), original.alignment_heads.to_dense())
+    assert not any(t.is_meta for t in list(model.parameters()) + list(model.buffers()))
+    assert not any(p.requires_grad for p in model.parameters())
+
+    mel = torch.randn(1, DIMS["n_mels"], 2 * DIMS["n_audio_ctx"])
+    tokens = torch.tensor([[50258, 50259, 50359]])
+    with torch.no_grad():
+        assert torch.equal(model(mel, tokens), original(mel, tokens))
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc/self/maps")
+def test_weights_are_mapped_from_the_shared_file(checkpoint, tmp_path):
+    path, _ = checkpoint
+    cache_dir = str(tmp_path / "cache")
+    first = load_shared_model(path, cache_dir=cache_dir)
+    second = load_shared_model(path, cache_dir=cache_dir)
+
+    shared_file = os.path.realpath(shared_weights_path(path, cache_dir))
+    for model in (first, second):
+        for name, param in model.named_parameters():
+            assert shared_file in _mapped_files(param), name
+
+
+def test_meta_construction_does_not_leak_into_other_threads():
+    built = {}
+
+    def build():
+        built["linear"] = torch.nn.Linear(4, 4)
+
+    with torch.device("meta"), _DenseMetaBuffers():
+        thread = threading.Thread(target=build)
+        thread.start()
+        thread.join()
+        local = torch.nn.Linear(4, 4)
+    assert local.weight.is_meta
+    assert not built["linear"].weight.is_meta
+    assert not torch.nn.Linear(4, 4).weight.is_meta
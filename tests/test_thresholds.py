@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from audio_analysis import _audio_to_mono_float32, _frame_energy, _smooth_energy
+from thresholds import (
+    THRESHOLD_CONFIG, EnergyHistogram, adaptive_thresholds, energy_thresholds, global_thresholds, quantiles,
+)
+
+SAMPLE_RATE = 16000
+FRAMES_PER_SEC = 100.0
+
+
+def _speech_like(duration_sec, seed, noise=200.0):
+    """Bursts of a loud tone over background noise, in the int16 range"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_sec * SAMPLE_RATE)) / SAMPLE_RATE
+    bursts = np.sin(2 * np.pi * rng.uniform(1.5, 3.0) * t) > 0.2
+    voice = 8000 * np.sin(2 * np.pi * 180 * t) * bursts
+    return np.clip(voice + rng.normal(0, noise, t.size), -32768, 32767)
+
+
+def _baseline_energy(audio):
+    """The energy contour the fluency analysis computed before the buffer rewrite"""
+    samples = np.array(audio.get_array_of_samples())
+    if audio.channels == 2:
+        samples = np.mean(samples.reshape((-1, 2)), axis=1)
+    samples = samples.astype(np.float32)
+    samples = samples / float(np.max(np.abs(samples)))
+    frame_length, hop_length = int(0.025 * audio.frame_rate), int(0.010 * audio.frame_rate)
+    energy = np.array([float(np.sqrt(np.mean(samples[i:i + frame_length] ** 2)))
+                       for i in range(0, max(0, len(samples) - frame_length), hop_length)], dtype=np.float32)
+    return np.convolve(energy, np.ones(5, dtype=np.float32) / 5.0, mode='same')
+
+
+def _baseline_thresholds(energy):
+    return max(np.percentile(energy, 30), float(np.mean(energy)) * 0.6), np.percentile(energy, 15)
+
+
+def _current_energy(audio):
+    samples = _audio_to_mono_float32(audio)
+    energy, _ = _frame_energy(samples, audio.frame_rate)
+    energy /= max(float(samples.max()), -float(samples.min()))
+    return _smooth_energy(energy)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64, np.int16])
+def test_quantiles_equal_scalar_np_percentile(dtype):
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        values = rng.gamma(2.0, 1000.0, rng.integers(1, 300)).astype(dtype)
+        percentiles = [0.0, 100.0] + [float(p) for p in rng.uniform(0, 100, 4)]
+        for result, percentile in zip(quantiles(values, percentiles), percentiles):
+            expected = np.percentile(values, percentile)
+            assert result == expected and result.dtype == expected.dtype
+
+
+def test_quantiles_of_float32_are_within_an_ulp_of_float64_percentiles():
+    # An array of percentiles makes np.percentile interpolate float32 input in float64
+    values = np.random.default_rng(1).gamma(2.0, 0.05, 1001).astype(np.float32)
+    percentiles = np.linspace(0, 100, 37)
+    result = quantiles(values, percentiles)
+    assert result.dtype == np.float32
+    np.testing.assert_array_max_ulp(result, np.percentile(values, percentiles).astype(np.float32), maxulp=1)
+
+
+@pytest.mark.parametrize("channels", [1, 2])
+def test_default_thresholds_equal_the_baseline(channels):
+    signal = np.stack([_speech_like(20.0, seed=c) for c in range(channels)], axis=1)
+    audio = AudioSegment(signal.astype(np.int16).tobytes(), frame_rate=SAMPLE_RATE,
+                         sample_width=2, channels=channels)
+    energy = _baseline_energy(audio)
+    assert global_thresholds(energy) == _baseline_thresholds(energy)
+    # The contour itself is now computed in place; it agrees to float32 rounding
+    current = _current_energy(audio)
+    np.testing.assert_allclose(current, energy, rtol=1e-5, atol=1e-7)
+    np.testing.assert_allclose(energy_thresholds(current, FRAMES_PER_SEC), _baseline_thresholds(energy), rtol=1e-5)
+
+
+def test_histogram_adds_and_removes_values():
+    rng = np.random.default_rng(1)
+    values = rng.uniform(0, 1, 5000)
+    histogram = EnergyHistogram(0.0, 1.0, bins=1000)
+    histogram.update(values)
+    histogram.update(values[:2000], -1)
+    assert histogram.total == 3000
+    assert histogram.mean() == pytest.approx(values[2000:].mean())
+    for percentile in (5, 15, 30, 50, 95):
+        assert histogram.quantile(percentile) == pytest.approx(np.percentile(values[2000:], percentile), abs=2e-3)
+    histogram.update(values[2000:], -1)
+    assert not histogram.counts.any() and histogram.total == 0
+
+
+def test_sliding_thresholds_follow_each_window():
+    rng = np.random.default_rng(2)
+    # The noise floor rises tenfold halfway through
+    energy = np.concatenate([rng.gamma(2.0, 0.01, 3000), rng.gamma(2.0, 0.1, 3000)])
+    window, hop = 1000, 100
+    speech, silence = adaptive_thresholds(energy, window, hop)
+
+    bin_width = energy.max() / THRESHOLD_CONFIG["histogram_bins"]
+    for start in range(0, energy.size, hop):
+        lo = max(0, min(start + hop // 2 - window // 2, energy.size - window))
+        frames = energy[lo:lo + window]
+        expected_silence = np.percentile(frames, THRESHOLD_CONFIG["silence_percentile"])
+        expected_speech = max(np.percentile(frames, THRESHOLD_CONFIG["speech_percentile"]),
+                              frames.mean() * THRESHOLD_CONFIG["speech_mean_factor"])
+        np.testing.assert_allclose(silence[start:start + hop], expected_silence, atol=2 * bin_width)
+        np.testing.assert_allclose(speech[start:start + hop], expected_speech, atol=2 * bin_width)
+    # Away from the change, each half is segmented against its own level
+    assert silence[:2000].max() < 0.5 * silence[4000:].min()
+
+
+def test_sliding_thresholds_are_used_only_when_enabled(monkeypatch):
+    energy = np.random.default_rng(3).gamma(2.0, 0.05, 6000)
+    assert energy_thresholds(energy, FRAMES_PER_SEC) == global_thresholds(energy)
+
+    monkeypatch.setitem(THRESHOLD_CONFIG, "adaptive_window_sec", 10.0)
+    speech, silence = energy_thresholds(energy, FRAMES_PER_SEC)
+    assert speech.shape == silence.shape == energy.shape
+    # Shorter than two windows: one threshold pair for the whole recording
+    assert energy_thresholds(energy[:1500], FRAMES_PER_SEC) == global_thresholds(energy[:1500])
@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+
+import numpy as np
+
+import audio_analysis
+from audio_analysis import TRANSCRIPTION_CONFIG, _select_upgrade_spans, _transcribe_tiered
+
+SAMPLE_RATE = 16000
+
+
+def _seg(start, end, text, avg_logprob=-0.2, no_speech_prob=0.1):
+    return {"start": start, "end": end, "text": text,
+            "avg_logprob": avg_logprob, "no_speech_prob": no_speech_prob}
+
+
+class _StubModel:
+    """Records the clips it is asked to transcribe and returns a canned result"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def transcribe(self, audio, **kwargs):
+        self.calls.append((audio, kwargs))
+        return self.result(audio, kwargs) if callable(self.result) else self.result
+
+
+class _StubManager:
+    def __init__(self, models):
+        self.models = models
+        self.checked_out = []
+
+    @contextmanager
+    def using(self, name, device):
+        self.checked_out.append(name)
+        yield self.models[name]
+
+
+def _install(monkeypatch, base_result, upgrade_result=None, upgrade_model="small"):
+    base = _StubModel(base_result)
+    upgrade = _StubModel(upgrade_result or {"text": " UPGRADED"})
+    manager = _StubManager({"tiny": base, "small": upgrade})
+    monkeypatch.setattr(audio_analysis, "MODEL_MANAGER", manager)
+    monkeypatch.setitem(TRANSCRIPTION_CONFIG, "backend", "whisper")
+    monkeypatch.setitem(TRANSCRIPTION_CONFIG, "base_model", "tiny")
+    monkeypatch.setitem(TRANSCRIPTION_CONFIG, "upgrade_model", upgrade_model)
+    monkeypatch.setitem(TRANSCRIPTION_CONFIG, "min_avg_logprob", -1.0)
+    monkeypatch.setitem(TRANSCRIPTION_CONFIG, "max_no_speech_prob", 0.6)
+    return manager, base, upgrade
+
+
+def test_spans_select_low_logprob_and_likely_silence():
+    segments = [
+        _seg(0, 1, " a"),
+        _seg(1, 2, " b", avg_logprob=-1.5),
+        _seg(2, 3, " c"),
+        _seg(3, 4, " d", no_speech_prob=0.9),
+    ]
+    assert _select_upgrade_spans(segments, -1.0, 0.6) == [[1, 1], [3, 3]]
+
+
+def test_consecutive_unsure_segments_are_merged_into_one_span():
+    segments = [
+        _seg(0, 1, " a", avg_logprob=-1.2),
+        _seg(1, 2, " b", avg_logprob=-1.4),
+        _seg(2, 3, " c", no_speech_prob=0.7),
+        _seg(3, 4, " d"),
+        _seg(4, 5, " e", avg_logprob=-2.0),
+    ]
+    assert _select_upgrade_spans(segments, -1.0, 0.6) == [[0, 2], [4, 4]]
+
+
+def test_thresholds_are_strict():
+    segments = [_seg(0, 1, " a", avg_logprob=-1.0, no_speech_prob=0.6)]
+    assert _select_upgrade_spans(segments, -1.0, 0.6) == []
+
+
+def test_confident_transcript_is_not_upgraded(monkeypatch):
+    result = {"text": " a b", "language": "en",
+              "segments": [_seg(0, 1, " a"), _seg(1, 2, " b")]}
+    manager, _, upgrade = _install(monkeypatch, result)
+
+    assert _transcribe_tiered(np.zeros(2 * SAMPLE_RATE, dtype=np.float32), "cpu", False) == " a b"
+    assert manager.checked_out == ["tiny"]
+    assert upgrade.calls == []
+
+
+def test_tiering_is_off_without_an_upgrade_model(monkeypatch):
+    result = {"text": " a b", "language": "en",
+              "segments": [_seg(0, 1, " a", avg_logprob=-3.0), _seg(1, 2, " b")]}
+    manager, _, upgrade = _install(monkeypatch, result, upgrade_model="")
+
+    assert _transcribe_tiered(np.zeros(2 * SAMPLE_RATE, dtype=np.float32), "cpu", False) == " a b"
+    assert manager.checked_out == ["tiny"]
+    assert upgrade.calls == []
+
+
+def test_merged_span_is_retranscribed_once_with_the_preceding_text_as_prompt(monkeypatch):
+    audio = np.arange(4 * SAMPLE_RATE, dtype=np.float32)
+    result = {"text": " a b c d", "language": "en", "segments": [
+        _seg(0, 1, " a"),
+        _seg(1, 2, " b", avg_logprob=-1.5),
+        _seg(2, 3, " c", avg_logprob=-1.5),
+        _seg(3, 4, " d"),
+    ]}
+    _, _, upgrade = _install(monkeypatch, result, {"text": " B C"})
+
+    assert _transcribe_tiered(audio, "cpu", False) == " a B C d"
+    assert len(upgrade.calls) == 1
+    clip, kwargs = upgrade.calls[0]
+    # The clip runs from the first unsure segment's start to the last one's end
+    np.testing.assert_array_equal(clip, audio[SAMPLE_RATE:3 * SAMPLE_RATE])
+    assert kwargs["initial_prompt"] == " a"
+    assert kwargs["language"] == "en"
+
+
+def test_separate_spans_are_each_retranscribed(monkeypatch):
+    audio = np.zeros(3 * SAMPLE_RATE, dtype=np.float32)
+    result = {"text": " a b c", "language": "en", "segments": [
+        _seg(0, 1, " a", avg_logprob=-1.5),
+        _seg(1, 2, " b"),
+        _seg(2, 3, " c", no_speech_prob=0.9),
+    ]}
+    texts = iter([" A", " C"])
+    _, _, upgrade = _install(monkeypatch, result, lambda clip, kwargs: {"text": next(texts)})
+
+    assert _transcribe_tiered(audio, "cpu", False) == " A b C"
+    # The first span has no preceding text to condition on
+    assert [kwargs["initial_prompt"] for _, kwargs in upgrade.calls] == [None, " A b"]
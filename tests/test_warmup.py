@@ -0,0 +1,36 @@
+import pytest
+
+import warmup
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(warmup, "_state", {"status": "pending", "started_at": None, "finished_at": None,
+                                           "steps": {}, "error": None, "attempts": 0})
+    monkeypatch.setattr(warmup, "_warm_pipeline", lambda: None)
+    monkeypatch.setattr(warmup, "_warm_text", lambda: None)
+    monkeypatch.setitem(warmup.WARMUP_CONFIG, "retry_sec", 0.0)
+
+
+def test_warmup_fails_when_the_base_model_is_not_resident(monkeypatch):
+    monkeypatch.setitem(warmup.TRANSCRIPTION_CONFIG, "backend", "whisper")
+    # Each stage worker reports which models it holds; one of them has none
+    monkeypatch.setattr(warmup, "_per_worker", lambda fn: [[(warmup.TRANSCRIPTION_CONFIG["base_model"], "cpu")], []])
+    assert not warmup.run_warmup()
+    state = warmup.readiness()
+    assert state["status"] == "failed" and "not resident" in state["error"]
+    assert not warmup.is_ready()
+
+
+def test_failed_warmup_is_retried_until_ready(monkeypatch):
+    outcomes = [RuntimeError("model download failed"), None]
+
+    def warm_models():
+        outcome = outcomes.pop(0)
+        if outcome:
+            raise outcome
+
+    monkeypatch.setattr(warmup, "_warm_models", warm_models)
+    warmup._warmup_until_ready()
+    state = warmup.readiness()
+    assert state["status"] == "ready" and state["attempts"] == 2 and state["error"] is None
@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+
+# Energy thresholds for speech/pause segmentation. Speech frames are louder than
+# max(30th percentile, 0.6 * mean energy); pause frames are below the 15th percentile.
+# With adaptive_window_sec set, the thresholds are estimated over a window sliding
+# along the recording, so long recordings whose background noise changes are still
+# segmented correctly. 0 keeps one threshold pair for the whole recording.
+THRESHOLD_CONFIG = {
+    "speech_percentile": 30.0,
+    "speech_mean_factor": 0.6,
+    "silence_percentile": 15.0,
+    "adaptive_window_sec": float(os.environ.get("ADAPTIVE_THRESHOLD_WINDOW_SEC", "0")),
+    "adaptive_hop_sec": 1.0,
+    "histogram_bins": 1024,
+}
+
+
+def quantiles(values, percentiles):
+    """np.percentile (linear method) for several percentiles from one partition pass
+
+    Each result equals np.percentile(values, p) for a scalar p, which keeps float32
+    input in float32. np.percentile with an array of percentiles promotes the result
+    to float64 (numpy >= 2) and so can differ from these by a float32 ULP.
+    """
+    values = np.asarray(values)
+    n = values.size
+    positions = (n - 1) * (np.asarray(percentiles, dtype=np.float64) / 100.0)
+    below = np.floor(positions).astype(np.intp)
+    above = np.minimum(below + 1, n - 1)
+    partitioned = np.partition(values.ravel(), np.unique(np.concatenate([below, above])))
+    dtype = values.dtype if values.dtype.kind == "f" else np.float64
+    low = partitioned[below].astype(dtype)
+    high = partitioned[above].astype(dtype)
+    # numpy's interpolation in the input precision, as the scalar np.percentile calls did
+    t = positions - below
+    diff = high - low
+    return np.where(t >= 0.5, high - diff * (1 - t).astype(dtype), low + diff * t.astype(dtype))
+
+
+def global_thresholds(energy):
+    """(speech_threshold, silence_threshold) for the whole energy contour"""
+    silence, speech = quantiles(energy, [THRESHOLD_CONFIG["silence_percentile"],
+                                         THRESHOLD_CONFIG["speech_percentile"]])
+    speech = max(speech, float(np.mean(energy)) * THRESHOLD_CONFIG["speech_mean_factor"])
+    return speech, silence
+
+
+class EnergyHistogram:
+    """Fixed-bin histogram of values in [low, high] with streaming quantiles and mean
+
+    Values are added with update() and removed with update(values, -1), so a window
+    sliding over a signal only pays for the frames entering and leaving it.
+    Quantiles are interpolated within a bin, i.e. exact to (high - low) / bins.
+    """
+
+    def __init__(self, low=0.0, high=1.0, bins=None):
+        self.low = float(low)
+        self.bins = bins or THRESHOLD_CONFIG["histogram_bins"]
+        self.width = (float(high) - self.low) / self.bins if high > low else 1.0
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+
+    def _bin(self, values):
+        return np.clip(((values - self.low) / self.width).astype(np.intp), 0, self.bins - 1)
+
+    def update(self, values, sign=1):
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return
+        self.counts += sign * np.bincount(self._bin(values), minlength=self.bins)
+        self.total += sign * values.size
+        self.sum += sign * float(values.sum())
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    def quantile(self, percentile):
+        if self.total == 0:
+            return self.low
+        rank = percentile / 100.0 * (self.total - 1)
+        cumulative = np.cumsum(self.counts)
+        b = int(np.searchsorted(cumulative, rank, side="right"))
+        before = cumulative[b - 1] if b > 0 else 0
+        fraction = (rank - before + 0.5) / self.counts[b]
+        return self.low + (b + min(1.0, fraction)) * self.width
+
+
+def adaptive_thresholds(energy, window_frames, hop_frames):
+    """Per-frame (speech_threshold, silence_threshold) arrays from a sliding window
+
+    Each hop of frames gets the thresholds of the window centred on it. The window's
+    histogram is updated incrementally as it slides, so the whole contour is read once
+    on the way in and once on the way out.
+    """
+    n = energy.size
+    speech = np.empty(n, dtype=np.float64)
+    silence = np.empty(n, dtype=np.float64)
+    histogram = EnergyHistogram(0.0, float(energy.max()))
+    window_lo = window_hi = 0
+    for start in range(0, n, hop_frames):
+        center = start + min(hop_frames, n - start) // 2
+        lo = max(0, min(center - window_frames // 2, n - window_frames))
+        hi = min(n, lo + window_frames)
+        # Window bounds only move forward: add the frames entering, drop those leaving
+        histogram.update(energy[window_hi:hi])
+        histogram.update(energy[window_lo:lo], -1)
+        window_lo, window_hi = lo, hi
+        end = start + hop_frames
+        speech[start:end] = max(histogram.quantile(THRESHOLD_CONFIG["speech_percentile"]),
+                                histogram.mean() * THRESHOLD_CONFIG["speech_mean_factor"])
+        silence[start:end] = histogram.quantile(THRESHOLD_CONFIG["silence_percentile"])
+    return speech, silence
+
+
+def energy_thresholds(energy, frames_per_sec):
+    """Speech and silence thresholds for an energy contour; scalars or per-frame arrays
+
+    Recordings shorter than two adaptive windows (or with adaptive thresholds off)
+    use one pair of thresholds for the whole recording.
+    """
+    window_frames = int(THRESHOLD_CONFIG["adaptive_window_sec"] * frames_per_sec)
+    if window_frames <= 0 or energy.size < 2 * window_frames:
+        return global_thresholds(energy)
+    hop_frames = max(1, int(THRESHOLD_CONFIG["adaptive_hop_sec"] * frames_per_sec))
+    return adaptive_thresholds(energy, window_frames, hop_frames)
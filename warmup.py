@@ -0,0 +1,129 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_analysis import (
+    TRANSCRIPTION_CONFIG, analyze_audio, analyze_grammar_advanced, analyze_professionalism, load_models
+)
+from response_format import message_table
+from stage_runner import STAGE_CONFIG, is_server_process, run_stage
+from synthetic_audio import synth_speech_wav
+
+# Boot warm-up: load the whisper models in every stage worker (failing if they do not
+# load), run a short synthetic clip through the full pipeline and prime TextBlob's
+# spelling model and tokenizers, so the first real request does not pay for them.
+# /ready reports 503 until this has finished; a failed warm-up is retried every
+# retry_sec. /health stays a plain liveness check.
+WARMUP_CONFIG = {
+    "enabled": os.environ.get("WARMUP_ON_BOOT", "1") == "1",
+    "clip_sec": float(os.environ.get("WARMUP_CLIP_SEC", "3")),
+    "retry_sec": float(os.environ.get("WARMUP_RETRY_SEC", "30")),
+}
+_WARMUP_TEXT = (
+    "Thank you for the question. I believe our team delivered the project on time, "
+    "and I learned a great deal about planning."
+)
+
+_state = {"status": "pending", "started_at": None, "finished_at": None, "steps": {}, "error": None,
+          "attempts": 0}
+_state_lock = threading.Lock()
+_thread = None
+
+
+def _timed(name, fn):
+    start = time.perf_counter()
+    fn()
+    with _state_lock:
+        _state["steps"][name] = round(time.perf_counter() - start, 3)
+
+
+def _per_worker(fn):
+    """Run fn once per stage worker, concurrently so that each run lands on its own worker"""
+    runs = STAGE_CONFIG["workers"] if STAGE_CONFIG["isolate"] else 1
+    with ThreadPoolExecutor(max_workers=runs) as executor:
+        return list(executor.map(lambda _: fn(), range(runs)))
+
+
+def _warm_models():
+    # Transcription swallows model errors, so check the models directly
+    residents = _per_worker(lambda: run_stage("transcribe", load_models))
+    if TRANSCRIPTION_CONFIG["backend"] != "whisper":
+        return
+    base = TRANSCRIPTION_CONFIG["base_model"]
+    for resident in residents:
+        if not any(name == base for name, _ in resident):
+            raise RuntimeError(f"whisper '{base}' model is not resident after warm-up")
+
+
+def _warm_pipeline():
+    fd, clip_path = tempfile.mkstemp(prefix="warmup_", suffix=".wav")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(synth_speech_wav(WARMUP_CONFIG["clip_sec"]))
+        _per_worker(lambda: analyze_audio(clip_path))
+    finally:
+        os.remove(clip_path)
+
+
+def _warm_text():
+    analyze_grammar_advanced(_WARMUP_TEXT)
+    analyze_professionalism(_WARMUP_TEXT)
+    message_table()
+
+
+def run_warmup():
+    """Warm the pipeline once in this thread; records progress for readiness(), returns success"""
+    with _state_lock:
+        _state["attempts"] += 1
+        _state.update(status="warming", started_at=time.time(), finished_at=None, steps={}, error=None)
+    print(f"Warm-up started (attempt {_state['attempts']})")
+    try:
+        _timed("models", _warm_models)
+        _timed("pipeline", _warm_pipeline)
+        _timed("text", _warm_text)
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        with _state_lock:
+            _state.update(status="failed", finished_at=time.time(), error=f"{type(e).__name__}: {e}")
+        return False
+    with _state_lock:
+        _state.update(status="ready", finished_at=time.time())
+    print(f"Warm-up finished: {_state['steps']}")
+    return True
+
+
+def _warmup_until_ready():
+    while not run_warmup():
+        print(f"Retrying warm-up in {WARMUP_CONFIG['retry_sec']:.0f}s")
+        time.sleep(WARMUP_CONFIG["retry_sec"])
+
+
+def start_warmup():
+    """Start the warm-up thread once; with warm-up disabled the app is ready immediately
+
+    Only the server process warms up: spawned stage and long-file workers re-import the
+    app's main module, and must not start warm-ups (and workers) of their own.
+    """
+    global _thread
+    if not is_server_process():
+        return
+    with _state_lock:
+        if _thread is not None or _state["status"] != "pending":
+            return
+        if not WARMUP_CONFIG["enabled"]:
+            _state.update(status="ready", finished_at=time.time())
+            return
+        _thread = threading.Thread(target=_warmup_until_ready, name="warmup", daemon=True)
+    _thread.start()
+
+
+def readiness():
+    """Copy of the warm-up state: status is pending, warming, ready or failed (retrying)"""
+    with _state_lock:
+        return dict(_state, steps=dict(_state["steps"]))
+
+
+def is_ready():
+    return _state["status"] == "ready"